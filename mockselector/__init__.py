@@ -1,10 +1,13 @@
 #  Copyright (c) 2020 SBA - MIT License
 
-from .selector import MockSelector, MockSocket, ListenSocket
+from .selector import MockSelector, MockSocket, ListenSocket, FastSocket, \
+    VirtualClock, At, Burst, FdAllocator, SendWindow
+from .datagram import MockDatagramSocket
 try:
     from .version import version as __version__
 except ImportError:
     # be conservative if version.py could not be generated
     # as it might happen on some CI platforms...
     __version__ = '0.0.0'
-__all__ = [MockSocket, MockSelector, ListenSocket]
+__all__ = [MockSocket, MockSelector, ListenSocket, FastSocket, VirtualClock,
+           At, Burst, FdAllocator, SendWindow, MockDatagramSocket]
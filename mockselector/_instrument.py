@@ -0,0 +1,130 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+""" Instrumentation helpers shared by Metrics, Profiler and FaultInjector.
+
+They instrument the objects appearing in the events of a selector: the
+receive buffer of a socket is wrapped, and the send and accept methods
+are replaced, keeping the call records of a Mock.
+"""
+
+import weakref
+from typing import Callable, Tuple
+from unittest.mock import DEFAULT, Mock
+
+
+class RecvBufferWrapper:
+    """ Base wrapper of the receive buffer of a socket.
+
+    Every receive call first calls before_recv, and returns an end of
+    stream if it returns True, else calls the wrapped buffer and gives the
+    number of received bytes to after_recv.
+    """
+    __slots__ = ('rbuf',)
+
+    def __init__(self, rbuf):
+        self.rbuf = rbuf
+
+    def before_recv(self) -> bool:
+        return False
+
+    def after_recv(self, nbytes: int):
+        pass
+
+    def ready(self) -> bool:
+        return self.rbuf.ready()
+
+    @property
+    def remain(self) -> bytes:
+        return self.rbuf.remain
+
+    def recv(self, size, flags=0):
+        if self.before_recv():
+            return b''
+        data = self.rbuf.recv(size, flags)
+        self.after_recv(len(data))
+        return data
+
+    def recv_into(self, buffer, nbytes=0, flags=0):
+        if self.before_recv():
+            return 0
+        n = self.rbuf.recv_into(buffer, nbytes, flags)
+        self.after_recv(n)
+        return n
+
+    def recvmsg(self, bufsize, ancbufsize=0, flags=0):
+        if self.before_recv():
+            return b'', [], 0, None
+        res = self.rbuf.recvmsg(bufsize, ancbufsize, flags)
+        self.after_recv(len(res[0]))
+        return res
+
+    def recvmsg_into(self, buffers, ancbufsize=0, flags=0):
+        if self.before_recv():
+            return 0, [], 0, None
+        res = self.rbuf.recvmsg_into(buffers, ancbufsize, flags)
+        self.after_recv(res[0])
+        return res
+
+
+class ObjectTable:
+    """ Values attached to the objects of a selector, by fd.
+
+    The objects are weakly referenced when possible, so that a value is
+    only found for the object it was set for, and not for a later object
+    reusing its fd.
+    """
+
+    def __init__(self):
+        self._entries = {}      # fd -> (reference to the object, value)
+
+    def get(self, fd: int, obj):
+        """ Returns the value of an object, or None """
+        entry = self._entries.get(fd)
+        if entry is not None and entry[0]() is obj:
+            return entry[1]
+        return None
+
+    def set(self, fd: int, obj, value):
+        try:
+            ref = weakref.ref(obj)
+        except TypeError:
+            ref = (lambda o: lambda: o)(obj)
+        self._entries[fd] = (ref, value)
+
+
+def resolve(selector, fileobj) -> Tuple[int, object]:
+    """ Returns the fd and the object of a file object or fd
+
+    The object of a fd is searched in the fds of the selector, and is None
+    if it is unknown.
+    """
+    if isinstance(fileobj, int):
+        obj = selector.fds.get(fileobj) if selector is not None else None
+        return fileobj, obj
+    return fileobj.fileno(), fileobj
+
+
+def wrap_method(obj, name: str, wrapper: Callable):
+    """ Replaces a method of an object by a wrapper.
+
+    The wrapper receives a function calling the original method, followed
+    by the arguments of the call. The method of a Mock keeps recording
+    its calls: its side effect is wrapped instead, a missing side effect
+    being a call returning DEFAULT.
+    """
+    method = getattr(obj, name)
+    call = method
+    if isinstance(method, Mock):
+        call = _default if method.side_effect is None else method.side_effect
+
+    def wrapped(*args):
+        return wrapper(call, *args)
+
+    if isinstance(method, Mock):
+        method.side_effect = wrapped
+    else:
+        setattr(obj, name, wrapped)
+
+
+def _default(*args):
+    return DEFAULT
@@ -0,0 +1,87 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+import asyncio
+from typing import Optional
+
+from .selector import MockSelector
+
+try:
+    _all_tasks = asyncio.all_tasks
+except AttributeError:      # Python < 3.7
+    _all_tasks = asyncio.Task.all_tasks
+
+
+class MockEventLoop(asyncio.SelectorEventLoop):
+    """ asyncio SelectorEventLoop driven by a MockSelector.
+
+    The selector is switched to skip_polls mode, so that its events are
+    only consumed when the loop has nothing else to do. When the events are
+    exhausted, the MockSelector.EndException is raised out of the loop,
+    which allows to use the selector as a context manager around
+    run_until_complete.
+
+    asyncio normally creates a socket pair to be woken up from other
+    threads. A MockEventLoop does not, so that no real socket is ever
+    used: call_soon_threadsafe is thus of no use with it.
+
+    The time of the loop is the virtual time of the selector clock, so
+    that timers are run at full speed when the selector simulates timeouts.
+
+    The mock sockets are used in non blocking mode: a ListenSocket raises
+    a BlockingIOError when no connection is pending, which ends the accept
+    loop of asyncio servers.
+    """
+
+    def __init__(self, selector: Optional[MockSelector] = None):
+        """
+        :param selector: the MockSelector driving the loop (a new one with
+         no events by default)
+        :type selector: MockSelector
+        """
+        if selector is None:
+            selector = MockSelector()
+        selector.skip_polls = True
+        super().__init__(selector)
+
+    def time(self) -> float:
+        return self._selector.clock.now
+
+    # The self pipe methods are private to asyncio.BaseSelectorEventLoop:
+    # they and the use of _ssock and _csock (None meaning no self pipe in
+    # _write_to_self) were checked against the asyncio of Python 3.6 to
+    # 3.13.
+    def _make_self_pipe(self):
+        self._ssock = self._csock = None
+
+    def _close_self_pipe(self):
+        pass
+
+
+def run(main, selector: Optional[MockSelector] = None):
+    """ Runs a coroutine in a new MockEventLoop, much like asyncio.run.
+
+    The end of the events of the selector ends the execution: the
+    remaining tasks are then cancelled and the loop is closed.
+
+    :param main: the coroutine to run
+    :param selector: the MockSelector driving the loop
+    :return: the result of the coroutine or None if the events were
+     exhausted before its end
+    """
+    if selector is None:
+        selector = MockSelector()
+    loop = MockEventLoop(selector)
+    try:
+        with selector:
+            return loop.run_until_complete(main)
+    finally:
+        try:
+            tasks = {task for task in _all_tasks(loop) if not task.done()}
+            if tasks:
+                for task in tasks:
+                    task.cancel()
+                with selector:
+                    loop.run_until_complete(
+                        asyncio.gather(*tasks, return_exceptions=True))
+        finally:
+            loop.close()
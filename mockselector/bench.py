@@ -0,0 +1,248 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+""" Benchmark of servers running under MockSelector.
+
+Usage: python -m mockselector.bench [options]
+
+A server loop is run against scripted workloads combining several numbers
+of clients, message sizes and event batch sizes. For each workload, the
+number of events and bytes processed per second are reported, along with
+the overhead of mockselector itself, measured by running the same
+workload through a minimal loop. The results can be saved in a JSON file
+and compared with a previous run.
+"""
+
+import argparse
+import functools
+import importlib
+import itertools
+import json
+import platform
+import sys
+import time
+from selectors import EVENT_READ
+from typing import Callable, List, Optional
+
+from . import __version__
+from .policies import MaxBatch
+from .selector import FastSocket, FdAllocator, ListenSocket, MockSelector
+
+
+def echo_server(s, sel):
+    """ Reference server loop, close to the one of tests/miniserv.py """
+    s.bind(('0.0.0.0', 8888))
+    s.listen()
+    sel.register(s, EVENT_READ)
+    while True:
+        for key, event in sel.select():
+            if key.fileobj == s:
+                c, _ = s.accept()
+                sel.register(c, EVENT_READ)
+            else:
+                c = key.fileobj
+                data = c.recv(1024)
+                if len(data) == 0:
+                    sel.unregister(c)
+                    c.close()
+                else:
+                    c.send(data)
+
+
+def null_server(s, sel):
+    """ Minimal loop only calling the mock objects, to measure overhead """
+    s.bind(('0.0.0.0', 8888))
+    s.listen()
+    sel.register(s, EVENT_READ)
+    register, select, accept = sel.register, sel.select, s.accept
+    while True:
+        for key, event in select():
+            c = key.fileobj
+            if c is s:
+                register(accept()[0], EVENT_READ)
+            else:
+                c.recv(1024)
+
+
+def workload(clients: int, size: int, batch: int, messages: int,
+             lock=None):
+    """ Builds the objects of a scripted workload.
+
+    Each client connects, sends messages byte strings of size bytes, one
+    per event, and closes its connection. Once all the clients are
+    connected, the read events are grouped by batch clients per select.
+    The optional lock is given to the selector.
+
+    :return: the listening socket, the selector, the client sockets, and
+     the number of (key, event) pairs that the selector will return
+    """
+    payload = b'x' * size
+    socks = [FastSocket([payload] * messages) for _ in range(clients)]
+    s = ListenSocket(socks)
+    events = [s] * clients
+    reads = itertools.chain.from_iterable(
+        itertools.repeat(socks, messages + 1))   # + 1 for the end of stream
+    while True:
+        group = tuple(itertools.islice(reads, batch))
+        if not group:
+            break
+        events.append(group)
+    return (s, MockSelector(events, lock=lock), socks,
+            clients * (messages + 2))
+
+
+def run_once(server: Callable, clients: int, size: int, batch: int,
+             messages: int) -> float:
+    """ Runs one workload and returns the elapsed time """
+    s, sel, _socks, _events = workload(clients, size, batch, messages)
+    start = time.perf_counter()
+    with sel:
+        server(s, sel)
+    return time.perf_counter() - start
+
+
+def bench(server: Callable, clients: List[int], sizes: List[int],
+          batches: List[int], messages: int = 10, repeat: int = 3) -> dict:
+    """ Runs all the workloads and returns the results as a dict """
+    results = []
+    for n, size, batch in itertools.product(clients, sizes, batches):
+        nb_events = n * (messages + 2)
+        nb_bytes = n * messages * size
+        elapsed = min(run_once(server, n, size, batch, messages)
+                      for _ in range(repeat))
+        overhead = min(run_once(null_server, n, size, batch, messages)
+                       for _ in range(repeat))
+        results.append({
+            'clients': n,
+            'size': size,
+            'batch': batch,
+            'events': nb_events,
+            'bytes': nb_bytes,
+            'seconds': elapsed,
+            'events_per_sec': nb_events / elapsed,
+            'bytes_per_sec': nb_bytes / elapsed,
+            'overhead_ns_per_event': overhead / nb_events * 1e9,
+        })
+    return {
+        'mockselector': __version__,
+        'python': platform.python_version(),
+        'server': '{}.{}'.format(server.__module__, server.__qualname__),
+        'messages': messages,
+        'results': results,
+    }
+
+
+def storm(server: Callable, connections: int = 10000, burst: int = 1000,
+          size: int = 64, limit: Optional[int] = None) -> dict:
+    """ Runs a connection storm in automatic mode.
+
+    The connections arrive by bursts of burst connections, each one
+    sending size bytes and closing, and are queued in the backlog that
+    the server gives to listen. They are created by the accept calls, with
+    fds taken from an FdAllocator allowing at most limit open fds, so
+    that the recovery of a server from EMFILE errors can be measured: it
+    is expected to stop accepting when it gets one, and to accept again
+    once it has closed some connections.
+
+    :return: the results as a dict
+    """
+    fds = FdAllocator(limit=None if limit is None else limit + 10)
+    client = functools.partial(FastSocket, [b'x' * size], fds=fds)
+    s = ListenSocket([[client] * min(burst, connections - i)
+                      for i in range(0, connections, burst)], fds=fds)
+    sel = MockSelector(policy=MaxBatch(), fds=fds)
+    start = time.perf_counter()
+    with sel:
+        server(s, sel)
+    elapsed = time.perf_counter() - start
+    return {
+        'connections': connections,
+        'burst': burst,
+        'backlog': s.backlog,
+        'accepted': s.current,
+        'dropped': s.dropped,
+        'peak': s.peak,
+        'errors': s.errors,
+        'seconds': elapsed,
+        'accepts_per_sec': s.current / elapsed,
+    }
+
+
+def compare(current: dict, previous: dict) -> List[str]:
+    """ Compares the events per second with a previous run.
+
+    :return: one line per workload found in both runs
+    """
+    def key(r):
+        return r['clients'], r['size'], r['batch']
+    old = {key(r): r for r in previous['results']}
+    lines = []
+    for r in current['results']:
+        o = old.get(key(r))
+        if o is not None:
+            lines.append('clients={} size={} batch={}: {:+.1f}% events/s'
+                         .format(*key(r), (r['events_per_sec']
+                                           / o['events_per_sec'] - 1) * 100))
+    return lines
+
+
+def load_server(name: str) -> Callable:
+    """ Imports a server loop given as module:function """
+    module, _, func = name.partition(':')
+    return getattr(importlib.import_module(module), func)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m mockselector.bench',
+        description='Benchmark a server loop under MockSelector')
+    parser.add_argument('--server', default=None,
+                        help='server loop as module:function, called with'
+                             ' the listening socket and the selector'
+                             ' (default: a builtin echo server)')
+    parser.add_argument('--clients', type=int, nargs='+',
+                        default=[10, 100, 1000])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 1024])
+    parser.add_argument('--batches', type=int, nargs='+', default=[1, 16])
+    parser.add_argument('--messages', type=int, default=10,
+                        help='messages per client')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs, the best one is kept')
+    parser.add_argument('--storm', type=int, default=None,
+                        help='run a storm of that many connections instead')
+    parser.add_argument('--burst', type=int, default=1000,
+                        help='connections per burst of the storm')
+    parser.add_argument('--limit', type=int, default=None,
+                        help='maximum number of open fds during the storm')
+    parser.add_argument('-o', '--output', help='JSON file for the results')
+    parser.add_argument('--compare', help='JSON file of a previous run')
+    args = parser.parse_args(argv)
+    server = echo_server if args.server is None else load_server(args.server)
+    if args.storm is not None:
+        res = storm(server, args.storm, args.burst, args.sizes[0], args.limit)
+        print('{accepted} accepted, {dropped} dropped (backlog {backlog}),'
+              ' {errors} errors: {accepts_per_sec:.0f} accepts/s'
+              .format(**res))
+        if args.output:
+            with open(args.output, 'w') as fd:
+                json.dump(res, fd, indent=2)
+        return res
+    res = bench(server, args.clients, args.sizes, args.batches,
+                args.messages, args.repeat)
+    print('{:>8} {:>6} {:>6} {:>12} {:>12} {:>14}'.format(
+        'clients', 'size', 'batch', 'events/s', 'MB/s', 'overhead ns/ev'))
+    for r in res['results']:
+        print('{:8d} {:6d} {:6d} {:12.0f} {:12.2f} {:14.0f}'.format(
+            r['clients'], r['size'], r['batch'], r['events_per_sec'],
+            r['bytes_per_sec'] / 1e6, r['overhead_ns_per_event']))
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump(res, fd, indent=2)
+    if args.compare:
+        with open(args.compare) as fd:
+            for line in compare(res, json.load(fd)):
+                print(line)
+    return res
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,201 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+""" Mock of UDP sockets. """
+
+import errno
+import socket
+from collections.abc import Callable
+from selectors import EVENT_READ, EVENT_WRITE
+from typing import Iterable, List, Optional, Tuple
+
+from .selector import FdAllocator, _default_fds
+
+MAX_DATAGRAM = 65507        # largest UDP payload over IPv4
+
+
+class MockDatagramSocket:
+    """ Socket double for UDP servers.
+
+    A MockDatagramSocket is created with an iterable of the datagrams it
+    will receive. An element is a bytes-like object, received from the
+    default peer address, a (data, address) pair, or a callable returning
+    one of them. A None element means that no datagram is available yet,
+    and there is no end of stream: a receive call raises BlockingIOError
+    when nothing is available, as a non blocking socket would.
+
+    Datagram boundaries are kept: each receive call returns one datagram,
+    and the bytes beyond the given buffer size are discarded, as by a real
+    UDP socket. Such truncations are counted in the truncated attribute,
+    and recvmsg reports them with MSG_TRUNC. recvmmsg receives a batch of
+    datagrams in one call, like the recvmmsg system call.
+
+    Like a FastSocket, a MockDatagramSocket is not a Mock, to handle
+    millions of datagrams: the datagrams sent are kept in the sent list as
+    (bytes, address) pairs, unless it is created with record=False, and
+    send_count and sent_bytes count them in any case. It is always ready
+    for EVENT_WRITE, and ready for EVENT_READ when a datagram is
+    available, so it can be used with a scripted or an automatic
+    MockSelector.
+    """
+    __slots__ = ('datagrams', 'peer', 'sent', 'send_count', 'sent_bytes',
+                 'recv_count', 'truncated', 'close_count', 'blocking',
+                 'sockname', '_next', '_fds', '_fileno', '__weakref__')
+
+    family = socket.AF_INET
+    type = socket.SOCK_DGRAM
+    proto = 0
+
+    def __init__(self, datagrams: Iterable = None, *,
+                 address: Tuple = ('127.0.0.1', 40000),
+                 fds: Optional[FdAllocator] = None, record: bool = True):
+        """
+        :param datagrams: iterable of the received datagrams
+        :param address: default address of the peer
+        :param fds: allocator of the fileno number
+        :type fds: FdAllocator
+        :param record: keeps the sent datagrams in the sent list
+        :type record: bool
+        """
+        self.datagrams = iter([] if datagrams is None else datagrams)
+        self.peer = address
+        self.sent = [] if record else None
+        self.send_count = 0
+        self.sent_bytes = 0
+        self.recv_count = 0
+        self.truncated = 0
+        self.close_count = 0
+        self.blocking = True
+        self.sockname = None
+        self._next = None
+        self._fds = _default_fds if fds is None else fds
+        self._fileno = self._fds.allocate(self)
+
+    def _peek(self) -> Optional[tuple]:
+        """ Returns the next datagram as (data, address), or None.
+
+        A None element of the datagrams is consumed by this method, so it
+        only delays the next datagram by one call.
+        """
+        dgram = self._next
+        if dgram is None:
+            dgram = next(self.datagrams, None)
+            if dgram is None:
+                return None
+            if isinstance(dgram, Callable):
+                dgram = dgram()
+            if isinstance(dgram, tuple):
+                data, address = dgram
+            else:
+                data, address = dgram, self.peer
+            if not isinstance(data, (bytes, bytearray)):
+                data = memoryview(data).cast('B')
+            dgram = self._next = (data, address)
+        return dgram
+
+    def _pop(self) -> tuple:
+        dgram = self._peek()
+        if dgram is None:
+            raise BlockingIOError(errno.EAGAIN, 'Resource temporarily'
+                                                ' unavailable')
+        self._next = None
+        self.recv_count += 1
+        return dgram
+
+    def recvfrom(self, bufsize: int, _flags: int = 0):
+        data, address = self._pop()
+        if len(data) > bufsize:
+            self.truncated += 1
+            data = data[:bufsize]
+        return (data if type(data) is bytes else bytes(data)), address
+
+    def recv(self, bufsize: int, flags: int = 0) -> bytes:
+        return self.recvfrom(bufsize, flags)[0]
+
+    def recvfrom_into(self, buffer, nbytes: int = 0, _flags: int = 0):
+        dest = memoryview(buffer).cast('B')
+        if nbytes == 0:
+            nbytes = len(dest)
+        elif nbytes > len(dest):
+            raise ValueError('nbytes is greater than the length of the'
+                             ' buffer')
+        data, address = self._pop()
+        n = min(nbytes, len(data))
+        if n < len(data):
+            self.truncated += 1
+        dest[:n] = memoryview(data)[:n]
+        return n, address
+
+    def recv_into(self, buffer, nbytes: int = 0, flags: int = 0) -> int:
+        return self.recvfrom_into(buffer, nbytes, flags)[0]
+
+    def recvmsg(self, bufsize: int, _ancbufsize: int = 0, _flags: int = 0):
+        data, address = self._pop()
+        msg_flags = 0
+        if len(data) > bufsize:
+            self.truncated += 1
+            data = data[:bufsize]
+            msg_flags = socket.MSG_TRUNC
+        return bytes(data), [], msg_flags, address
+
+    def recvmmsg(self, vlen: int, bufsize: int) -> List[Tuple[bytes, tuple]]:
+        """ Receives up to vlen datagrams, truncated to bufsize bytes.
+
+        :return: a list of (data, address) pairs
+        :raise BlockingIOError: if no datagram is available
+        """
+        batch = [self.recvfrom(bufsize)]
+        peek = self._peek
+        while len(batch) < vlen and peek() is not None:
+            batch.append(self.recvfrom(bufsize))
+        return batch
+
+    def sendto(self, data, flags_or_address, address=None) -> int:
+        if address is None:
+            address = flags_or_address
+        size = memoryview(data).nbytes
+        if size > MAX_DATAGRAM:
+            raise OSError(errno.EMSGSIZE, 'Message too long')
+        self.send_count += 1
+        self.sent_bytes += size
+        if self.sent is not None:
+            self.sent.append((bytes(data), address))
+        return size
+
+    def send(self, data, _flags: int = 0) -> int:
+        return self.sendto(data, self.peer)
+
+    def sendmmsg(self, messages: Iterable[Tuple]) -> int:
+        """ Sends a batch of (data, address) pairs
+
+        :return: the number of datagrams sent
+        """
+        count = 0
+        for data, address in messages:
+            self.sendto(data, address)
+            count += 1
+        return count
+
+    def connect(self, address):
+        self.peer = address
+
+    def bind(self, address):
+        self.sockname = address
+
+    def getsockname(self):
+        return self.sockname
+
+    def setblocking(self, flag):
+        self.blocking = bool(flag)
+
+    def ready_events(self) -> int:
+        """ Events for which the socket is ready (used by automatic mode) """
+        return EVENT_WRITE | (0 if self._peek() is None else EVENT_READ)
+
+    def fileno(self) -> int:
+        return self._fileno
+
+    def close(self):
+        self.close_count += 1
+        if self._fileno >= 0:
+            self._fds.release(self._fileno)
+            self._fileno = -1
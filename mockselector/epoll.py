@@ -0,0 +1,335 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+""" Emulation of the select.epoll objects.
+
+A MockEpoll has the interface of a select.epoll object and works with
+file descriptors and epoll event masks. It can be scripted with the same
+event lists as a MockSelector, the events being epoll masks (EPOLLIN by
+default), or derive the ready events from the registered mock objects
+when it is created without an event list.
+
+The EPOLL* constants are those of the select module where available, so
+that they can be used on any platform.
+"""
+
+import collections
+import errno
+import select
+from selectors import EVENT_READ, EVENT_WRITE, SelectorKey
+from typing import Iterable, List, Optional, Tuple
+
+from .selector import At, Burst, FdAllocator, MockSelector, \
+    VirtualClock, _default_fds
+
+EPOLLIN = getattr(select, 'EPOLLIN', 0x001)
+EPOLLPRI = getattr(select, 'EPOLLPRI', 0x002)
+EPOLLOUT = getattr(select, 'EPOLLOUT', 0x004)
+EPOLLERR = getattr(select, 'EPOLLERR', 0x008)
+EPOLLHUP = getattr(select, 'EPOLLHUP', 0x010)
+EPOLLRDHUP = getattr(select, 'EPOLLRDHUP', 0x2000)
+EPOLLONESHOT = getattr(select, 'EPOLLONESHOT', 1 << 30)
+EPOLLET = getattr(select, 'EPOLLET', 1 << 31)
+
+_ARMED = object()     # token of an event that was not ready at last poll
+_EOF = object()       # token of the end of stream, which arrives only once
+
+
+class _Entry:
+    """ Registration of a file descriptor in a MockEpoll """
+    __slots__ = ('fileobj', 'mask', 'tokens', 'disabled')
+
+    def __init__(self, fileobj, mask: int):
+        self.fileobj = fileobj
+        self.mask = mask
+        self.tokens = {EPOLLIN: _ARMED, EPOLLOUT: _ARMED}
+        self.disabled = False
+
+
+def _recv_buffer(obj):
+    """ Returns the receive buffer of a mock socket, or None """
+    rbuf = getattr(obj, '_rbuf', None)
+    while rbuf is not None and not hasattr(rbuf, 'view'):
+        rbuf = getattr(rbuf, 'rbuf', None)      # instrumented buffer
+    return rbuf
+
+
+def _read_token(obj):
+    """ Object changing when new data become available for obj.
+
+    Every byte string received by a mock socket is a new arrival, and so
+    is every connection or burst of connections of a ListenSocket. The end
+    of stream is a single arrival. Other objects only give an edge when
+    they were seen not ready by a previous poll.
+    """
+    rbuf = _recv_buffer(obj)
+    if rbuf is not None:
+        view = rbuf.view
+        return _EOF if view is not None and len(view) == 0 else view
+    return getattr(obj, 'arrivals', True)
+
+
+def _write_token(obj):
+    """ Object changing when the send window of obj has stalled """
+    window = getattr(obj, 'window', None)
+    return True if window is None else window.stalls
+
+
+def _same(token, other) -> bool:
+    return token is other or (type(token) is int and token == other)
+
+
+def _is_eof(obj) -> bool:
+    return _read_token(obj) is _EOF
+
+
+class MockEpoll:
+    """ Emulation of a select.epoll object.
+
+    File descriptors (or objects having a fileno method) are registered
+    with an epoll event mask, and poll returns a list of (fd, events)
+    pairs, at most maxevents of them.
+
+    A MockEpoll created with an event list is scripted: each poll call
+    returns the next element of the list, with the same rules as for a
+    MockSelector (including At events and simulated timeouts), the events
+    being epoll masks. The pairs beyond maxevents are returned by the next
+    poll calls, and the events of file descriptors that are not
+    registered are dropped, as a real epoll would never return them. The
+    events of a Burst are an epoll mask too (EVENT_READ being EPOLLIN),
+    intersected with the mask of each registered file descriptor.
+
+    Without event list, a MockEpoll works in automatic mode: the ready
+    events are derived from the registered mock objects, as in the
+    automatic mode of MockSelector, with EOF reported as EPOLLIN (and
+    EPOLLRDHUP if requested). Registrations are level-triggered by default:
+    a ready object is returned by every poll call. With EPOLLET, an event
+    is only returned on an edge: a new byte string received by a socket,
+    a new pending connection, the end of stream (reported once), or room
+    in a send window after a stall. A server that does not read until
+    EAGAIN thus misses data, and, when nothing else is ready, the
+    EndException is raised as when an event list is exhausted.
+    EPOLLONESHOT disables a file descriptor after an event until it is
+    modified. The ready file descriptors are rotated so that maxevents
+    does not starve any of them.
+
+    Like a real epoll object, a MockEpoll used as a context manager is
+    closed on exit. The exit also filters its own EndException, so that a
+    never ending server loop can be used inside a with block.
+    """
+
+    EndException = MockSelector.EndException
+
+    def __init__(self, event_list: Optional[Iterable] = None, *,
+                 clock: Optional[VirtualClock] = None,
+                 fds: Optional[FdAllocator] = None):
+        """
+        :param event_list: the scripted events (automatic mode by default)
+        :param clock: the virtual clock (a new one by default)
+        :type clock: VirtualClock
+        :param fds: allocator used to find the object behind a plain fd,
+         and to allocate the fileno of the epoll object
+        :type fds: FdAllocator
+        """
+        self.automatic = event_list is None
+        self.clock = VirtualClock() if clock is None else clock
+        self.fds = _default_fds if fds is None else fds
+        self.iter_event = iter(()) if event_list is None else map(
+            MockSelector._compile, event_list)
+        self.closed = False
+        self._pending = None
+        self._carry = []
+        self._entries = collections.OrderedDict()
+        self._fileno = self.fds.allocate(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        if exc_type == self.EndException and exc_val.args[0] is self:
+            return True
+        return False
+
+    def fileno(self) -> int:
+        self._check()
+        return self._fileno
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._entries.clear()
+            self.fds.release(self._fileno)
+            self._fileno = -1
+
+    def _check(self):
+        if self.closed:
+            raise ValueError('I/O operation on closed epoll object')
+
+    def _fd(self, fd) -> Tuple[int, object]:
+        if isinstance(fd, int):
+            obj = self.fds.get(fd)
+        else:
+            obj, fd = fd, fd.fileno()
+        if fd < 0:
+            raise ValueError('file descriptor cannot be a negative integer')
+        return fd, obj
+
+    def register(self, fd, eventmask: int = EPOLLIN | EPOLLPRI | EPOLLOUT):
+        self._check()
+        fd, obj = self._fd(fd)
+        if fd in self._entries:
+            raise FileExistsError(errno.EEXIST, 'File exists')
+        self._entries[fd] = _Entry(obj, eventmask)
+
+    def modify(self, fd, eventmask: int):
+        self._check()
+        fd, _ = self._fd(fd)
+        entry = self._entries.get(fd)
+        if entry is None:
+            raise FileNotFoundError(errno.ENOENT, 'No such file or directory')
+        # like EPOLL_CTL_MOD, a modification re-arms the edges
+        self._entries[fd] = _Entry(entry.fileobj, eventmask)
+
+    def unregister(self, fd):
+        self._check()
+        fd, _ = self._fd(fd)
+        if self._entries.pop(fd, None) is None:
+            raise FileNotFoundError(errno.ENOENT, 'No such file or directory')
+
+    def poll(self, timeout: Optional[float] = None,
+             maxevents: int = -1) -> List[Tuple[int, int]]:
+        self._check()
+        if maxevents == 0 or maxevents < -1:
+            raise ValueError('maxevents must be greater than 0, got {}'
+                             .format(maxevents))
+        if timeout is not None and timeout < 0:
+            timeout = None
+        if self.automatic:
+            return self._auto_poll(timeout, maxevents)
+        events = self._carry
+        if not events:
+            events = self._next_events(timeout)
+        if maxevents > 0:
+            self._carry = events[maxevents:]
+            events = events[:maxevents]
+        else:
+            self._carry = []
+        return events
+
+    def _next_events(self, timeout: Optional[float]) -> List[Tuple[int, int]]:
+        ev = self._pending
+        if ev is None:
+            try:
+                ev = next(self.iter_event)
+            except StopIteration as e:
+                raise self.EndException(self) from e
+        else:
+            self._pending = None
+        clock = self.clock
+        if type(ev) is At:
+            if timeout is not None and ev.when > clock.now + timeout:
+                clock.advance(timeout)
+                self._pending = ev
+                return []
+            clock.advance_to(ev.when)
+            ev = ev.event
+        elif not ev and timeout is not None:
+            clock.advance(timeout)
+        if type(ev) is Burst:
+            ev = self._burst(ev)
+        entries = self._entries
+        events = []
+        for sock, fd, event in ev:
+            if fd < 0:
+                fd = sock.fileno()
+            if fd in entries:
+                events.append((fd, event))
+        return events
+
+    def _burst(self, burst: Burst) -> tuple:
+        """ Expands a Burst into the registered fds, in fd order.
+
+        The keys given to the filter of the burst are SelectorKey objects
+        built from the registrations. The fds beyond the maxevents of the
+        burst are delivered by the next poll calls.
+        """
+        ev = []
+        for fd in sorted(self._entries):
+            entry = self._entries[fd]
+            mask = entry.mask & burst.events
+            if not mask or (burst.filter is not None and not burst.filter(
+                    SelectorKey(entry.fileobj, fd, entry.mask, None))):
+                continue
+            if burst.count is not None and len(ev) >= burst.count:
+                break
+            ev.append((entry.fileobj, fd, mask))
+        if burst.maxevents is not None and len(ev) > burst.maxevents:
+            self._pending = tuple(ev[burst.maxevents:])
+            ev = ev[:burst.maxevents]
+        return tuple(ev)
+
+    def _ready(self, fd: int, entry: _Entry) -> int:
+        """ Returns the events to deliver for a registration """
+        obj = entry.fileobj
+        if obj is None:
+            obj = entry.fileobj = self.fds.get(fd)
+        ready_events = getattr(obj, 'ready_events', None)
+        if entry.disabled or ready_events is None:
+            return 0
+        ready = ready_events()
+        events = 0
+        for bit, flag, token in ((EVENT_READ, EPOLLIN, _read_token),
+                                 (EVENT_WRITE, EPOLLOUT, _write_token)):
+            if not entry.mask & flag:
+                continue
+            if not ready & bit:
+                entry.tokens[flag] = _ARMED
+            elif not (entry.mask & EPOLLET
+                      and _same(token(obj), entry.tokens[flag])):
+                events |= flag
+        if events & EPOLLIN and entry.mask & EPOLLRDHUP and _is_eof(obj):
+            events |= EPOLLRDHUP
+        return events
+
+    def _deliver(self, fd: int, entry: _Entry, events: int):
+        obj = entry.fileobj
+        if events & EPOLLIN:
+            entry.tokens[EPOLLIN] = _read_token(obj)
+        if events & EPOLLOUT:
+            entry.tokens[EPOLLOUT] = _write_token(obj)
+        if entry.mask & EPOLLONESHOT:
+            entry.disabled = True
+        self._entries.move_to_end(fd)
+
+    def _auto_poll(self, timeout: Optional[float],
+                   maxevents: int) -> List[Tuple[int, int]]:
+        clock = self.clock
+        deadline = None if timeout is None else clock.now + timeout
+        while True:
+            ready = []
+            wake = None
+            for fd, entry in list(self._entries.items()):
+                events = self._ready(fd, entry)
+                if events:
+                    ready.append((fd, entry, events))
+                elif not ready and not entry.disabled:
+                    ready_at = getattr(entry.fileobj, 'ready_at', None)
+                    mask = ((EVENT_READ if entry.mask & EPOLLIN else 0)
+                            | (EVENT_WRITE if entry.mask & EPOLLOUT else 0))
+                    when = None if ready_at is None else ready_at(mask)
+                    if when is not None and (wake is None or when < wake):
+                        wake = when
+            if ready:
+                if maxevents > 0:
+                    ready = ready[:maxevents]
+                for fd, entry, events in ready:
+                    self._deliver(fd, entry, events)
+                return [(fd, events) for fd, _, events in ready]
+            if (wake is None or wake <= clock.now
+                    or (deadline is not None and wake > deadline)):
+                break
+            clock.advance_to(wake)
+        if deadline is None:
+            raise self.EndException(self)
+        clock.advance_to(deadline)
+        return []
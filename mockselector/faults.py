@@ -0,0 +1,314 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+""" Deterministic injection of I/O errors.
+
+A FaultInjector attached to a MockSelector instruments the objects
+appearing in its events, as a Metrics object does, and makes their
+receive, send and accept calls fail at configurable rates, the faults
+being drawn from a random generator seeded by the caller:
+
+- ConnectionResetError: the connection is reset, and it then behaves as
+  a closed one (receive calls return the end of stream and send calls
+  raise BrokenPipeError)
+- BrokenPipeError: the peer has gone, on send calls, with the same
+  consequences as a reset
+- ConnectionAbortedError: the pending connection was aborted before
+  accept, which drops it (it is only injected when a ListenSocket already
+  has a connection in its backlog, as given by its pending method, so
+  that the instrumentation never changes the arrivals)
+- BlockingIOError (EAGAIN) and InterruptedError (EINTR): transient errors,
+  the call can be retried
+
+A spurious wakeup adds to the result of a select call a read event for a
+registered socket that it did not return, and whose next receive (or
+accept) call then raises a BlockingIOError, as when a real selector
+reports a socket that is not ready anymore. The FaultInjector is the
+first after_select hook of the selector, so that the other hooks see the
+spurious events.
+
+The wall time spent by the server from an injected error to its next call
+on an instrumented object (or to its next select call) is charged to the
+error, which measures the cost of the error paths: exception handling,
+retries and cleanup.
+"""
+
+import errno
+import os
+import random
+import time
+from selectors import EVENT_READ
+from typing import Callable, Dict, Optional
+from unittest.mock import Mock
+from ._instrument import ObjectTable, RecvBufferWrapper, resolve, \
+    wrap_method
+
+DEFAULT_ERRORS = {
+    'recv': (ConnectionResetError, BlockingIOError, InterruptedError),
+    'send': (ConnectionResetError, BrokenPipeError, BlockingIOError,
+             InterruptedError),
+    'accept': (ConnectionAbortedError, BlockingIOError, InterruptedError),
+}
+
+_FATAL = (ConnectionResetError, BrokenPipeError)
+
+_ERRNO = {
+    ConnectionResetError: errno.ECONNRESET,
+    BrokenPipeError: errno.EPIPE,
+    ConnectionAbortedError: errno.ECONNABORTED,
+    BlockingIOError: errno.EAGAIN,
+    InterruptedError: errno.EINTR,
+}
+
+
+def _error(exc: type) -> OSError:
+    code = _ERRNO.get(exc)
+    return exc() if code is None else exc(code, os.strerror(code))
+
+
+class _State:
+    """ Fault state of one instrumented object """
+    __slots__ = ('reset', 'block_next')
+
+    def __init__(self):
+        self.reset = False
+        self.block_next = False
+
+
+class _FaultyRecvBuffer(RecvBufferWrapper):
+    """ Wrapper of the receive buffer of a socket injecting faults """
+    __slots__ = ('injector', 'state')
+
+    def __init__(self, rbuf, injector: 'FaultInjector', state: _State):
+        super().__init__(rbuf)
+        self.injector = injector
+        self.state = state
+
+    def ready(self) -> bool:
+        return self.state.reset or self.rbuf.ready()
+
+    def before_recv(self) -> bool:
+        return self.injector.inject('recv', self.state)
+
+
+class _FaultyWindow:
+    """ Send window of a FastSocket injecting faults.
+
+    It wraps the window of the socket, or accepts everything if it had
+    none.
+    """
+
+    def __init__(self, window, injector: 'FaultInjector', state: _State):
+        self.window = window
+        self.injector = injector
+        self.state = state
+
+    def __getattr__(self, name):
+        return getattr(self.window, name)
+
+    @property
+    def stalls(self) -> int:
+        return 0 if self.window is None else self.window.stalls
+
+    def available(self) -> int:
+        return 1 << 30 if self.window is None else self.window.available()
+
+    def ready_at(self, n: int = 1) -> Optional[float]:
+        return None if self.window is None else self.window.ready_at(n)
+
+    def send(self, data, record: Optional[Callable] = None) -> int:
+        self.injector.inject('send', self.state)
+        if self.window is not None:
+            return self.window.send(data, record)
+        view = memoryview(data).cast('B')
+        record(view)
+        return len(view)
+
+    def sendall(self, data, record: Optional[Callable] = None):
+        self.injector.inject('send', self.state)
+        if self.window is not None:
+            self.window.sendall(data, record)
+        else:
+            record(memoryview(data).cast('B'))
+
+
+class FaultInjector:
+    """ Seeded injector of I/O errors on the objects of a MockSelector.
+
+    The rates are probabilities per call. A global rate is shared among
+    the default errors of each operation (DEFAULT_ERRORS), and a dict of
+    {exception class: rate} given for an operation replaces them.
+
+    The counts of injected errors are kept in the injected dict, and the
+    time spent in the error paths in the error_seconds dict, both keyed
+    by 'operation:ErrorName' ('operation:spurious' for the errors of the
+    spurious wakeups).
+    """
+
+    def __init__(self, seed=None, rate: float = 0.0,
+                 recv: Optional[Dict[type, float]] = None,
+                 send: Optional[Dict[type, float]] = None,
+                 accept: Optional[Dict[type, float]] = None,
+                 spurious: float = 0.0,
+                 timer: Callable[[], float] = time.perf_counter):
+        """
+        :param seed: seed of the random generator
+        :param rate: global error rate per call
+        :param recv: error rates of the receive calls
+        :param send: error rates of the send calls
+        :param accept: error rates of the accept calls
+        :param spurious: probability that a select call returns a spurious
+         read event
+        :param timer: the function giving the time
+        """
+        self.random = random.Random(seed)
+        self.rates = {}
+        for op, errors in (('recv', recv), ('send', send),
+                           ('accept', accept)):
+            if errors is None:
+                defaults = DEFAULT_ERRORS[op]
+                errors = {exc: rate / len(defaults) for exc in defaults}
+            self.rates[op] = sorted(
+                ((exc, p) for exc, p in errors.items() if p > 0),
+                key=lambda item: item[0].__name__)   # reproducible order
+        self.spurious = spurious
+        self.timer = timer
+        self.injected = {}        # type: Dict[str, int]
+        self.error_seconds = {}   # type: Dict[str, float]
+        self.selector = None
+        self._states = ObjectTable()
+        self._fault = None        # (name, start) of the last error
+        self.enabled = True
+
+    def attach(self, selector) -> 'FaultInjector':
+        """ Starts injecting faults in the objects of a MockSelector """
+        self.selector = selector
+        selector.before_select.append(self.mark)
+        selector.after_select.insert(0, self._after)
+        return self
+
+    def detach(self):
+        """ Stops injecting faults, the objects stay instrumented """
+        self.mark()
+        self.selector.before_select.remove(self.mark)
+        self.selector.after_select.remove(self._after)
+        self.selector = None
+        self.enabled = False
+
+    def mark(self):
+        """ Ends the error path of the last injected error """
+        if self._fault is not None:
+            name, start = self._fault
+            self.error_seconds[name] = (self.error_seconds.get(name, 0.0)
+                                        + self.timer() - start)
+            self._fault = None
+
+    def inject(self, op: str, state: _State, impossible: tuple = ()) -> bool:
+        """ Draws the fault of a call.
+
+        :param op: the operation ('recv', 'send' or 'accept')
+        :param state: the fault state of the object
+        :param impossible: errors that cannot happen in this call, a draw
+         of one of them giving a normal call
+        :return: True if the connection was reset (the call then returns
+         an end of stream), False for a normal call
+        :raise OSError: the injected error
+        """
+        self.mark()
+        if not self.enabled:
+            return False
+        if state.reset:
+            if op == 'send':
+                raise _error(BrokenPipeError)
+            return True
+        exc = None
+        if state.block_next:
+            state.block_next = False
+            exc = BlockingIOError
+            name = '{}:spurious'.format(op)
+        else:
+            r = self.random.random()
+            for error, p in self.rates[op]:
+                if r < p:
+                    exc = error
+                    break
+                r -= p
+            if exc is None or issubclass(exc, impossible):
+                return False
+            name = '{}:{}'.format(op, exc.__name__)
+        self.injected[name] = self.injected.get(name, 0) + 1
+        if issubclass(exc, _FATAL):
+            state.reset = True
+        err = _error(exc)
+        self._fault = (name, self.timer())
+        raise err
+
+    def state(self, fileobj) -> _State:
+        """ Returns the fault state of an object, instrumenting it if
+        needed """
+        fd, obj = resolve(self.selector, fileobj)
+        state = self._states.get(fd, obj)
+        if state is not None:
+            return state
+        state = _State()
+        self._states.set(fd, obj, state)
+        if obj is not None:
+            self._instrument(obj, state)
+        return state
+
+    def _instrument(self, obj, state: _State):
+        rbuf = getattr(obj, '_rbuf', None)
+        if rbuf is not None:
+            obj._rbuf = _FaultyRecvBuffer(rbuf, self, state)
+            if isinstance(obj, Mock):
+                for name in ('send', 'sendall', 'sendmsg'):
+                    self._wrap_send(obj, name, state)
+            else:
+                obj.window = _FaultyWindow(obj.window, self, state)
+        elif callable(getattr(obj, 'accept', None)):
+            self._wrap_accept(obj, state)
+
+    def _wrap_send(self, sock, name: str, state: _State):
+        def faulty(send, *args):
+            self.inject('send', state)
+            return send(*args)
+
+        wrap_method(sock, name, faulty)
+
+    def _wrap_accept(self, sock, state: _State):
+        pending = getattr(sock, 'pending', None)
+
+        def faulty_accept(accept):
+            # only a queued connection can be aborted
+            aborts = pending is not None and pending() > 0
+            try:
+                self.inject('accept', state,
+                            () if aborts else (ConnectionAbortedError,))
+            except ConnectionAbortedError:
+                c, _ = accept()     # the aborted connection is dropped
+                c.close()
+                raise
+            return accept()
+
+        wrap_method(sock, 'accept', faulty_accept)
+
+    def _after(self, ready):
+        for key, _ in ready:
+            self.state(key.fileobj)
+        if self.spurious and self.random.random() < self.spurious:
+            returned = {key.fd for key, _ in ready}
+            keys = [key for key in self.selector.get_map().values()
+                    if key.events & EVENT_READ and key.fd not in returned]
+            if keys:
+                key = self.random.choice(keys)
+                self.state(key.fileobj).block_next = True
+                return ready + [(key, EVENT_READ)]
+        return None
+
+    def stats(self) -> dict:
+        """ Returns the count and the error path time of each error """
+        return {name: {
+            'count': count,
+            'seconds': self.error_seconds.get(name, 0.0),
+            'mean_seconds': self.error_seconds.get(name, 0.0) / count,
+        } for name, count in sorted(self.injected.items())}
+
@@ -0,0 +1,143 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+""" Network link model for the receive side of the mock sockets.
+
+A Link sits between the byte strings sent by the simulated peer (the
+recvs iterable of a socket) and the socket itself. The byte strings are
+cut in packets of at most mtu bytes, the packets leave the peer at the
+pace of a token bucket and arrive after a fixed latency plus a random
+jitter. A recv call then returns the packets that have arrived at the
+current time of a virtual clock, coalesced in one chunk, as a real TCP
+socket would.
+
+The peer is assumed to send as fast as the link allows: a new byte string
+is taken from the iterable when the link becomes idle, and a None element
+pauses the peer until the socket is read again.
+"""
+
+import collections
+import random
+from collections.abc import Callable
+from typing import Iterable, Optional, Union
+
+from .selector import VirtualClock
+
+
+class Link:
+    """ Bandwidth, latency and fragmentation model of one connection.
+
+    A Link is given to a MockSocket or a FastSocket with their link
+    parameter. The readiness of the socket then follows the arrival of the
+    packets, and the ready_at method lets an automatic MockSelector
+    advance its clock to the next arrival.
+    """
+
+    def __init__(self, clock: VirtualClock, bandwidth: Optional[float] = None,
+                 latency: float = 0.0, jitter: float = 0.0, mtu: int = 1460,
+                 burst: Optional[int] = None, seed=None):
+        """
+        :param clock: the virtual clock, usually the clock of the selector
+        :type clock: VirtualClock
+        :param bandwidth: rate of the token bucket in bytes per second
+         (unlimited by default)
+        :type bandwidth: float
+        :param latency: fixed delay of a packet in seconds
+        :type latency: float
+        :param jitter: maximum random delay added to the latency
+        :type jitter: float
+        :param mtu: maximum size of a packet
+        :type mtu: int
+        :param burst: capacity of the token bucket (defaults to mtu)
+        :type burst: int
+        :param seed: seed of the random generator used for the jitter
+        """
+        self.clock = clock
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self.jitter = jitter
+        self.mtu = mtu
+        self.burst = mtu if burst is None else burst
+        self.random = random.Random(seed)
+        self.source = iter(())
+        self.done = False
+        self.paused = False
+        self.packets = collections.deque()
+        self.tokens = self.burst
+        self.free = clock()      # time of the last departure
+        self.last = clock()      # time of the last arrival
+
+    def feed(self, recvs: Iterable[Union[bytes, Callable]]) -> 'Link':
+        """ Sets the iterable of the byte strings sent by the peer """
+        self.source = iter([] if recvs is None else recvs)
+        return self
+
+    def _depart(self, size: int, start: float) -> float:
+        """ Departure time of a packet given to the token bucket at start """
+        rate = self.bandwidth
+        if rate is None:
+            return start
+        t = max(start, self.free)
+        tokens = min(self.burst, self.tokens + (t - self.free) * rate)
+        if tokens >= size:
+            self.tokens = tokens - size
+        else:
+            t += (size - tokens) / rate
+            self.tokens = 0
+        return t
+
+    def _send(self, data, now: float):
+        view = memoryview(data).cast('B')
+        for pos in range(0, len(view), self.mtu):
+            packet = view[pos:pos + self.mtu]
+            self.free = self._depart(len(packet), now)
+            delay = self.latency
+            if self.jitter:
+                delay += self.random.uniform(0, self.jitter)
+            # TCP delivers the packets in order
+            self.last = max(self.last, self.free + delay)
+            self.packets.append((self.last, packet))
+
+    def _pull(self, now: float):
+        """ Takes the byte strings sent by the peer while the link is idle.
+
+        Without bandwidth limit, a byte string is only taken when the
+        previous ones have been received.
+        """
+        limited = self.bandwidth is not None
+        while not self.done and (not self.packets
+                                 or (limited and self.free < now)):
+            data = next(self.source, b'')
+            if data is None:
+                self.paused = True
+                return
+            if isinstance(data, Callable):
+                data = data()
+            if len(data) == 0:
+                self.done = True
+            else:
+                # a peer that paused only sends again now
+                self._send(data, now if self.paused else self.free)
+                self.paused = False
+
+    def ready_at(self) -> Optional[float]:
+        """ Arrival time of the next packet, None if unknown """
+        self._pull(self.clock())
+        return self.packets[0][0] if self.packets else None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        now = self.clock()
+        self._pull(now)
+        packets = self.packets
+        if not packets:
+            if self.done:
+                raise StopIteration
+            return None
+        if packets[0][0] > now:
+            return None
+        chunk = [packets.popleft()[1]]
+        while packets and packets[0][0] <= now:
+            chunk.append(packets.popleft()[1])
+        return chunk[0] if len(chunk) == 1 else b''.join(chunk)
@@ -0,0 +1,168 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+import collections
+import heapq
+import itertools
+import random
+from typing import Callable, Iterable, Iterator, Optional
+
+from .selector import At, FastSocket, ListenSocket, MockSelector, \
+    VirtualClock
+
+
+def constant(delay: float) -> Iterator[float]:
+    """ Arrival pattern with a fixed delay between two connections. """
+    return itertools.repeat(delay)
+
+
+def poisson(rate: float, seed=None) -> Iterator[float]:
+    """ Arrival pattern of a Poisson process.
+
+    :param rate: mean number of connections per virtual second
+    :param seed: seed of the random generator
+    """
+    rnd = random.Random(seed)
+    while True:
+        yield rnd.expovariate(rate)
+
+
+def bursts(size: int, delay: float) -> Iterator[float]:
+    """ Arrival pattern of bursts of simultaneous connections.
+
+    :param size: number of connections in a burst
+    :param delay: delay between two bursts
+    """
+    while True:
+        yield delay
+        for _ in range(size - 1):
+            yield 0.0
+
+
+class _Feed:
+    """ Iterator over a queue that is filled while it is consumed.
+
+    None is returned while the queue is empty, and the iteration only stops
+    once the queue is empty and done has been set.
+    """
+    __slots__ = ('queue', 'done')
+
+    def __init__(self):
+        self.queue = collections.deque()
+        self.done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.queue:
+            return self.queue.popleft()
+        if self.done:
+            raise StopIteration
+        return None
+
+
+class Load:
+    """ Lazy synthetic traffic generator.
+
+    A Load object builds a ListenSocket and a MockSelector simulating a
+    number of connections. The client sockets are only created when they
+    arrive and are forgotten after their end of stream has been delivered,
+    so only the active connections exist in memory whatever the number of
+    connections.
+
+    The connections arrive following an arrival pattern, which is an
+    iterable of delays in virtual seconds between two arrivals (see the
+    constant, poisson and bursts functions). Each client then sends the
+    byte strings returned by the payload callable, one per event, with
+    interval virtual seconds between two events, and finally closes the
+    connection. All the events are At events, so that the virtual clock of
+    the selector follows the simulated traffic.
+
+    The listen_socket must be accepted once per EVENT_READ on it. The
+    client sockets receive a None element while their next byte string
+    has not been scheduled yet, so a recv call out of an event raises a
+    BlockingIOError. An event for a socket that is no longer registered
+    is silently skipped, and the remaining events of a socket closed by
+    the server are dropped.
+    """
+
+    def __init__(self, connections: int,
+                 arrivals: Optional[Iterable[float]] = None,
+                 payload: Optional[Callable[[int], Iterable[bytes]]] = None,
+                 interval: float = 0.0,
+                 socket_factory: Callable = FastSocket,
+                 clock: Optional[VirtualClock] = None):
+        """
+        :param connections: total number of connections
+        :param arrivals: iterable of delays between two arrivals (all the
+         connections arrive at once by default)
+        :param payload: callable returning the iterable of byte strings
+         sent by the client of the given index (nothing by default)
+        :param interval: delay between two events of a client
+        :param socket_factory: class or callable building a client socket
+         from the iterable of its received byte strings
+        :param clock: the clock to be used by the selector
+        """
+        self.connections = connections
+        self.arrivals = constant(0.0) if arrivals is None else arrivals
+        self.payload = (lambda _i: ()) if payload is None else payload
+        self.interval = interval
+        self.socket_factory = socket_factory
+        self.opened = 0
+        self.closed = 0
+        self.max_active = 0
+        self._accepted = _Feed()
+        self.listen_socket = ListenSocket(self._accepted)
+        self.selector = MockSelector(self._events(), clock=clock)
+
+    @property
+    def active(self) -> int:
+        """ Number of connections currently opened by the clients """
+        return self.opened - self.closed
+
+    def _events(self):
+        heap = []
+        seq = itertools.count()
+        arrivals = iter(self.arrivals)
+        registered = self.selector.get_map()
+        now = self.selector.clock.now
+        next_arrival = now + next(arrivals, 0.0)
+        while True:
+            if self.opened < self.connections and (
+                    not heap or next_arrival <= heap[0][0]):
+                feed = _Feed()
+                chunks = iter(self.payload(self.opened))
+                sock = self.socket_factory(feed)
+                self._accepted.queue.append(sock)
+                self.opened += 1
+                self.max_active = max(self.max_active, self.active)
+                heapq.heappush(heap, (next_arrival + self.interval,
+                                      next(seq), sock, feed, chunks))
+                yield At(next_arrival, self.listen_socket)
+                delay = next(arrivals, None)
+                if delay is None:
+                    self.connections = self.opened
+                else:
+                    next_arrival += delay
+            elif heap:
+                when, _, sock, feed, chunks = heapq.heappop(heap)
+                fd = sock.fileno()
+                if fd < 0:
+                    # closed by the server: the client stops sending
+                    feed.done = True
+                    self.closed += 1
+                    continue
+                chunk = next(chunks, None)
+                if chunk is None:
+                    feed.done = True
+                    self.closed += 1
+                else:
+                    feed.queue.append(chunk)
+                    heapq.heappush(heap, (when + self.interval, next(seq),
+                                          sock, feed, chunks))
+                key = registered.get(fd)
+                if key is not None and key.fileobj is sock:
+                    yield At(when, sock)
+            else:
+                self._accepted.done = True
+                return
@@ -0,0 +1,374 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+""" Instrumentation of servers running under MockSelector.
+
+A Metrics object attached to a selector uses its before_select and
+after_select hooks to count the select calls and the delivered events,
+and instruments the objects appearing in the events: the receive calls
+of MockSocket and FastSocket, the send calls of MockSocket (the bytes
+sent by a FastSocket are taken from its sent bytearray) and the accept
+calls of ListenSocket. Nothing is instrumented while no Metrics object
+is attached, so the mock objects keep their full speed.
+
+The wall time spent by the server between the return of a select call
+and the next call is attributed to the connections: every instrumented
+call marks the connection being handled, and the time up to the next mark
+is charged to it, and to the event type (read or write) delivered for it.
+That attribution assumes that the handlers run in the selector thread.
+
+The results are available as a dict (to_dict, to_json) or in the
+Prometheus text format (to_prometheus).
+"""
+
+import bisect
+import json
+import time
+import weakref
+from selectors import EVENT_READ, EVENT_WRITE
+from typing import Callable, Iterable, List
+from unittest.mock import Mock
+from ._instrument import ObjectTable, RecvBufferWrapper, resolve, \
+    wrap_method
+
+DEFAULT_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4,
+                   5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """ Histogram of durations with fixed bucket upper bounds in seconds.
+
+    counts has one element per bucket, plus a last one for the values
+    greater than the largest bound.
+    """
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """ Upper bound of the bucket containing the quantile q """
+        rank = q * self.count
+        total = 0
+        for bound, n in zip(self.buckets, self.counts):
+            total += n
+            if total >= rank:
+                return bound
+        return float('inf')
+
+    def to_dict(self) -> dict:
+        return {
+            'buckets': list(self.buckets),
+            'counts': list(self.counts),
+            'count': self.count,
+            'sum': self.sum,
+        }
+
+
+def _size(data) -> int:
+    return memoryview(data).nbytes
+
+
+def _msg_size(buffers) -> int:
+    return sum(memoryview(b).nbytes for b in buffers)
+
+
+class _MeteredRecvBuffer(RecvBufferWrapper):
+    """ Wrapper of the receive buffer of a socket counting the bytes """
+    __slots__ = ('metrics', 'record')
+
+    def __init__(self, rbuf, metrics: 'Metrics', record: dict):
+        super().__init__(rbuf)
+        self.metrics = metrics
+        self.record = record
+
+    def before_recv(self) -> bool:
+        self.metrics.mark(self.record)
+        return False
+
+    def after_recv(self, nbytes: int):
+        self.record['bytes_in'] += nbytes
+
+
+class Metrics:
+    """ Event, byte and handler time counters of a MockSelector.
+
+    One record (a dict) is kept per connection seen in the events of the
+    selector, in the connections list, with its id, fd and type, its read
+    and write event counts, its received and sent bytes, its accepts (for
+    a listening socket) and the handler time charged to it.
+
+    Histograms are kept for the duration of the select calls, of the
+    handler batches (the time between two select calls), of the handler
+    time per event and of the accept calls.
+    """
+
+    def __init__(self, timer: Callable[[], float] = time.perf_counter,
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        """
+        :param timer: the function giving the time
+        :param buckets: the upper bounds of the histogram buckets
+        """
+        self.timer = timer
+        self.selects = 0
+        self.connections = []    # type: List[dict]
+        self.select_time = Histogram(buckets)
+        self.batch_time = Histogram(buckets)
+        self.event_time = Histogram(buckets)
+        self.accept_time = Histogram(buckets)
+        self.selector = None
+        self._records = ObjectTable()
+        self._batch = None       # fd -> (record, events) of the last select
+        self._spent = {}         # record id -> handler time in the batch
+        self._current = None
+        self._start = 0.0
+        self._batch_start = 0.0
+        self._select_start = None
+
+    def attach(self, selector) -> 'Metrics':
+        """ Starts collecting the metrics of a MockSelector """
+        self.selector = selector
+        selector.before_select.append(self._before)
+        selector.after_select.append(self._after)
+        return self
+
+    def detach(self):
+        """ Stops collecting, the instrumented objects keep counting """
+        self._before()
+        self.selector.before_select.remove(self._before)
+        self.selector.after_select.remove(self._after)
+        self.selector = None
+
+    def record(self, fileobj) -> dict:
+        """ Returns the record of an object, instrumenting it if needed """
+        fd, obj = resolve(self.selector, fileobj)
+        rec = self._records.get(fd, obj)
+        if rec is not None:
+            return rec
+        rec = {
+            'id': len(self.connections),
+            'fd': fd,
+            'type': type(obj).__name__,
+            'read_events': 0,
+            'write_events': 0,
+            'bytes_in': 0,
+            'bytes_out': 0,
+            'accepts': 0,
+            'handler_seconds': 0.0,
+            'read_seconds': 0.0,
+            'write_seconds': 0.0,
+        }
+        self.connections.append(rec)
+        self._records.set(fd, obj, rec)
+        if obj is not None:
+            self._instrument(obj, rec)
+        return rec
+
+    def _instrument(self, obj, rec: dict):
+        rbuf = getattr(obj, '_rbuf', None)
+        if rbuf is not None and not isinstance(rbuf, _MeteredRecvBuffer):
+            obj._rbuf = _MeteredRecvBuffer(rbuf, self, rec)
+        if isinstance(obj, Mock):
+            self._wrap_send(obj, rec)
+        elif isinstance(getattr(obj, 'sent', None), bytearray):
+            rec['_sent'] = (weakref.ref(obj), len(obj.sent))
+        if not hasattr(obj, '_rbuf') and callable(getattr(obj, 'accept',
+                                                          None)):
+            self._wrap_accept(obj, rec)
+
+    def _wrap_send(self, sock, rec: dict):
+        """ Meters send, sendall and sendmsg, keeping the mock records if
+        any """
+        for name, size in (('send', _size), ('sendall', _size),
+                           ('sendmsg', _msg_size)):
+            wrap_method(sock, name, self._metered(rec, size))
+
+    def _metered(self, rec: dict,
+                 size: Callable[[object], int]) -> Callable:
+        def metered(send, data, *args):
+            self.mark(rec)
+            res = send(data, *args)
+            rec['bytes_out'] += res if isinstance(res, int) else size(data)
+            return res
+
+        return metered
+
+    def _wrap_accept(self, sock, rec: dict):
+        def metered_accept(accept):
+            self.mark(rec)
+            start = self.timer()
+            res = accept()
+            self.accept_time.observe(self.timer() - start)
+            rec['accepts'] += 1
+            return res
+
+        wrap_method(sock, 'accept', metered_accept)
+
+    @staticmethod
+    def _update_sent(rec: dict):
+        sent = rec.get('_sent')
+        if sent is not None:
+            obj = sent[0]()
+            if obj is not None:
+                rec['bytes_out'] = len(obj.sent) - sent[1]
+
+    def _charge(self, rec: dict, seconds: float):
+        rec['handler_seconds'] += seconds
+        events = self._batch.get(rec['fd'], (None, 0))[1]
+        if events & EVENT_READ or not events & EVENT_WRITE:
+            rec['read_seconds'] += seconds
+        else:
+            rec['write_seconds'] += seconds
+        self._spent[rec['id']] = self._spent.get(rec['id'], 0.0) + seconds
+
+    def mark(self, rec: dict):
+        """ Records that the server now handles the connection of rec """
+        if self._batch is None:
+            return
+        now = self.timer()
+        # the time before the first mark is the dispatch of that connection
+        self._charge(rec if self._current is None else self._current,
+                     now - self._start)
+        self._start = now
+        self._current = rec
+
+    def _before(self):
+        now = self.timer()
+        if self._batch is not None:
+            if self._current is not None:
+                self._charge(self._current, now - self._start)
+            elif self._batch:
+                share = (now - self._start) / len(self._batch)
+                for rec, _ in self._batch.values():
+                    self._charge(rec, share)
+            self.batch_time.observe(now - self._batch_start)
+            for rec, _ in self._batch.values():
+                self.event_time.observe(self._spent.get(rec['id'], 0.0))
+                self._update_sent(rec)
+            self._batch = None
+        self._select_start = now
+
+    def _after(self, ready):
+        now = self.timer()
+        if self._select_start is not None:
+            self.select_time.observe(now - self._select_start)
+        self.selects += 1
+        batch = {}
+        for key, events in ready:
+            rec = self.record(key.fileobj)
+            if events & EVENT_READ:
+                rec['read_events'] += 1
+            if events & EVENT_WRITE:
+                rec['write_events'] += 1
+            batch[rec['fd']] = (rec, events)
+        self._batch = batch
+        self._spent = {}
+        self._current = None
+        self._start = self._batch_start = self.timer()
+
+    def totals(self) -> dict:
+        """ Sums of the counters of all the connections """
+        for rec in self.connections:
+            self._update_sent(rec)
+        names = ('read_events', 'write_events', 'bytes_in', 'bytes_out',
+                 'accepts', 'handler_seconds', 'read_seconds',
+                 'write_seconds')
+        totals = {name: sum(rec[name] for rec in self.connections)
+                  for name in names}
+        totals['selects'] = self.selects
+        totals['connections'] = len(self.connections)
+        return totals
+
+    def to_dict(self, per_connection: bool = True) -> dict:
+        res = {
+            'totals': self.totals(),
+            'histograms': {
+                'select_seconds': self.select_time.to_dict(),
+                'batch_seconds': self.batch_time.to_dict(),
+                'event_seconds': self.event_time.to_dict(),
+                'accept_seconds': self.accept_time.to_dict(),
+            },
+        }
+        if per_connection:
+            res['connections'] = [
+                {k: v for k, v in rec.items() if not k.startswith('_')}
+                for rec in self.connections]
+        return res
+
+    def to_json(self, per_connection: bool = True, **kwargs) -> str:
+        return json.dumps(self.to_dict(per_connection), **kwargs)
+
+    def to_prometheus(self, prefix: str = 'mockselector',
+                      per_connection: bool = False) -> str:
+        """ Returns the metrics in the Prometheus text exposition format """
+        totals = self.totals()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append('# HELP {}_{} {}'.format(prefix, name, help_text))
+            lines.append('# TYPE {}_{} {}'.format(prefix, name, kind))
+            for labels, value in samples:
+                lines.append('{}_{}{} {}'.format(prefix, name, labels,
+                                                 _number(value)))
+
+        metric('selects_total', 'counter', 'Number of select calls.',
+               [('', totals['selects'])])
+        metric('events_total', 'counter', 'Number of delivered events.',
+               [('{event="read"}', totals['read_events']),
+                ('{event="write"}', totals['write_events'])])
+        metric('accepts_total', 'counter', 'Number of accepted connections.',
+               [('', totals['accepts'])])
+        metric('bytes_total', 'counter', 'Bytes received and sent.',
+               [('{direction="in"}', totals['bytes_in']),
+                ('{direction="out"}', totals['bytes_out'])])
+        metric('handler_seconds_total', 'counter',
+               'Handler time between two select calls.',
+               [('{event="read"}', totals['read_seconds']),
+                ('{event="write"}', totals['write_seconds'])])
+        if per_connection:
+            samples = []
+            for rec in self.connections:
+                labels = 'conn="{}",fd="{}"'.format(rec['id'], rec['fd'])
+                samples += [
+                    ('{' + labels + ',direction="in"}', rec['bytes_in']),
+                    ('{' + labels + ',direction="out"}', rec['bytes_out'])]
+            metric('connection_bytes_total', 'counter',
+                   'Bytes received and sent per connection.', samples)
+            metric('connection_handler_seconds_total', 'counter',
+                   'Handler time per connection.',
+                   [('{{conn="{}",fd="{}"}}'.format(rec['id'], rec['fd']),
+                     rec['handler_seconds']) for rec in self.connections])
+        for name, hist, help_text in (
+                ('select_seconds', self.select_time,
+                 'Duration of the select calls.'),
+                ('batch_seconds', self.batch_time,
+                 'Handler time between two select calls.'),
+                ('event_seconds', self.event_time,
+                 'Handler time per event.'),
+                ('accept_seconds', self.accept_time,
+                 'Duration of the accept calls.')):
+            samples = []
+            total = 0
+            for bound, n in zip(hist.buckets, hist.counts):
+                total += n
+                samples.append(('_bucket{{le="{}"}}'.format(_number(bound)),
+                                total))
+            samples += [('_bucket{le="+Inf"}', hist.count),
+                        ('_sum', hist.sum), ('_count', hist.count)]
+            lines.append('# HELP {}_{} {}'.format(prefix, name, help_text))
+            lines.append('# TYPE {}_{} histogram'.format(prefix, name))
+            for suffix, value in samples:
+                lines.append('{}_{}{} {}'.format(prefix, name, suffix,
+                                                 _number(value)))
+        return '\n'.join(lines) + '\n'
+
+
+def _number(value) -> str:
+    return repr(value) if isinstance(value, float) else str(value)
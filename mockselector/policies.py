@@ -0,0 +1,64 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+""" Scheduling policies for the automatic mode of MockSelector.
+
+A policy is a callable receiving the list of the ready (key, events) pairs,
+in fd order, and returning the list that select will return.
+"""
+
+import bisect
+import random
+from selectors import SelectorKey
+from typing import List, Optional, Tuple
+
+Ready = List[Tuple[SelectorKey, int]]
+
+
+class MaxBatch:
+    """ Returns all the ready keys, optionally capped to maxevents.
+
+    This is the behaviour of a real selector, maxevents emulating the
+    corresponding parameter of epoll.
+    """
+
+    def __init__(self, maxevents: Optional[int] = None):
+        self.maxevents = maxevents
+
+    def __call__(self, ready: Ready) -> Ready:
+        if self.maxevents is None:
+            return ready
+        return ready[:self.maxevents]
+
+
+class RoundRobin:
+    """ Returns batch ready keys per call, rotating in fd order.
+
+    Each call starts after the highest fd served by the previous one, so
+    every ready key is eventually served even with a batch of one.
+    """
+
+    def __init__(self, batch: int = 1):
+        self.batch = batch
+        self.last = -1
+
+    def __call__(self, ready: Ready) -> Ready:
+        ready = sorted(ready, key=lambda kev: kev[0].fd)
+        start = bisect.bisect_right([key.fd for key, _ in ready], self.last)
+        chosen = (ready[start:] + ready[:start])[:self.batch]
+        self.last = chosen[-1][0].fd
+        return chosen
+
+
+class RandomPolicy:
+    """ Returns a random sample of batch ready keys in random order.
+
+    The sample is drawn from a random generator initialized with seed, so
+    a given seed always gives the same interleaving.
+    """
+
+    def __init__(self, seed=None, batch: int = 1):
+        self.random = random.Random(seed)
+        self.batch = batch
+
+    def __call__(self, ready: Ready) -> Ready:
+        return self.random.sample(ready, min(self.batch, len(ready)))
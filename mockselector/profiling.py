@@ -0,0 +1,287 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+""" CPU and memory profiles of the handlers of a server.
+
+A Profiler attached to a MockSelector uses its after_select and
+before_select hooks to profile the server code that runs between two
+select calls, which is the handling of the returned events. The events
+are profiled under the label of their key: the data of the key by
+default (what a server usually sets to its handler), or the name of the
+type of the registered object when the data is None, or the result of a
+label function.
+
+As a Metrics object does, the Profiler instruments the objects appearing
+in the events, so that the handling of each event is measured on its
+own even when a select call returns many of them (MaxBatch policy, Burst
+events): the receive and accept calls, and the send calls of a
+MockSocket, mark the key being handled, and the code running up to the
+next mark (or to the next select call) is charged to its label. The code
+running before the first mark is charged to the first returned event,
+which a server usually handles first. That attribution assumes that the
+handlers run in the selector thread.
+
+The CPU profile of a label is a cProfile.Profile enabled while its
+handler runs, so the functional scenarios of a server give a repeatable
+profile of its request path. With memory=True, tracemalloc snapshots are
+taken around each handler and the allocated memory is charged to the
+label, along with the source lines that allocated it. Snapshots are
+slow, so the memory profile is better taken in a separate run from the
+CPU profile.
+"""
+
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+from unittest.mock import Mock
+from ._instrument import ObjectTable, RecvBufferWrapper, wrap_method
+
+_FILTERS = (tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'))
+
+
+class _MarkingRecvBuffer(RecvBufferWrapper):
+    """ Wrapper of the receive buffer of a socket marking its handling """
+    __slots__ = ('profiler', 'fd')
+
+    def __init__(self, rbuf, profiler: 'Profiler', fd: int):
+        super().__init__(rbuf)
+        self.profiler = profiler
+        self.fd = fd
+
+    def before_recv(self) -> bool:
+        self.profiler.mark(self.fd)
+        return False
+
+
+class HandlerProfile:
+    """ Profile of the handlers sharing a label.
+
+    batches is the number of select calls whose events ran the handler.
+    """
+
+    def __init__(self, label: str, cpu: bool):
+        self.label = label
+        self.batches = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.allocated = 0       # bytes allocated and still alive at the end
+        self.blocks = 0
+        self.lines = {}          # type: Dict[str, int]
+        self.profile = cProfile.Profile() if cpu else None
+
+    def stats(self) -> pstats.Stats:
+        """ Returns the CPU profile as a pstats.Stats object """
+        if self.profile is None:
+            raise ValueError('no CPU profile for {}'.format(self.label))
+        return pstats.Stats(self.profile)
+
+    def to_dict(self, lines: int = 5) -> dict:
+        return {
+            'label': self.label,
+            'batches': self.batches,
+            'seconds': self.seconds,
+            'mean_seconds': self.seconds / self.batches if self.batches
+            else 0.0,
+            'max_seconds': self.max_seconds,
+            'allocated': self.allocated,
+            'blocks': self.blocks,
+            'top_lines': sorted(self.lines.items(), key=lambda kv: -kv[1])
+            [:lines],
+        }
+
+
+class Profiler:
+    """ Per-handler CPU and memory profiler of a MockSelector.
+
+    The profiles are kept by label in the handlers dict.
+    """
+
+    def __init__(self, label: Optional[Callable] = None, cpu: bool = True,
+                 memory: bool = False,
+                 timer: Callable[[], float] = time.perf_counter):
+        """
+        :param label: function receiving a selector key and returning the
+         label of its handler
+        :param cpu: enables the cProfile profiles
+        :param memory: enables the tracemalloc snapshots
+        :param timer: the function giving the time
+        """
+        self.label = label
+        self.cpu = cpu
+        self.memory = memory
+        self.timer = timer
+        self.handlers = {}      # type: Dict[str, HandlerProfile]
+        self.selector = None
+        self._batch = None       # fd -> label of the events of the last select
+        self._spent = {}         # label -> handler time in the batch
+        self._instrumented = ObjectTable()
+        self._current = None
+        self._start = 0.0
+        self._snapshot = None
+        self._started_tracing = False
+
+    @staticmethod
+    def default_label(key) -> str:
+        if key.data is None:
+            return type(key.fileobj).__name__
+        return str(getattr(key.data, '__qualname__', key.data))
+
+    def attach(self, selector) -> 'Profiler':
+        """ Starts profiling the handlers of a MockSelector """
+        self.selector = selector
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        selector.before_select.append(self._before)
+        selector.after_select.append(self._after)
+        return self
+
+    def detach(self):
+        """ Stops profiling """
+        self._before()
+        self.selector.before_select.remove(self._before)
+        self.selector.after_select.remove(self._after)
+        self.selector = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.selector is not None:
+            self.detach()
+        return False
+
+    def _after(self, ready):
+        if not ready:
+            return
+        label = self.default_label if self.label is None else self.label
+        batch = {}
+        for key, _ in ready:
+            if key.fd not in batch:
+                batch[key.fd] = label(key)
+                self._instrument(key)
+        self._batch = batch
+        self._spent = {}
+        self._enter(batch[ready[0][0].fd])
+
+    def mark(self, fd: int):
+        """ Records that the server now handles the events of fd """
+        if self._batch is None:
+            return
+        label = self._batch.get(fd)
+        if label is not None and label != self._current.label:
+            self._leave()
+            self._enter(label)
+
+    def _before(self):
+        if self._batch is None:
+            return
+        self._leave()
+        for label, seconds in self._spent.items():
+            prof = self.handlers[label]
+            prof.batches += 1
+            if seconds > prof.max_seconds:
+                prof.max_seconds = seconds
+        self._batch = None
+
+    def _enter(self, label: str):
+        """ Starts profiling a handler """
+        prof = self.handlers.get(label)
+        if prof is None:
+            prof = self.handlers[label] = HandlerProfile(label, self.cpu)
+        self._current = prof
+        if self.memory:
+            self._snapshot = tracemalloc.take_snapshot().filter_traces(
+                _FILTERS)
+        self._start = self.timer()
+        if prof.profile is not None:
+            prof.profile.enable()
+
+    def _leave(self):
+        """ Stops profiling the current handler """
+        prof = self._current
+        if prof.profile is not None:
+            prof.profile.disable()
+        elapsed = self.timer() - self._start
+        prof.seconds += elapsed
+        self._spent[prof.label] = self._spent.get(prof.label, 0.0) + elapsed
+        if self._snapshot is not None:
+            snapshot = tracemalloc.take_snapshot().filter_traces(_FILTERS)
+            for diff in snapshot.compare_to(self._snapshot, 'lineno'):
+                if diff.size_diff > 0:
+                    prof.allocated += diff.size_diff
+                    prof.blocks += max(diff.count_diff, 0)
+                    frame = diff.traceback[0]
+                    line = '{}:{}'.format(frame.filename, frame.lineno)
+                    prof.lines[line] = (prof.lines.get(line, 0)
+                                        + diff.size_diff)
+            self._snapshot = None
+        self._current = None
+
+    def _instrument(self, key):
+        """ Makes the calls on the object of a key mark its handling """
+        fd = key.fd
+        obj = key.fileobj
+        if isinstance(obj, int):
+            obj = self.selector.fds.get(fd)
+        if obj is None or self._instrumented.get(fd, obj):
+            return
+        self._instrumented.set(fd, obj, True)
+        rbuf = getattr(obj, '_rbuf', None)
+        if rbuf is not None:
+            obj._rbuf = _MarkingRecvBuffer(rbuf, self, fd)
+            if isinstance(obj, Mock):
+                for name in ('send', 'sendall', 'sendmsg'):
+                    self._wrap(obj, name, fd)
+        elif callable(getattr(obj, 'accept', None)):
+            self._wrap(obj, 'accept', fd)
+
+    def _wrap(self, obj, name: str, fd: int):
+        def marking(call, *args):
+            self.mark(fd)
+            return call(*args)
+
+        wrap_method(obj, name, marking)
+
+    def slowest(self, n: int = 10) -> List[HandlerProfile]:
+        """ Returns the n handlers with the highest total time """
+        return sorted(self.handlers.values(), key=lambda p: -p.seconds)[:n]
+
+    def heaviest(self, n: int = 10) -> List[HandlerProfile]:
+        """ Returns the n handlers having allocated the most memory """
+        return sorted(self.handlers.values(),
+                      key=lambda p: -p.allocated)[:n]
+
+    def report(self, n: int = 10, functions: int = 5) -> str:
+        """ Returns a text report of the slowest and heaviest handlers
+
+        :param n: number of handlers in each list
+        :param functions: number of functions of the CPU profile shown
+         for each of the slowest handlers
+        """
+        out = io.StringIO()
+        out.write('Slowest handlers:\n')
+        for prof in self.slowest(n):
+            out.write('{:>10.6f} s {:>8} batches  max {:.6f} s  {}\n'.format(
+                prof.seconds, prof.batches, prof.max_seconds, prof.label))
+            if prof.profile is not None and functions:
+                stats = pstats.Stats(prof.profile, stream=out)
+                stats.sort_stats('cumulative').print_stats(functions)
+        if self.memory:
+            out.write('Most allocating handlers:\n')
+            for prof in self.heaviest(n):
+                out.write('{:>10} B {:>8} blocks  {}\n'.format(
+                    prof.allocated, prof.blocks, prof.label))
+                for line, size in prof.to_dict(3)['top_lines']:
+                    out.write('{:>14} B  {}\n'.format(size, line))
+        return out.getvalue()
+
+    def to_dict(self) -> dict:
+        return {'handlers': [p.to_dict() for p in self.slowest(None)]}
@@ -0,0 +1,213 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+""" Recording policies for the send calls of MockSocket.
+
+By default, a MockSocket is a plain Mock and every send call is kept in
+its call_args_list, along with the sent data. A recorder replaces the
+send, sendall and sendmsg methods of the socket by plain functions that
+only count the calls and the bytes, and process the data according to a
+policy:
+
+- Ring: keeps only the data of the last calls
+- Digest: maintains a running hash of the output stream
+- Sink: streams the data to a binary file
+- Capture: reassembles the output stream in one buffer, with the offset
+  of each call, and provides the checks of the output
+
+A recorder is given to a socket with its record parameter, either as a
+Recorder object or as a factory (for example a Recorder subclass) that
+will be called to build one. The record_policy class attribute of
+MockSocket gives the default factory for all the sockets, None meaning
+a full record.
+"""
+
+import array
+import bisect
+import collections
+import hashlib
+import re
+from typing import Optional
+
+
+class Recorder:
+    """ Base class of the recorders.
+
+    It counts the calls and the bytes sent, and passes the data of each
+    call to the record method, which does nothing here.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.nbytes = 0
+
+    def send(self, data, _flags=0) -> int:
+        data = memoryview(data).cast('B')
+        self.count += 1
+        self.nbytes += len(data)
+        self.record(data)
+        return len(data)
+
+    def sendall(self, data, _flags=0):
+        self.send(data)
+
+    def sendmsg(self, buffers, _ancdata=(), _flags=0, _address=None) -> int:
+        return self.send(b''.join(buffers))
+
+    def record(self, data: memoryview):
+        """ Processes the data of one call """
+        pass
+
+    def close(self):
+        """ Called when the socket is closed """
+        pass
+
+
+class Ring(Recorder):
+    """ Keeps the data of the last size calls in the calls deque. """
+
+    def __init__(self, size: int = 16):
+        """
+        :param size: number of calls to keep
+        :type size: int
+        """
+        super().__init__()
+        self.calls = collections.deque(maxlen=size)
+
+    def record(self, data: memoryview):
+        self.calls.append(bytes(data))
+
+
+class Digest(Recorder):
+    """ Maintains a running hash of the output stream.
+
+    The digest and hexdigest methods return the hash of all the bytes sent
+    so far, which can be compared with the hash of the expected stream.
+    """
+
+    def __init__(self, name: str = 'sha256'):
+        """
+        :param name: name of a hashlib algorithm
+        :type name: str
+        """
+        super().__init__()
+        self.hash = hashlib.new(name)
+
+    def record(self, data: memoryview):
+        self.hash.update(data)
+
+    def digest(self) -> bytes:
+        return self.hash.digest()
+
+    def hexdigest(self) -> str:
+        return self.hash.hexdigest()
+
+
+class Sink(Recorder):
+    """ Streams the output to a binary file.
+
+    The file can be given as a path, in which case it is opened at
+    creation time and closed along with the socket, or as a binary file
+    object that remains owned by the caller.
+    """
+
+    def __init__(self, file):
+        """
+        :param file: path or binary file object opened for writing
+        """
+        super().__init__()
+        self.owned = (isinstance(file, (str, bytes))
+                      or hasattr(file, '__fspath__'))
+        self.file = open(file, 'wb') if self.owned else file
+
+    def record(self, data: memoryview):
+        self.file.write(data)
+
+    def close(self):
+        if self.owned:
+            self.file.close()
+
+
+class Capture(Recorder):
+    """ Reassembles the output stream in one contiguous buffer.
+
+    The bytes of all the calls are appended to the buffer bytearray, and
+    the offsets array gives the position of the first byte of each call,
+    so that a position in the stream can be traced back to the call that
+    sent it. The checks work on the buffer without splitting it by call
+    or copying it.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.buffer = bytearray()
+        self.offsets = array.array('Q')
+
+    def record(self, data: memoryview):
+        self.offsets.append(len(self.buffer))
+        self.buffer += data
+
+    def getvalue(self) -> bytes:
+        """ Returns the whole output stream """
+        return bytes(self.buffer)
+
+    def call(self, index: int) -> bytes:
+        """ Returns the data sent by one call """
+        offsets = self.offsets
+        if index < 0:
+            index += len(offsets)
+        start = offsets[index]
+        end = (offsets[index + 1] if index + 1 < len(offsets)
+               else len(self.buffer))
+        return bytes(self.buffer[start:end])
+
+    def call_index(self, offset: int) -> int:
+        """ Returns the index of the call that sent the byte at offset """
+        if not 0 <= offset < len(self.buffer):
+            raise IndexError('offset out of range')
+        return bisect.bisect_right(self.offsets, offset) - 1
+
+    def startswith(self, prefix) -> bool:
+        return self.buffer.startswith(prefix)
+
+    def search(self, pattern, flags: int = 0):
+        """ Searches a bytes regular expression in the output stream
+
+        :param pattern: bytes pattern or compiled regular expression
+        :return: the match object or None
+        """
+        return re.compile(pattern, flags).search(self.buffer)
+
+    def hexdigest(self, name: str = 'sha256') -> str:
+        """ Returns the hash of the output stream """
+        return hashlib.new(name, self.buffer).hexdigest()
+
+    def compare(self, expected, chunk_size: int = 1 << 16) -> Optional[int]:
+        """ Compares the output stream with the expected one.
+
+        The expected stream is read by chunks, so that a large file is
+        never loaded in memory.
+
+        :param expected: path (not given as bytes), binary file object
+         or bytes-like object
+        :param chunk_size: size of the chunks read from a file
+        :return: None if the streams are equal, else the offset of the
+         first difference (the length of the shorter one if one is a
+         prefix of the other)
+        """
+        if isinstance(expected, str) or hasattr(expected, '__fspath__'):
+            with open(expected, 'rb') as fd:
+                return self.compare(fd, chunk_size)
+        with memoryview(self.buffer) as out:
+            if not hasattr(expected, 'read'):
+                chunks = [expected]
+            else:
+                chunks = iter(lambda: expected.read(chunk_size), b'')
+            pos = 0
+            for chunk in chunks:
+                chunk = memoryview(chunk).cast('B')
+                part = out[pos:pos + len(chunk)]
+                if part != chunk:
+                    return pos + next(i for i in range(len(chunk))
+                                      if i >= len(part) or part[i] != chunk[i])
+                pos += len(chunk)
+            return None if pos == len(out) else pos
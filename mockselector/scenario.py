@@ -0,0 +1,298 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+""" Declarative scenarios in JSON files.
+
+A scenario describes the clients of a listening socket, the data they
+send and the events returned by the selector:
+
+    {
+        "socket": "mock",
+        "clients": {
+            "c1": ["foo", "quit"],
+            "c2": {"socket": "fast",
+                   "recv": ["foo", {"hex": "00ff"}, null,
+                            {"repeat": "x", "count": 65536}]}
+        },
+        "accept": ["c1", "c2"],
+        "events": ["s", "c1", "s", "c2:rw", ["c1", "c2"], [],
+                   {"at": 30, "events": "c1"}]
+    }
+
+- socket: the class of the client sockets, "mock" (MockSocket, the
+  default) or "fast" (FastSocket); a client can override it
+- clients: the received byte strings of each client, either as a list or
+  in the recv member of an object. A string is encoded in UTF-8, an
+  object gives the bytes as hex, base64 or a repeated string (repeat and
+  count), and null means that no data is available yet
+- accept: the order of the connections (all the clients in order by
+  default). A list is a burst of connections and null splits them in
+  batches, as in a ListenSocket
+- listen: the name of the listening socket in the events ("s" by default)
+- events: the event list of the selector. An event is a socket name,
+  followed by ":r", ":w" or ":rw" for other events than EVENT_READ. A
+  list groups the events of one select call (an empty one being a
+  timeout), an object with at delivers its events at a virtual
+  timestamp, and an object with burst is a Burst of all the registered
+  keys, with its optional events, count and maxevents
+- policy: instead of events, the automatic mode policy, as an object
+  with the name of a class of mockselector.policies and its args
+
+Parsing and checking a scenario, and building its payloads, is done once:
+the compiled form is cached on disk (in the __pycache__ directory next to
+the scenario file by default), keyed by the hash of the file content, so
+that loading a scenario again only builds the mock objects.
+"""
+
+import base64
+import collections
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from selectors import EVENT_READ, EVENT_WRITE
+from typing import Dict, Optional
+
+from . import policies
+from .selector import At, Burst, FastSocket, FdAllocator, ListenSocket, \
+    MockSelector, MockSocket, VirtualClock
+
+FORMAT = b'mockselector-scenario-2'
+
+_SOCKETS = {'mock': MockSocket, 'fast': FastSocket}
+_MASKS = {'r': EVENT_READ, 'w': EVENT_WRITE, 'rw': EVENT_READ | EVENT_WRITE}
+
+
+class Scenario:
+    """ The mock objects built from a scenario.
+
+    :ivar listen_socket: the ListenSocket
+    :ivar clients: the client sockets by name
+    :ivar selector: the MockSelector
+    """
+
+    def __init__(self, listen_socket: ListenSocket, clients: Dict,
+                 selector: MockSelector, listen_name: str = 's'):
+        self.listen_socket = listen_socket
+        self.clients = clients
+        self.selector = selector
+        self.listen_name = listen_name
+
+    def __getitem__(self, name: str):
+        """ Returns a socket by its name in the scenario """
+        if name == self.listen_name:
+            return self.listen_socket
+        return self.clients[name]
+
+
+def _payload(value, where: str):
+    if value is None or isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode()
+    if isinstance(value, dict):
+        if 'hex' in value:
+            return bytes.fromhex(value['hex'])
+        if 'base64' in value:
+            return base64.b64decode(value['base64'])
+        if 'repeat' in value:
+            return _payload(value['repeat'], where) * value.get('count', 1)
+    raise ValueError('{}: invalid payload {!r}'.format(where, value))
+
+
+def _event(value, names: Dict[str, int], where: str) -> tuple:
+    if not isinstance(value, str):
+        raise ValueError('{}: invalid event {!r}'.format(where, value))
+    name, _, mask = value.partition(':')
+    if name not in names or (mask and mask not in _MASKS):
+        raise ValueError('{}: unknown event {!r}'.format(where, value))
+    return names[name], _MASKS.get(mask, EVENT_READ)
+
+
+def _events(value, names: Dict[str, int], where: str):
+    if isinstance(value, dict) and 'burst' in value:
+        burst = value['burst']
+        if not isinstance(burst, dict):
+            raise ValueError('{}: invalid burst {!r}'.format(where, burst))
+        mask = burst.get('events', 'r')
+        if not isinstance(mask, str) or mask not in _MASKS:
+            raise ValueError('{}: unknown events {!r}'.format(where, mask))
+        return 'burst', _MASKS[mask], burst.get('count'), \
+            burst.get('maxevents')
+    if isinstance(value, dict):
+        if 'at' not in value:
+            raise ValueError('{}: missing at'.format(where))
+        return float(value['at']), _events(value.get('events', []), names,
+                                           where)
+    if isinstance(value, str):
+        return (_event(value, names, where),)
+    if isinstance(value, list):
+        return tuple(_event(v, names, where) for v in value)
+    raise ValueError('{}: invalid event {!r}'.format(where, value))
+
+
+def compile_scenario(data: dict) -> dict:
+    """ Checks a parsed scenario and converts it to its compiled form.
+
+    The compiled form only contains builtin types: the clients are
+    numbered in their order of declaration, the listening socket being -1,
+    and the payloads are bytes.
+
+    :param data: the scenario as loaded from JSON
+    :return: the compiled form
+    """
+    default = data.get('socket', 'mock')
+    listen = data.get('listen', 's')
+    clients = data.get('clients', {})
+    if not isinstance(clients, dict):
+        raise ValueError('clients: invalid clients {!r}'.format(clients))
+    names = {name: i for i, name in enumerate(clients)}
+    if listen in names:
+        raise ValueError('{!r} is the name of the listening socket'
+                         .format(listen))
+    compiled_clients = []
+    for name, client in clients.items():
+        if isinstance(client, list):
+            client = {'recv': client}
+        elif not isinstance(client, dict):
+            raise ValueError('{}: invalid client {!r}'.format(name, client))
+        kind = client.get('socket', default)
+        if kind not in _SOCKETS:
+            raise ValueError('{}: unknown socket {!r}'.format(name, kind))
+        compiled_clients.append((name, kind, [
+            _payload(v, name) for v in client.get('recv', [])]))
+
+    def connection(value):
+        if value is None:
+            return None
+        if isinstance(value, list):
+            return [connection(v) for v in value]
+        if value not in names:
+            raise ValueError('accept: unknown client {!r}'.format(value))
+        return names[value]
+    accept = [connection(v) for v in data.get('accept', list(clients))]
+    names[listen] = -1
+    events = [_events(v, names, 'events[{}]'.format(i))
+              for i, v in enumerate(data.get('events', []))]
+    policy = data.get('policy')
+    if policy is not None:
+        if isinstance(policy, str):
+            policy = {'name': policy}
+        if not (isinstance(policy, dict)
+                and isinstance(policy.get('name'), str)
+                and isinstance(policy.get('args', []), list)):
+            raise ValueError('policy: invalid policy {!r}'.format(policy))
+        if not isinstance(getattr(policies, policy['name'], None), type):
+            raise ValueError('policy: unknown policy {!r}'
+                             .format(policy['name']))
+        policy = (policy['name'], policy.get('args', []))
+    return {
+        'listen': listen,
+        'clients': compiled_clients,
+        'accept': accept,
+        'events': events,
+        'policy': policy,
+    }
+
+
+def build(compiled: dict, clock: Optional[VirtualClock] = None,
+          fds: Optional[FdAllocator] = None) -> Scenario:
+    """ Builds the mock objects of a compiled scenario """
+    clients = {name: _SOCKETS[kind](recvs, fds=fds)
+               for name, kind, recvs in compiled['clients']}
+    socks = list(clients.values())
+
+    def connection(value):
+        if isinstance(value, list):
+            return [connection(v) for v in value]
+        return None if value is None else socks[value]
+    s = ListenSocket([connection(v) for v in compiled['accept']], fds=fds)
+    socks.append(s)     # index -1
+
+    def events(value):
+        if len(value) == 2 and isinstance(value[0], float):
+            return At(value[0], events(value[1]))
+        if value and value[0] == 'burst':
+            return Burst(*value[1:])
+        return tuple((socks[i], mask) for i, mask in value)
+    policy = compiled['policy']
+    if policy is not None:
+        name, args = policy
+        sel = MockSelector(policy=getattr(policies, name)(*args),
+                           clock=clock, fds=fds)
+    else:
+        sel = MockSelector([events(ev) for ev in compiled['events']],
+                           clock=clock, fds=fds)
+    return Scenario(s, clients, sel, compiled['listen'])
+
+
+def _parse(text: str) -> dict:
+    # the order of the clients is the order of declaration
+    return json.loads(text, object_pairs_hook=collections.OrderedDict)
+
+
+def _cache_path(path: str, digest: str, cache_dir) -> str:
+    if cache_dir is None:
+        cache_dir = os.environ.get('MOCKSELECTOR_CACHE')
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)),
+                                 '__pycache__')
+    return os.path.join(cache_dir, '{}.{}.pickle'.format(
+        os.path.splitext(os.path.basename(path))[0], digest))
+
+
+def load_compiled(path, cache_dir=None) -> dict:
+    """ Returns the compiled form of a scenario file, using the cache.
+
+    :param path: path of the JSON scenario
+    :param cache_dir: directory of the cache (MOCKSELECTOR_CACHE or the
+     __pycache__ directory next to the file by default), False to
+     disable the cache
+    """
+    with open(path, 'rb') as fd:
+        content = fd.read()
+    if cache_dir is False:
+        return compile_scenario(_parse(content.decode()))
+    digest = hashlib.sha256(FORMAT + content).hexdigest()[:32]
+    cache = _cache_path(path, digest, cache_dir)
+    try:
+        with open(cache, 'rb') as fd:
+            return pickle.load(fd)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+    compiled = compile_scenario(_parse(content.decode()))
+    tmp = None
+    try:
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(cache))
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(compiled, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache)
+        tmp = None
+    except OSError:
+        pass        # the cache is only an optimization
+    finally:
+        if tmp is not None:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+    return compiled
+
+
+def load(path, cache_dir=None, clock: Optional[VirtualClock] = None,
+         fds: Optional[FdAllocator] = None) -> Scenario:
+    """ Loads a JSON scenario file and builds its mock objects.
+
+    :param path: path of the scenario
+    :param cache_dir: see load_compiled
+    :param clock: the clock of the selector
+    :param fds: allocator of the fileno of the sockets
+    """
+    return build(load_compiled(path, cache_dir), clock, fds)
+
+
+def loads(text: str, clock: Optional[VirtualClock] = None,
+          fds: Optional[FdAllocator] = None) -> Scenario:
+    """ Builds the mock objects of a JSON scenario given as a string """
+    return build(compile_scenario(_parse(text)), clock, fds)
@@ -1,40 +1,80 @@
 #  Copyright (c) 2020 SBA - MIT License
 
+import errno
+import heapq
 import selectors
+import threading
+import weakref
 from collections.abc import Callable
-from selectors import SelectorKey, EVENT_READ
+from selectors import SelectorKey, EVENT_READ, EVENT_WRITE
 from typing import Optional, List, Tuple, Iterable, Union
 from unittest.mock import Mock
 import socket
 import collections.abc
 
+from .recording import Recorder
 
-def _gen_uniq(start: int):
-    """ Helper to generate unique values.
 
-    Example usage:
-    gen_fd = _gen_uniq(10)
-    a = gen_fd()            # will be 10
-    b = gen_fd()            # will be 11
+class FdAllocator:
+    """ Allocator of fileno numbers for the mock sockets.
 
-    :param start: first value that will be returned
-    :type start: int
-    :return: a function that will return a different integer at each call
-    (starting from the start parameter)
-    :rtype: function
+    Like an operating system, an FdAllocator always returns the lowest
+    available number, and the number of a closed socket is reused. An
+    optional limit emulates RLIMIT_NOFILE: an OSError with errno EMFILE is
+    raised when the next number would reach it.
+
+    The allocator also keeps a weak reference to the object owning each
+    number, so that a selector can find the socket behind a plain fd. It is
+    thread safe.
     """
-    i = start
 
-    def inner():
-        nonlocal i
-        cr = i
-        i = i + 1
-        return cr
+    def __init__(self, start: int = 10, limit: Optional[int] = None):
+        """
+        :param start: first number that will be allocated
+        :type start: int
+        :param limit: number that cannot be reached (no limit by default)
+        :type limit: int
+        """
+        self.start = start
+        self.limit = limit
+        self._next = start
+        self._free = []
+        self._objects = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def allocate(self, obj=None) -> int:
+        """ Returns the lowest available number, owned by obj """
+        with self._lock:
+            if self._free:
+                fd = heapq.heappop(self._free)
+            elif self.limit is not None and self._next >= self.limit:
+                raise OSError(errno.EMFILE, 'Too many open files')
+            else:
+                fd = self._next
+                self._next += 1
+            if obj is not None:
+                self._objects[fd] = obj
+            return fd
+
+    def release(self, fd: int):
+        """ Makes a number available again """
+        with self._lock:
+            self._objects.pop(fd, None)
+            heapq.heappush(self._free, fd)
+
+    def get(self, fd: int):
+        """ Returns the object owning a number or None """
+        return self._objects.get(fd)
 
-    return inner
+    @property
+    def in_use(self) -> int:
+        """ Number of allocated numbers """
+        return self._next - self.start - len(self._free)
 
 
-_gen_fd = _gen_uniq(10)
+_default_fds = FdAllocator()
+_DEFAULT_BACKLOG = min(socket.SOMAXCONN, 128)    # as socket.listen()
+_END = object()       # end of an iterator
 
 
 class MockSocket(Mock):
@@ -45,46 +85,408 @@ class MockSocket(Mock):
     be called. If one string is longer than the bufsize parameter, only a
     fragment of maximum allowed size will be returned. The remaining part
     of the byte string is then available for the future recv calls.
+    The recv_into, recvmsg and recvmsg_into methods follow the same rules,
+    and the unread part of a byte string is never copied. A None element
+    in the iterable simulates a moment when no data is available: the
+    receive call raises a BlockingIOError as a non blocking socket would.
 
-    Different MockSocket objects will all have different fileno numbers.
+    The send method returns the length of the data, as if it had been
+    fully sent, unless the socket uses a SendWindow: send then only
+    accepts the bytes that fit in the window, and the socket is ready for
+    EVENT_WRITE only when the window has some room. Similarly, a Link
+    (from the mockselector.link module) delivers the byte strings as
+    packets arriving over time. By default, all the send calls are
+    recorded by the mock machinery. A recorder (see the
+    mockselector.recording module) can be used instead to bound the memory
+    used by long runs, either per socket with the record parameter or for
+    all the sockets with the record_policy class attribute. It then
+    replaces the send, sendall and sendmsg methods, and is available as
+    the recorder attribute. The Capture recorder keeps the whole output
+    stream in one buffer for the checks.
+
+    The receive calls are protected by a lock, so that several threads
+    can use the same MockSocket.
+
+    Different MockSocket objects will all have different fileno numbers,
+    given by an FdAllocator (a global one by default). A closed MockSocket
+    releases its number and its fileno method then returns -1.
     """
 
+    record_policy = None
+
     def __new__(cls, *_args, **kwargs):
         obj = super().__new__(cls, socket.socket)
         return obj
 
-    def __init__(self, recvs: Iterable[Union[bytes, Callable]] = None):
+    def __init__(self, recvs: Iterable[Union[bytes, Callable]] = None, *,
+                 fds: Optional[FdAllocator] = None, record=None,
+                 window: Optional['SendWindow'] = None, link=None):
         """
         :param recvs: iterable of byte strings or callable returning byte
          strings to be returned by recv calls
         :type recvs: Iterable[bytes]
+        :param fds: allocator of the fileno number
+        :type fds: FdAllocator
+        :param record: Recorder object or factory building one (defaults
+         to the record_policy class attribute)
+        :param window: send window (unlimited by default)
+        :type window: SendWindow
+        :param link: network model of the received data (see the
+         mockselector.link module)
         """
         super().__init__(socket.socket)
+        self.link = link
+        self._rbuf = _LockedRecvBuffer(recvs if link is None
+                                       else link.feed(recvs))
+        self._fds = _default_fds if fds is None else fds
+        self._fileno = self._fds.allocate(self)
+        self.close.side_effect = self._close
+        self.family = socket.AF_INET
+        self.type = socket.SOCK_STREAM
+        self.proto = 0
+        if record is None:
+            record = self.record_policy
+        if record is not None and not isinstance(record, Recorder):
+            record = record()
+        self.recorder = record
+        self.window = window
+        if window is not None:
+            sink = None if record is None else record.send
+            send = lambda data, *_args: window.send(data, sink)
+            sendall = lambda data, *_args: window.sendall(data, sink)
+            sendmsg = lambda buffers, *_args: window.send(b''.join(buffers),
+                                                          sink)
+            if record is None:
+                self.send.side_effect = send
+                self.sendall.side_effect = sendall
+                self.sendmsg.side_effect = sendmsg
+            else:
+                self.send, self.sendall, self.sendmsg = send, sendall, sendmsg
+        elif record is None:
+            self.send.side_effect = lambda data, *_args: len(data)
+            self.sendmsg.side_effect = lambda buffers, *_args: sum(
+                memoryview(b).nbytes for b in buffers)
+        else:
+            self.send = record.send
+            self.sendall = record.sendall
+            self.sendmsg = record.sendmsg
+
+    @property
+    def remain(self) -> bytes:
+        return self._rbuf.remain
+
+    def recv(self, size, flags=0):
+        return self._rbuf.recv(size, flags)
+
+    def recv_into(self, buffer, nbytes=0, flags=0):
+        return self._rbuf.recv_into(buffer, nbytes, flags)
+
+    def recvmsg(self, bufsize, ancbufsize=0, flags=0):
+        return self._rbuf.recvmsg(bufsize, ancbufsize, flags)
+
+    def recvmsg_into(self, buffers, ancbufsize=0, flags=0):
+        return self._rbuf.recvmsg_into(buffers, ancbufsize, flags)
+
+    def ready_events(self) -> int:
+        """ Events for which the socket is ready (used by automatic mode) """
+        return _ready_events(self._rbuf, self.window)
+
+    def ready_at(self, events: int) -> Optional[float]:
+        """ Virtual time at which the socket will be ready for events """
+        return _ready_at(self.link, self.window, events)
+
+    def fileno(self):
+        return self._fileno
+
+    def _close(self):
+        if self._fileno >= 0:
+            self._fds.release(self._fileno)
+            self._fileno = -1
+            if self.recorder is not None:
+                self.recorder.close()
+
+    def _get_child_mock(self, **kw):
+        return Mock(**kw)
+
+
+def _whole_bytes(view: memoryview) -> bool:
+    """ Tells whether a view covers a whole bytes object, and not a slice
+    of it, so that recv can return that object instead of a copy """
+    return type(view.obj) is bytes and len(view.obj) == len(view)
+
+
+class _RecvBuffer:
+    """ Receive side shared by MockSocket and FastSocket.
+
+    The current byte string is kept as a memoryview along with the offset
+    of its first unread byte. Reading a large byte string by small
+    fragments thus only copies the returned fragments and never the
+    unread tail. The view is reset to None once the byte string has been
+    fully read.
+    """
+    __slots__ = ('recvs', 'view', 'pos')
+
+    def __init__(self, recvs: Iterable[Union[bytes, Callable]] = None):
         if recvs is None:
             recvs = []
         self.recvs = iter(recvs)
-        self._fileno = _gen_fd()
-        self.remain = ''
+        self.view = None
+        self.pos = 0
 
-    def recv(self, size):
-        if len(self.remain) > 0:
-            data = self.remain
-        else:
+    def _current(self) -> memoryview:
+        """ Returns the view on the current byte string.
+
+        The next element of recvs is fetched (and called if it is a
+        callable) when the current byte string has been fully read. A None
+        element means that no data is available yet.
+        """
+        view = self.view
+        if view is None:
             data = next(self.recvs, b'')
+            if data is None:
+                raise BlockingIOError
             if isinstance(data, Callable):
                 data = data()
-        if size < len(data):
-            data, self.remain = data[:size], data[size:]
+            view = memoryview(data)
+            if view.format != 'B':
+                view = view.cast('B')
+            self.view = view
+            self.pos = 0
+        return view
+
+    def _advance(self, view: memoryview, pos: int):
+        """ Records that the current byte string has been read up to pos """
+        if pos >= len(view):
+            self.view = None
         else:
-            self.remain = ''
+            self.pos = pos
+
+    def ready(self) -> bool:
+        """ Tells whether a receive call would not block.
+
+        An end of stream is ready. A None element is consumed by this
+        method, so it only delays the readiness by one call.
+        """
+        try:
+            self._current()
+        except BlockingIOError:
+            return False
+        return True
+
+    @property
+    def remain(self) -> bytes:
+        return b'' if self.view is None else bytes(self.view[self.pos:])
+
+    def recv(self, size: int, _flags: int = 0) -> bytes:
+        view = self._current()
+        pos = self.pos
+        if pos == 0 and size >= len(view) and _whole_bytes(view):
+            self.view = None
+            return view.obj
+        data = bytes(view[pos:pos + size])
+        self._advance(view, pos + len(data))
         return data
 
+    def recv_into(self, buffer, nbytes: int = 0, _flags: int = 0) -> int:
+        dest = memoryview(buffer).cast('B')
+        if nbytes == 0:
+            nbytes = len(dest)
+        elif nbytes > len(dest):
+            raise ValueError('buffer too small for requested bytes')
+        view = self._current()
+        pos = self.pos
+        n = min(nbytes, len(view) - pos)
+        dest[:n] = view[pos:pos + n]
+        self._advance(view, pos + n)
+        return n
+
+    def recvmsg(self, bufsize: int, _ancbufsize: int = 0, _flags: int = 0):
+        return self.recv(bufsize), [], 0, None
+
+    def recvmsg_into(self, buffers, _ancbufsize: int = 0, _flags: int = 0):
+        view = self._current()
+        pos = self.pos
+        for buffer in buffers:
+            dest = memoryview(buffer).cast('B')
+            n = min(len(dest), len(view) - pos)
+            dest[:n] = view[pos:pos + n]
+            pos += n
+        total = pos - self.pos
+        self._advance(view, pos)
+        return total, [], 0, None
+
+
+class _LockedRecvBuffer(_RecvBuffer):
+    """ _RecvBuffer allowing concurrent receive calls from several threads """
+    __slots__ = ('lock',)
+
+    def __init__(self, recvs: Iterable[Union[bytes, Callable]] = None):
+        super().__init__(recvs)
+        self.lock = threading.Lock()
+
+    def ready(self) -> bool:
+        with self.lock:
+            return super().ready()
+
+    @property
+    def remain(self) -> bytes:
+        with self.lock:
+            return b'' if self.view is None else bytes(self.view[self.pos:])
+
+    def recv(self, size: int, _flags: int = 0) -> bytes:
+        with self.lock:
+            return super().recv(size, _flags)
+
+    def recv_into(self, buffer, nbytes: int = 0, _flags: int = 0) -> int:
+        with self.lock:
+            return super().recv_into(buffer, nbytes, _flags)
+
+    def recvmsg_into(self, buffers, _ancbufsize: int = 0, _flags: int = 0):
+        with self.lock:
+            return super().recvmsg_into(buffers, _ancbufsize, _flags)
+
+
+def _ready_events(rbuf: _RecvBuffer, window) -> int:
+    """ Readiness of a socket made of a receive buffer and a send window """
+    events = EVENT_READ if rbuf.ready() else 0
+    if window is None or window.available():
+        events |= EVENT_WRITE
+    return events
+
+
+def _ready_at(link, window, events: int) -> Optional[float]:
+    """ Time at which a socket will be ready, None if unknown """
+    times = []
+    if link is not None and events & EVENT_READ:
+        times.append(link.ready_at())
+    if window is not None and events & EVENT_WRITE:
+        times.append(window.ready_at())
+    times = [t for t in times if t is not None]
+    return min(times) if times else None
+
+
+class FastSocket:
+    """ Lightweight socket double for high-volume simulations.
+
+    A FastSocket follows the same recv contract as MockSocket, but it is
+    not a Mock: nothing is recorded by a mock machinery. The bytes sent
+    through send, sendall and sendmsg are accumulated in the sent
+    bytearray, and the other calls only increment counters. Using
+    __slots__ also keeps the memory footprint of one object small. A
+    SendWindow limits the accepted bytes and a Link shapes the received
+    data the same way as for a MockSocket.
+
+    FastSocket objects share the fileno numbering of MockSocket and can be
+    used wherever a MockSocket is, including in a ListenSocket or
+    a MockSelector. Unlike a MockSocket, a FastSocket is meant to be used
+    by one thread at a time (possibly handed off between threads), unless
+    it is created with threadsafe=True.
+    """
+    __slots__ = ('sent', 'send_count', 'close_count', 'setblocking_count',
+                 'shutdown_count', 'blocking', 'window', 'link', '_rbuf',
+                 '_fds', '_fileno', '__weakref__')
+
+    family = socket.AF_INET
+    type = socket.SOCK_STREAM
+    proto = 0
+
+    def __init__(self, recvs: Iterable[Union[bytes, Callable]] = None, *,
+                 fds: Optional[FdAllocator] = None,
+                 window: Optional['SendWindow'] = None, link=None,
+                 threadsafe: bool = False):
+        """
+        :param recvs: iterable of byte strings or callable returning byte
+         strings to be returned by recv calls
+        :type recvs: Iterable[bytes]
+        :param fds: allocator of the fileno number
+        :type fds: FdAllocator
+        :param window: send window (unlimited by default)
+        :type window: SendWindow
+        :param link: network model of the received data (see the
+         mockselector.link module)
+        :param threadsafe: allows concurrent receive calls
+        :type threadsafe: bool
+        """
+        self.link = link
+        if link is not None:
+            recvs = link.feed(recvs)
+        self._rbuf = (_LockedRecvBuffer if threadsafe else _RecvBuffer)(recvs)
+        self.window = window
+        self.sent = bytearray()
+        self.send_count = 0
+        self.close_count = 0
+        self.setblocking_count = 0
+        self.shutdown_count = 0
+        self.blocking = True
+        self._fds = _default_fds if fds is None else fds
+        self._fileno = self._fds.allocate(self)
+
+    @property
+    def remain(self) -> bytes:
+        return self._rbuf.remain
+
+    def recv(self, size, flags=0):
+        return self._rbuf.recv(size, flags)
+
+    def recv_into(self, buffer, nbytes=0, flags=0):
+        return self._rbuf.recv_into(buffer, nbytes, flags)
+
+    def recvmsg(self, bufsize, ancbufsize=0, flags=0):
+        return self._rbuf.recvmsg(bufsize, ancbufsize, flags)
+
+    def recvmsg_into(self, buffers, ancbufsize=0, flags=0):
+        return self._rbuf.recvmsg_into(buffers, ancbufsize, flags)
+
+    def send(self, data, _flags=0):
+        self.send_count += 1
+        if self.window is not None:
+            return self.window.send(data, self.sent.extend)
+        self.sent += data
+        return len(data)
+
+    def sendall(self, data, _flags=0):
+        self.send_count += 1
+        if self.window is not None:
+            self.window.sendall(data, self.sent.extend)
+        else:
+            self.sent += data
+
+    def sendmsg(self, buffers, _ancdata=(), _flags=0, _address=None):
+        return self.send(b''.join(buffers))
+
+    def close(self):
+        self.close_count += 1
+        if self._fileno >= 0:
+            self._fds.release(self._fileno)
+            self._fileno = -1
+
+    def setblocking(self, flag):
+        self.setblocking_count += 1
+        self.blocking = bool(flag)
+
+    def gettimeout(self):
+        return None if self.blocking else 0.0
+
+    def shutdown(self, _how):
+        self.shutdown_count += 1
+
+    def ready_events(self) -> int:
+        """ Events for which the socket is ready (used by automatic mode) """
+        return _ready_events(self._rbuf, self.window)
+
+    def ready_at(self, events: int) -> Optional[float]:
+        """ Virtual time at which the socket will be ready for events """
+        return _ready_at(self.link, self.window, events)
+
+    def getsockname(self):
+        return 'localhost', 8888
+
+    def getpeername(self):
+        return 'localhost', 57000 + self._fileno
+
     def fileno(self):
         return self._fileno
 
-    def _get_child_mock(self, **kw):
-        return Mock(**kw)
-
 
 class ListenSocket:
     """ A class aimed at mocking listening TCP sockets.
@@ -98,53 +500,475 @@ class ListenSocket:
     A proper sequence bind -> listen -> accept, ... -> close is required.
     An OSError is raised if accept is used before bind and listen or if
     any call is used on a closed socket
+
+    When the iterable is exhausted, a blocking ListenSocket returns a new
+    MockSocket. A non blocking one raises a BlockingIOError instead, and
+    so does a None element of the iterable, which allows to split the
+    accepted sockets in several batches.
+
+    A list element is a burst of connections arriving at once. They are
+    queued in the listen backlog (whose size is given to listen) and
+    returned by the next accept calls; the connections that do not fit
+    are dropped, without being called if they are callables, and counted
+    in the dropped attribute. An OSError raised by a callable (typically
+    EMFILE from an FdAllocator with a limit) is propagated by accept and
+    the connection stays pending, so that a server can accept it once it
+    has released some fds. Such errors are counted in the errors
+    attribute, and the peak attribute is the highest number of pending
+    connections.
+
+    By default, an element of the iterable only arrives when no
+    connection is pending, so the backlog only limits the size of a
+    burst. Given a VirtualClock and an interval, the elements arrive on
+    their own schedule instead, one every interval virtual seconds from
+    the listen call (a None element being an interval without arrival),
+    whether the server accepts them or not: a server whose accept loop
+    is slower than the arrivals fills its backlog, and the connections
+    arriving while it is full are dropped. The ready_at method gives the
+    next arrival to the automatic mode of MockSelector, and a blocking
+    accept waits for it.
+
+    The accept calls are protected by a lock, so that several threads can
+    accept connections from the same ListenSocket.
     """
 
+    family = socket.AF_INET
+    type = socket.SOCK_STREAM
+    proto = 0
+
     def __init__(self, accepted: Iterable[Union[socket.socket,
-                                                Callable]] = None):
+                                                Callable]] = None, *,
+                 fds: Optional[FdAllocator] = None,
+                 clock: Optional['VirtualClock'] = None,
+                 interval: float = 0.0):
         """
         :param accepted: Iterable of socket objects or callable returning
         socket objects to return in sequence when accept is called
         :type accepted: Iterable[socket.socket]
+        :param fds: allocator of the fileno number, also used for the
+         MockSocket objects created by accept
+        :type fds: FdAllocator
+        :param clock: the clock scheduling the arrivals (by default an
+         element arrives when no connection is pending)
+        :type clock: VirtualClock
+        :param interval: delay between two arrivals, required with a clock
         """
+        if clock is not None and not interval > 0:
+            raise ValueError('interval must be positive with a clock')
         accepted = [] if accepted is None else accepted
         self.accepted = iter(accepted)
+        self.queue = collections.deque()
+        self.backlog = _DEFAULT_BACKLOG
+        self.arrivals = 0
+        self.dropped = 0
+        self.errors = 0
+        self.peak = 0
+        self.clock = clock
+        self.interval = interval
+        self.next_arrival = None
         self.current = 0
         self.state = 0
-        self._fileno = _gen_fd()
+        self.blocking = True
+        self.fds = _default_fds if fds is None else fds
+        self._fileno = self.fds.allocate(self)
         self.address = 'localhost'
         self.remote_port = 57000
+        self.sockname = None
+        self._lock = threading.Lock()
 
     def _addr(self):
         self.remote_port += 1
         return self.address, self.remote_port
 
-    def bind(self, _address):
+    def bind(self, address):
         if not (self.state <= 1):
             raise OSError()
+        self.sockname = address
         self.state = 1
 
-    def listen(self, _backlog=5):
-        if not (self.state == 1):
+    def listen(self, backlog: Optional[int] = None):
+        if not (1 <= self.state <= 2):
             raise OSError
+        self.backlog = (_DEFAULT_BACKLOG if backlog is None
+                        else max(backlog, 1))
+        if self.clock is not None and self.state == 1:
+            self.next_arrival = self.clock.now
         self.state = 2
 
+    def setblocking(self, flag):
+        self.blocking = bool(flag)
+
+    def getsockname(self):
+        return self.sockname
+
     def close(self):
-        self.state = 3
+        with self._lock:
+            self.state = 3
+            if self._fileno >= 0:
+                self.fds.release(self._fileno)
+                self._fileno = -1
+
+    def _queue(self, c):
+        """ Queues an arriving connection or burst in the backlog """
+        queue = self.queue
+        self.arrivals += 1
+        burst = c if isinstance(c, list) else [c]
+        room = max(self.backlog - len(queue), 0)
+        self.dropped += max(len(burst) - room, 0)
+        queue.extend(burst[:room])
+        if len(queue) > self.peak:
+            self.peak = len(queue)
+
+    def _arrive(self) -> bool:
+        """ Queues the elements of the iterable that have arrived.
+
+        Without clock, the next element arrives if nothing is pending.
+
+        :return: True if a connection is pending
+        """
+        queue = self.queue
+        if self.clock is not None:
+            now = self.clock.now
+            while self.next_arrival is not None and self.next_arrival <= now:
+                c = next(self.accepted, _END)
+                if c is _END:
+                    self.next_arrival = None
+                    break
+                self.next_arrival += self.interval
+                if c is not None:
+                    self._queue(c)
+            return bool(queue)
+        if queue:
+            return True
+        c = next(self.accepted, None)
+        if c is None:
+            return False
+        self._queue(c)
+        return bool(queue)
 
     def accept(self):
-        if not (self.state == 2):
-            raise OSError
-        c = next(self.accepted, MockSocket())
-        if isinstance(c, Callable) and not isinstance(c, Mock):
-            c = c()
-        self.current += 1
-        return c, self._addr()
+        with self._lock:
+            if not (self.state == 2):
+                raise OSError
+            pending = self._arrive()
+            while not pending and self.blocking \
+                    and self.next_arrival is not None:
+                self.clock.advance_to(self.next_arrival)   # waits for it
+                pending = self._arrive()
+            if pending:
+                c = self.queue.popleft()
+                if isinstance(c, Callable) and not isinstance(c, Mock):
+                    try:
+                        c = c()
+                    except OSError:
+                        self.queue.appendleft(c)
+                        self.errors += 1
+                        raise
+            elif not self.blocking:
+                raise BlockingIOError
+            else:
+                c = MockSocket(fds=self.fds)
+            self.current += 1
+            return c, self._addr()
+
+    def ready_events(self) -> int:
+        """ Events for which the socket is ready (used by automatic mode)
+
+        A listening socket is ready when a connection is pending. Without
+        clock, a None element of the accepted iterable is consumed by this
+        method, so it only delays the readiness by one call.
+        """
+        with self._lock:
+            if self.state != 2:
+                return 0
+            return EVENT_READ if self._arrive() else 0
+
+    def pending(self) -> int:
+        """ Number of connections already queued in the backlog.
+
+        Unlike ready_events, this method has no side effect: the elements
+        of the accepted iterable that have not arrived yet are not counted.
+        """
+        return len(self.queue)
+
+    def ready_at(self, events: int) -> Optional[float]:
+        """ Virtual time of the next scheduled arrival """
+        with self._lock:
+            if self.state != 2 or not events & EVENT_READ:
+                return None
+            return self.next_arrival
 
     def fileno(self):
         return self._fileno
 
 
+class VirtualClock:
+    """ A virtual time source.
+
+    A VirtualClock object is callable and returns the current virtual time,
+    so it can be patched in place of time.monotonic or time.time. The
+    virtual time only changes when the clock is explicitly advanced, which
+    a MockSelector does on simulated timeouts and timed events.
+    """
+    __slots__ = ('now',)
+
+    def __init__(self, start: float = 0.0):
+        """
+        :param start: initial value of the virtual time
+        :type start: float
+        """
+        self.now = float(start)
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, delay: float):
+        """ Moves the virtual time forward by delay seconds. """
+        if delay > 0:
+            self.now += delay
+
+    def advance_to(self, when: float):
+        """ Moves the virtual time forward to when if it is in the future. """
+        if when > self.now:
+            self.now = when
+
+
+class SendWindow:
+    """ Model of the send buffer of a socket drained by a slow peer.
+
+    The window holds at most size bytes. The send calls of a socket using
+    it only accept the bytes that still fit, and the socket is only ready
+    for EVENT_WRITE while some room is available. The window is drained
+    either explicitly with the drain method, or at a constant rate (in
+    bytes per second) of the virtual time given by a clock, usually the
+    clock of the selector. The stalls attribute counts the send calls that
+    could not accept all their data.
+    """
+
+    def __init__(self, size: int = 65536, rate: Optional[float] = None,
+                 clock: Optional[VirtualClock] = None):
+        """
+        :param size: capacity of the window in bytes
+        :type size: int
+        :param rate: drain rate in bytes per second (no drain by default)
+        :type rate: float
+        :param clock: the clock driving the drain, required with a rate
+        :type clock: VirtualClock
+        """
+        if rate is not None and clock is None:
+            raise ValueError('a drain rate requires a clock')
+        self.size = size
+        self.rate = rate
+        self.clock = clock
+        self.pending = 0
+        self.accepted = 0
+        self.stalls = 0
+        self.last = 0.0 if clock is None else clock()
+
+    def _update(self):
+        if self.rate is None:
+            return
+        now = self.clock()
+        if self.pending:
+            # the epsilon absorbs the rounding of the times given by ready_at
+            n = min(self.pending, int((now - self.last) * self.rate + 1e-9))
+            self.pending -= n
+            if self.pending:
+                self.last += n / self.rate
+                return
+        self.last = now
+
+    def available(self) -> int:
+        """ Number of bytes that a send call would accept now """
+        self._update()
+        return self.size - self.pending
+
+    def drain(self, n: Optional[int] = None):
+        """ Simulates the peer reading n bytes (everything by default) """
+        self._update()
+        self.pending = 0 if n is None else max(0, self.pending - n)
+
+    def ready_at(self, n: int = 1) -> Optional[float]:
+        """ Virtual time at which n bytes will fit in the window.
+
+        None means that it will only happen after an explicit drain.
+        """
+        if self.rate is None:
+            if self.clock is None or n > self.available():
+                return None
+            return self.clock()
+        missing = n - self.available()
+        if missing <= 0:
+            return self.clock()
+        return self.last + missing / self.rate
+
+    def send(self, data, record: Optional[Callable] = None) -> int:
+        """ Accepts the bytes of data that fit in the window.
+
+        :param data: bytes-like object to send
+        :param record: optional callable receiving the accepted bytes
+        :return: the number of accepted bytes
+        :raise BlockingIOError: if the window is full
+        """
+        view = memoryview(data).cast('B')
+        if not view:
+            return 0
+        n = min(len(view), self.available())
+        if n < len(view):
+            self.stalls += 1
+        if n == 0:
+            raise BlockingIOError
+        self.pending += n
+        self.accepted += n
+        if record is not None:
+            record(view[:n])
+        return n
+
+    def sendall(self, data, record: Optional[Callable] = None):
+        """ Accepts all the bytes of data.
+
+        With a drain rate, the clock is advanced until all the data have
+        fit, as a blocking sendall would wait for the peer. Without one,
+        the bytes that fit are accepted and a BlockingIOError is raised, as
+        by a non blocking socket.
+
+        :param data: bytes-like object to send
+        :param record: optional callable receiving the accepted bytes
+        """
+        view = memoryview(data).cast('B')
+        while view:
+            n = min(len(view), self.available())
+            if n:
+                self.pending += n
+                self.accepted += n
+                if record is not None:
+                    record(view[:n])
+                view = view[n:]
+            elif self.rate is None:
+                self.stalls += 1
+                raise BlockingIOError
+            else:
+                self.clock.advance_to(self.ready_at(min(len(view),
+                                                        self.size)))
+
+
+class At:
+    """ An event of a MockSelector scheduled at a virtual timestamp.
+
+    The event can be any element accepted in the event list of a
+    MockSelector, including an empty iterable to simply wake up the selector
+    at the given time.
+    """
+    __slots__ = ('when', 'event')
+
+    def __init__(self, when: float, event):
+        """
+        :param when: virtual timestamp of the event
+        :type when: float
+        :param event: the event itself
+        """
+        self.when = when
+        self.event = event
+
+    def __repr__(self):
+        return 'At({!r}, {!r})'.format(self.when, self.event)
+
+
+class Burst:
+    """ An event of a MockSelector making many registered keys ready.
+
+    The keys are taken from the registry of the selector in fd order when
+    the Burst is reached, so a burst of thousands of connections does not
+    need to be written in the event list. Each key is returned with the
+    intersection of its registered events and the events of the Burst,
+    and the keys having none of them are skipped. With maxevents, a
+    select call returns at most maxevents keys, and the following calls
+    return the next ones, until the burst is exhausted.
+    """
+    __slots__ = ('events', 'count', 'maxevents', 'filter')
+
+    def __init__(self, events: int = EVENT_READ, count: Optional[int] = None,
+                 maxevents: Optional[int] = None,
+                 filter: Optional[Callable] = None):
+        """
+        :param events: the events of the keys (EVENT_READ by default)
+        :param count: number of keys in the burst (all the keys by default)
+        :param maxevents: maximum number of keys returned by a select call
+        :param filter: predicate selecting the keys of the burst
+        """
+        self.events = events
+        self.count = count
+        self.maxevents = maxevents
+        self.filter = filter
+
+    def __repr__(self):
+        return 'Burst({!r}, count={!r}, maxevents={!r})'.format(
+            self.events, self.count, self.maxevents)
+
+
+class _BurstRest:
+    """ Remaining keys of a Burst capped by maxevents """
+    __slots__ = ('burst', 'start', 'count')
+
+    def __init__(self, burst: Burst, start: int, count: Optional[int]):
+        self.burst = burst
+        self.start = start
+        self.count = count
+
+
+class _FdTable(collections.abc.MutableMapping):
+    """ Dense fd to key table used by MockSelector.
+
+    The keys are stored in a list indexed by fd. As the mock fds are
+    allocated from the lowest available number, the list stays small and
+    all the operations are O(1).
+    """
+    __slots__ = ('table', 'count')
+
+    def __init__(self):
+        self.table = []
+        self.count = 0
+
+    def __getitem__(self, fd):
+        key = self.get(fd)
+        if key is None:
+            raise KeyError(fd)
+        return key
+
+    def get(self, fd, default=None):
+        if 0 <= fd < len(self.table):
+            key = self.table[fd]
+            if key is not None:
+                return key
+        return default
+
+    def __setitem__(self, fd, key):
+        table = self.table
+        if fd >= len(table):
+            table.extend([None] * (fd + 1 - len(table)))
+        if table[fd] is None:
+            self.count += 1
+        table[fd] = key
+
+    def __delitem__(self, fd):
+        self[fd]   # raises a KeyError for an unknown fd
+        self.table[fd] = None
+        self.count -= 1
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return (key.fd for key in self.values())
+
+    def values(self):
+        return (key for key in self.table if key is not None)
+
+    def clear(self):
+        self.table = []
+        self.count = 0
+
+
 # noinspection PyProtectedMember
 class MockSelector(selectors._BaseSelectorImpl):
     """ BaseSelector subclass to help building tests on TCP servers.
@@ -160,6 +984,44 @@ class MockSelector(selectors._BaseSelectorImpl):
     will return a corresponding list of (key, event) pairs. As a special
     case, an empty iterable will simulate a timeout on the selector by
      returning an empty list.
+
+    A Burst element makes many registered keys ready at once, taking them
+    from the registry instead of the event list.
+
+    An element can also be an At object to deliver its event at a given
+    virtual timestamp. The selector owns a VirtualClock (which can be
+    shared with other objects) that advances up to that timestamp, or by
+    the timeout of select if the timeout expires first. A simulated timeout
+    also advances the clock by the timeout of the select call.
+
+    Alternatively, a MockSelector created with a scheduling policy (see
+    the mockselector.policies module) and no event list works in automatic
+    mode: the ready events are derived from the ready_events method of the
+    registered objects, and the policy decides which of them are returned
+    by each select call. When nothing is ready, the clock advances to the
+    time at which an object will be ready (given by its optional ready_at
+    method, as for a socket using a SendWindow) if the timeout does not
+    expire first. Otherwise it advances by the timeout or, if there is no
+    timeout, the EndException is raised.
+
+    The registered keys are stored in a dense table indexed by fd. The fds
+    of the mock sockets come from an FdAllocator: the selector uses its
+    fds allocator (the global one by default) to find the mock socket
+    behind a plain fd registered in automatic mode.
+
+    In skip_polls mode, a select call with a null timeout (a poll) returns
+    an empty list without consuming an event. This is the mode used by
+    an asyncio event loop, which polls its selector whenever it has ready
+    callbacks.
+
+    A MockSelector can be used from several threads: its methods are
+    serialized by a reentrant lock, which can be replaced for example by a
+    mockselector.threads.CountingLock to measure the contention. The
+    callables of the before_select list are called at the beginning of
+    each select call, before the lock is acquired, and those of the
+    after_select list receive the list of (key, events) pairs just before
+    it is returned. An after_select hook returning a list replaces the
+    result for the next hooks and for the caller.
     """
 
     class EndException(BaseException):
@@ -172,10 +1034,61 @@ class MockSelector(selectors._BaseSelectorImpl):
         """
         pass
 
-    def __init__(self, event_list: Iterable = None):
+    def __init__(self, event_list: Iterable = None, *,
+                 skip_polls: bool = False,
+                 clock: Optional[VirtualClock] = None,
+                 policy: Optional[Callable] = None,
+                 fds: Optional[FdAllocator] = None,
+                 lock=None):
         event_list = [] if event_list is None else event_list
-        self.iter_event = iter(event_list)
+        self.skip_polls = skip_polls
+        self.before_select = []
+        self.after_select = []
+        self._lock = threading.RLock() if lock is None else lock
+        self.policy = policy
+        self.fds = _default_fds if fds is None else fds
+        self.clock = VirtualClock() if clock is None else clock
+        self._pending = None
+        if isinstance(event_list, collections.abc.Sequence):
+            # a sequence has no side effect and can be compiled at once
+            self.iter_event = iter([self._compile(ev) for ev in event_list])
+        else:
+            self.iter_event = map(self._compile, event_list)
         super().__init__()
+        self._fd_to_key = _FdTable()
+
+    @staticmethod
+    def _compile(ev):
+        """ Compiles one element of the event list.
+
+        The result is a tuple of (fileobj, fd, event) triples, or an At
+        object containing such a tuple. The fd is only a hint used to find
+        the key without going through get_map, because the fileobj does not
+        need to be registered yet.
+
+        :param ev: an element of the event list
+        :return: the compiled form of the element
+        """
+        if isinstance(ev, At):
+            return At(ev.when, MockSelector._compile(ev.event))
+        if isinstance(ev, Burst):
+            return ev
+        if (not isinstance(ev, collections.abc.Iterable)
+                or (isinstance(ev, collections.abc.Sequence)
+                    and len(ev) == 2 and isinstance(ev[1], int))):
+            ev = (ev,)
+        compiled = []
+        for e in ev:
+            if isinstance(e, tuple):
+                sock, event = e
+            else:
+                sock, event = e, EVENT_READ
+            try:
+                fd = sock if isinstance(sock, int) else int(sock.fileno())
+            except (AttributeError, TypeError, ValueError):
+                fd = -1
+            compiled.append((sock, fd, event))
+        return tuple(compiled)
 
     def __enter__(self):
         return self
@@ -185,24 +1098,122 @@ class MockSelector(selectors._BaseSelectorImpl):
             return True
         return False
 
-    def select(self, _timeout: Optional[float] = ...) -> List[Tuple[SelectorKey, int]]:
-        try:
-            ev = next(self.iter_event)
-        except StopIteration as e:
-            raise MockSelector.EndException(self) from e
-        if not isinstance(ev, collections.abc.Iterable):
-            ev = (ev,)
-        try:
-            if isinstance(ev[1], int):
-                ev = (ev,)
-        except (KeyError, IndexError):
-            pass
+    def register(self, fileobj, events, data=None):
+        with self._lock:
+            return super().register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+        with self._lock:
+            return super().unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        with self._lock:
+            return super().modify(fileobj, events, data)
+
+    def close(self):
+        with self._lock:
+            super().close()
+
+    def select(self, timeout: Optional[float] = None) -> List[Tuple[SelectorKey, int]]:
+        for hook in self.before_select:
+            hook()
+        with self._lock:
+            ready = self._select(timeout)
+        for hook in self.after_select:
+            res = hook(ready)
+            if res is not None:
+                ready = res
+        return ready
+
+    def _select(self, timeout: Optional[float]) -> List[Tuple[SelectorKey, int]]:
+        if self.skip_polls and timeout is not None and timeout <= 0:
+            return []
+        if self.policy is not None:
+            return self._auto_select(timeout)
+        ev = self._pending
+        if ev is None:
+            try:
+                ev = next(self.iter_event)
+            except StopIteration as e:
+                raise MockSelector.EndException(self) from e
+        else:
+            self._pending = None
+        clock = self.clock
+        if type(ev) is At:
+            if (timeout is not None and ev.when > clock.now + timeout):
+                clock.advance(timeout)
+                self._pending = ev
+                return []
+            clock.advance_to(ev.when)
+            ev = ev.event
+        elif not ev and timeout is not None:
+            clock.advance(timeout)
+        if type(ev) is Burst:
+            return self._burst(ev, 0, ev.count)
+        if type(ev) is _BurstRest:
+            return self._burst(ev.burst, ev.start, ev.count)
+        fd_to_key = self._fd_to_key
         kevs = []
-        for e in ev:
-            if isinstance(e, tuple):
-                sock, event = e
-            else:
-                sock, event = e, EVENT_READ
-            k = self.get_map()[sock]
+        for sock, fd, event in ev:
+            k = fd_to_key.get(fd)
+            if k is None or k.fileobj is not sock:
+                k = self.get_map()[sock]
             kevs.append((k, event))
         return kevs
+
+    def _burst(self, burst: Burst, start: int,
+               count: Optional[int]) -> List[Tuple[SelectorKey, int]]:
+        """ Returns the keys of a burst, starting at fd start """
+        table = self._fd_to_key.table
+        mask, accept = burst.events, burst.filter
+        limit = burst.maxevents
+        if count is not None and (limit is None or count < limit):
+            limit = count
+        kevs = []
+        for fd in range(start, len(table)):
+            key = table[fd]
+            if key is None or not key.events & mask or (
+                    accept is not None and not accept(key)):
+                continue
+            if limit is not None and len(kevs) >= limit:
+                if count is None or len(kevs) < count:
+                    # capped by maxevents: the next select resumes here
+                    self._pending = _BurstRest(
+                        burst, fd,
+                        None if count is None else count - len(kevs))
+                break
+            kevs.append((key, key.events & mask))
+        return kevs
+
+    def _auto_select(self, timeout: Optional[float]) -> List[Tuple[SelectorKey, int]]:
+        clock = self.clock
+        deadline = None if timeout is None else clock.now + timeout
+        while True:
+            ready = []
+            wake = None
+            for key in self._fd_to_key.values():
+                fileobj = key.fileobj
+                if isinstance(fileobj, int):
+                    fileobj = self.fds.get(fileobj)
+                ready_events = getattr(fileobj, 'ready_events', None)
+                if ready_events is not None:
+                    events = key.events & ready_events()
+                    if events:
+                        ready.append((key, events))
+                    elif not ready:
+                        # objects may know when they will become ready
+                        ready_at = getattr(fileobj, 'ready_at', None)
+                        when = (None if ready_at is None
+                                else ready_at(key.events))
+                        if when is not None and (wake is None or when < wake):
+                            wake = when
+            if ready:
+                return self.policy(ready)
+            if (wake is None or wake <= clock.now
+                    or (deadline is not None and wake > deadline)):
+                break
+            clock.advance_to(wake)
+        if deadline is None:
+            raise MockSelector.EndException(self)
+        clock.advance_to(deadline)
+        return []
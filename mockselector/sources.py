@@ -0,0 +1,93 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+""" Lazy data sources for the recvs iterable of the mock sockets.
+
+The recvs iterable of a MockSocket or a FastSocket is only consumed when
+the previous byte string has been fully read, and the unread part of a
+byte string is never copied. So any iterator can feed a socket with
+constant memory, provided it never yields an empty chunk (that would be
+read as an end of stream). This module gives such iterators for files:
+
+- file_source reads a file in chunks
+- mmap_source serves a memory mapped file without copying it
+
+A plain generator of byte strings can also be used directly, and the
+sources can be combined with itertools.chain, for example to send the
+headers of a request before a large body.
+"""
+
+import io
+import mmap
+import os
+from typing import Iterator, Optional
+
+
+def _is_path(file) -> bool:
+    return isinstance(file, (str, bytes)) or hasattr(file, '__fspath__')
+
+
+def file_source(file, chunk_size: int = 1 << 16, offset: int = 0,
+                length: Optional[int] = None) -> Iterator[bytes]:
+    """ Reads a file lazily in chunks.
+
+    A file given as a path is opened when the first chunk is requested
+    and closed when the source is exhausted.
+
+    :param file: path or binary file object
+    :param chunk_size: maximum size of a chunk
+    :param offset: position of the first byte to read
+    :param length: number of bytes to read (up to the end by default)
+    """
+    if _is_path(file):
+        with open(file, 'rb') as fd:
+            yield from file_source(fd, chunk_size, offset, length)
+        return
+    if offset:
+        file.seek(offset)
+    while length is None or length > 0:
+        size = chunk_size if length is None else min(chunk_size, length)
+        data = file.read(size)
+        if not data:
+            return
+        if length is not None:
+            length -= len(data)
+        yield data
+
+
+def mmap_source(file, offset: int = 0, length: Optional[int] = None,
+                chunk_size: Optional[int] = None) -> Iterator[memoryview]:
+    """ Serves a memory mapped file as memoryview slices.
+
+    Nothing is copied: the pages are loaded by the operating system when
+    they are read and only the fragments returned by the receive calls are
+    copied.
+
+    :param file: path, binary file object, or an object supporting the
+     buffer protocol such as an existing mmap. An in-memory file such as
+     a BytesIO is served from its buffer (or its content if it has none)
+    :param offset: position of the first byte
+    :param length: number of bytes (up to the end by default)
+    :param chunk_size: maximum size of a slice (the whole region is a
+     single slice by default)
+    """
+    if _is_path(file):
+        with open(file, 'rb') as fd:
+            yield from mmap_source(fd, offset, length, chunk_size)
+        return
+    if hasattr(file, 'fileno') and not isinstance(file, mmap.mmap):
+        try:
+            fd = file.fileno()
+        except io.UnsupportedOperation:     # an in-memory file
+            fd = None
+        if fd is None:
+            file = (file.getbuffer() if hasattr(file, 'getbuffer')
+                    else file.read())
+        elif os.fstat(fd).st_size == 0:
+            return       # an empty file cannot be mapped
+        else:
+            file = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    view = memoryview(file).cast('B')
+    end = len(view) if length is None else min(len(view), offset + length)
+    step = end - offset if chunk_size is None else chunk_size
+    for pos in range(offset, end, max(step, 1)):
+        yield view[pos:min(pos + step, end)]
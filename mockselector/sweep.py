@@ -0,0 +1,205 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+""" Parallel sweeps of randomized scenarios.
+
+Usage: python -m mockselector.sweep module:factory [options]
+
+A scenario factory is a function receiving a seed and keyword parameters.
+It builds the mock objects (for example a MockSelector with a
+RandomPolicy seeded with the seed), runs the server and checks the
+results, raising an exception (usually an AssertionError) on failure.
+
+The seeds are spread over the processes of a ProcessPoolExecutor, so the
+factory must be importable at the module level of the worker processes.
+For each seed, the outcome and the run time are collected. The failing
+scenarios are then shrunk: their integer parameters are reduced as long
+as the scenario still fails with the same seed, which gives the smallest
+reproduction found.
+"""
+
+import argparse
+import concurrent.futures
+import functools
+import json
+import os
+import sys
+import time
+from typing import Callable, Iterable, List, Optional
+
+from .bench import load_server
+from .selector import MockSelector
+
+
+def run_scenario(factory: Callable, seed: int,
+                 params: Optional[dict] = None) -> dict:
+    """ Runs one scenario and returns its outcome as a dict """
+    params = {} if params is None else params
+    error = None
+    start = time.perf_counter()
+    try:
+        factory(seed, **params)
+    except (Exception, MockSelector.EndException) as e:
+        error = '{}: {}'.format(type(e).__name__, e)
+    return {
+        'seed': seed,
+        'params': params,
+        'passed': error is None,
+        'error': error,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def _smaller(value: int) -> List[int]:
+    """ Candidate values to shrink a positive integer, smallest first """
+    return sorted({0, value // 2, value - 1} - {value})
+
+
+def _same_failure(res: dict, original: str, same_message: bool) -> bool:
+    """ Tells whether a scenario outcome shows the original failure """
+    if res['passed']:
+        return False
+    if same_message:
+        return res['error'] == original
+    return res['error'].split(':', 1)[0] == original.split(':', 1)[0]
+
+
+def shrink(factory: Callable, seed: int, params: dict,
+           max_runs: int = 100, same_message: bool = False) -> dict:
+    """ Reduces the integer parameters of a failing scenario.
+
+    Each parameter is tried with smaller values, keeping the first one
+    for which the scenario still fails with the same exception type, until
+    no parameter can be reduced or max_runs scenarios have been run. A
+    smaller scenario failing for another reason shows another bug and is
+    not kept.
+
+    :param same_message: if true, the exception message must also match
+
+    :return: the outcome of the smallest failing scenario found, with the
+     number of scenarios run in shrink_runs
+    """
+    best = run_scenario(factory, seed, params)
+    runs = 1
+    original = best['error']
+    changed = not best['passed']
+    while changed and runs < max_runs:
+        changed = False
+        for name, value in sorted(best['params'].items()):
+            if type(value) is not int or value <= 0:
+                continue
+            for candidate in _smaller(value):
+                trial = dict(best['params'])
+                trial[name] = candidate
+                res = run_scenario(factory, seed, trial)
+                runs += 1
+                if _same_failure(res, original, same_message):
+                    best = res
+                    changed = True
+                    break
+                if runs >= max_runs:
+                    break
+            if runs >= max_runs:
+                break
+    best['shrink_runs'] = runs
+    return best
+
+
+def sweep(factory: Callable, seeds: Iterable[int],
+          params: Optional[dict] = None, workers: Optional[int] = None,
+          max_shrinks: int = 5, max_runs: int = 100) -> dict:
+    """ Runs a scenario for many seeds in a process pool.
+
+    :param factory: the scenario factory
+    :param seeds: the seeds to run
+    :param params: keyword parameters given to the factory
+    :param workers: number of processes (the number of CPUs by default),
+     0 running everything in the current process
+    :param max_shrinks: maximum number of failing scenarios to shrink
+    :param max_runs: maximum number of runs to shrink one scenario
+    :return: the results as a dict
+    """
+    seeds = list(seeds)
+    params = {} if params is None else dict(params)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    start = time.perf_counter()
+    run = functools.partial(run_scenario, factory, params=params)
+    if workers == 0:
+        results = [run(seed) for seed in seeds]
+        failures = [r for r in results if not r['passed']]
+        shrunk = [shrink(factory, r['seed'], params, max_runs)
+                  for r in failures[:max_shrinks]]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            chunksize = max(1, len(seeds) // (workers * 8))
+            results = list(executor.map(run, seeds, chunksize=chunksize))
+            failures = [r for r in results if not r['passed']]
+            shrunk = list(executor.map(
+                functools.partial(shrink, factory, params=params,
+                                  max_runs=max_runs),
+                [r['seed'] for r in failures[:max_shrinks]]))
+    elapsed = time.perf_counter() - start
+    times = [r['seconds'] for r in results]
+    return {
+        'scenario': '{}.{}'.format(factory.__module__, factory.__qualname__),
+        'params': params,
+        'workers': workers,
+        'seeds': len(seeds),
+        'passed': len(results) - len(failures),
+        'failed': len(failures),
+        'seconds': elapsed,
+        'scenario_seconds': {
+            'total': sum(times),
+            'mean': sum(times) / len(times) if times else 0.0,
+            'max': max(times, default=0.0),
+        },
+        'results': results,
+        'shrunk': shrunk,
+    }
+
+
+def _param(text: str):
+    """ Parses a name=value option, the value being JSON if possible """
+    name, _, value = text.partition('=')
+    try:
+        return name, json.loads(value)
+    except ValueError:
+        return name, value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m mockselector.sweep',
+        description='Run a randomized scenario for many seeds')
+    parser.add_argument('scenario',
+                        help='scenario factory as module:function, called'
+                             ' with a seed and the parameters')
+    parser.add_argument('--seeds', type=int, default=1000,
+                        help='number of seeds')
+    parser.add_argument('--start', type=int, default=0, help='first seed')
+    parser.add_argument('-p', '--param', type=_param, action='append',
+                        default=[], help='parameter as name=value')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='number of processes (default: CPU count)')
+    parser.add_argument('--shrink', type=int, default=5,
+                        help='maximum number of failures to shrink')
+    parser.add_argument('-o', '--output', help='JSON file for the results')
+    args = parser.parse_args(argv)
+    res = sweep(load_server(args.scenario),
+                range(args.start, args.start + args.seeds),
+                dict(args.param), args.workers, args.shrink)
+    print('{} seeds: {} passed, {} failed in {:.2f} s ({:.2f} s of'
+          ' scenarios)'.format(res['seeds'], res['passed'], res['failed'],
+                               res['seconds'],
+                               res['scenario_seconds']['total']))
+    for r in res['shrunk']:
+        print('seed {} {}: {}'.format(r['seed'], json.dumps(r['params']),
+                                      r['error']))
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump(res, fd, indent=2)
+    return res
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
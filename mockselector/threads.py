@@ -0,0 +1,200 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+""" Tools for multi-threaded servers running under MockSelector.
+
+- CountingLock measures the contention on a lock, for example the lock of
+  a MockSelector used by several threads
+- SerialExecutor is a deterministic replacement for a ThreadPoolExecutor:
+  the submitted tasks run in order in the selector thread, before the next
+  select call
+- run_threads and scaling run a server in several selector threads and
+  measure its throughput
+"""
+
+import collections
+import platform
+import threading
+import time
+from concurrent.futures import Executor, Future
+from typing import Callable, Iterable, List, Optional
+
+from . import __version__
+from .bench import workload
+from .selector import MockSelector
+
+
+class CountingLock:
+    """ Lock wrapper counting the acquisitions and the contended ones.
+
+    A contended acquisition is one that had to wait for another thread,
+    and wait_time is the total time spent waiting, in seconds. The wrapped
+    lock is a reentrant one by default, as the lock of a MockSelector.
+    """
+
+    def __init__(self, lock=None):
+        """
+        :param lock: the lock to wrap (a new RLock by default)
+        """
+        self.lock = threading.RLock() if lock is None else lock
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_time = 0.0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if self.lock.acquire(False):
+            self.acquisitions += 1
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        if not self.lock.acquire(True, timeout):
+            return False
+        # the counters are only updated while holding the lock
+        self.acquisitions += 1
+        self.contended += 1
+        self.wait_time += time.perf_counter() - start
+        return True
+
+    def release(self):
+        self.lock.release()
+
+    __enter__ = acquire
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def stats(self) -> dict:
+        return {
+            'acquisitions': self.acquisitions,
+            'contended': self.contended,
+            'wait_time': self.wait_time,
+        }
+
+
+class SerialExecutor(Executor):
+    """ Executor running the submitted tasks in order in a single thread.
+
+    The tasks are queued by submit and run by run_pending. When the
+    executor is attached to a MockSelector, run_pending is called at the
+    beginning of each select call, so that the hand-offs of a selector
+    thread to a worker pool always happen in the same order, and are
+    completed before the next events are delivered.
+    """
+
+    def __init__(self, selector: Optional[MockSelector] = None):
+        """
+        :param selector: the selector to attach the executor to
+        :type selector: MockSelector
+        """
+        self.pending = collections.deque()
+        self._shutdown = False
+        if selector is not None:
+            selector.before_select.append(self.run_pending)
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        if self._shutdown:
+            raise RuntimeError('cannot schedule new futures after shutdown')
+        future = Future()
+        self.pending.append((future, fn, args, kwargs))
+        return future
+
+    def run_pending(self):
+        """ Runs the pending tasks, including those they submit """
+        while self.pending:
+            future, fn, args, kwargs = self.pending.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        self._shutdown = True
+        if cancel_futures:
+            for future, _, _, _ in self.pending:
+                future.cancel()
+        if wait:
+            self.run_pending()
+
+
+def run_threads(server: Callable, workloads: Iterable) -> float:
+    """ Runs a server in one thread per workload.
+
+    All the threads start together, and the exception raised by a server,
+    if any, is raised again once all the threads have ended.
+
+    :param server: callable running a server loop on a listening socket
+     and a selector (it receives them as parameters)
+    :param workloads: iterable of (listening socket, selector) pairs
+    :return: the elapsed time in seconds
+    """
+    workloads = list(workloads)
+    barrier = threading.Barrier(len(workloads) + 1)
+    errors = []
+
+    def target(s, sel):
+        barrier.wait()
+        try:
+            with sel:
+                server(s, sel)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=target, args=w) for w in workloads]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise errors[0]
+    return elapsed
+
+
+def scaling(server: Callable, threads: List[int], clients: int = 100,
+            size: int = 64, batch: int = 10, messages: int = 10) -> dict:
+    """ Measures the throughput of a server for several numbers of threads.
+
+    Each thread runs the server on its own workload (see
+    mockselector.bench.workload), with a selector protected by a
+    CountingLock. The contention of the worker threads of the server on
+    the selectors is thus reported along with the throughput.
+
+    :return: the results as a dict, in the format of mockselector.bench
+    """
+    results = []
+    base = None
+    for n in threads:
+        locks = [CountingLock() for _ in range(n)]
+        workloads = [workload(clients, size, batch, messages, lock=lock)
+                     for lock in locks]
+        events = sum(w[3] for w in workloads)
+        elapsed = run_threads(server, (w[:2] for w in workloads))
+        rate = events / elapsed
+        if base is None:
+            base = rate / n
+        results.append({
+            'threads': n,
+            'events': events,
+            'seconds': elapsed,
+            'events_per_sec': rate,
+            'speedup': rate / base,
+            'lock_acquisitions': sum(lock.acquisitions for lock in locks),
+            'lock_contended': sum(lock.contended for lock in locks),
+            'lock_wait_time': sum(lock.wait_time for lock in locks),
+        })
+    return {
+        'mockselector': __version__,
+        'python': platform.python_version(),
+        'server': '{}.{}'.format(server.__module__, server.__qualname__),
+        'clients': clients,
+        'size': size,
+        'batch': batch,
+        'messages': messages,
+        'results': results,
+    }
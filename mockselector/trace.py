@@ -0,0 +1,277 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+""" Record real selector traffic into trace files and replay them.
+
+A trace file starts with a magic string followed by records made of a
+one byte type and a little endian payload:
+
+- L (listen): fd of a listening socket
+- S (select): timestamp (double), number of events, then for each event
+  the fd and the event mask (one byte)
+- A (accept): fd of the listening socket and fd of the new socket
+- R (recv): fd, length and received bytes
+
+Timestamps are relative to the creation of the recording selector.
+"""
+
+import mmap
+import selectors
+import socket
+import struct
+import time
+from typing import Callable, Dict, Optional
+
+from .load import _Feed
+from .selector import At, FastSocket, ListenSocket, MockSelector, \
+    VirtualClock
+
+MAGIC = b'MSTRACE1'
+
+_FD = struct.Struct('<I')
+_SELECT = struct.Struct('<dI')
+_EVENT = struct.Struct('<IB')
+_PAIR = struct.Struct('<II')
+
+
+class TraceWriter:
+    """ Low level writer of trace records on a binary file. """
+
+    def __init__(self, file):
+        """
+        :param file: path or binary file object opened for writing
+        """
+        if isinstance(file, (str, bytes)) or hasattr(file, '__fspath__'):
+            file = open(file, 'wb')
+        self.file = file
+        self.file.write(MAGIC)
+
+    def listen(self, fd: int):
+        self.file.write(b'L' + _FD.pack(fd))
+
+    def select(self, timestamp: float, events):
+        self.file.write(b'S' + _SELECT.pack(timestamp, len(events))
+                        + b''.join(_EVENT.pack(fd, mask)
+                                   for fd, mask in events))
+
+    def accept(self, listen_fd: int, fd: int):
+        self.file.write(b'A' + _PAIR.pack(listen_fd, fd))
+
+    def recv(self, fd: int, data):
+        self.file.write(b'R' + _PAIR.pack(fd, len(data)))
+        self.file.write(data)
+
+    def close(self):
+        self.file.close()
+
+
+class RecordingSocket:
+    """ Wrapper around a real socket recording accept and receive calls.
+
+    Any other attribute is delegated to the wrapped socket. The sockets
+    returned by accept are wrapped too. Only the data of the recvmsg and
+    recvmsg_into calls are recorded, not their ancillary data.
+    """
+
+    def __init__(self, sock: socket.socket, writer: TraceWriter):
+        self.sock = sock
+        self.writer = writer
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+    def accept(self):
+        conn, address = self.sock.accept()
+        self.writer.accept(self.sock.fileno(), conn.fileno())
+        return RecordingSocket(conn, self.writer), address
+
+    def recv(self, size, flags=0):
+        data = self.sock.recv(size, flags)
+        self.writer.recv(self.sock.fileno(), data)
+        return data
+
+    def recv_into(self, buffer, nbytes=0, flags=0):
+        n = self.sock.recv_into(buffer, nbytes, flags)
+        self.writer.recv(self.sock.fileno(), memoryview(buffer)[:n])
+        return n
+
+    def recvmsg(self, bufsize, ancbufsize=0, flags=0):
+        res = self.sock.recvmsg(bufsize, ancbufsize, flags)
+        self.writer.recv(self.sock.fileno(), res[0])
+        return res
+
+    def recvmsg_into(self, buffers, ancbufsize=0, flags=0):
+        buffers = list(buffers)
+        res = self.sock.recvmsg_into(buffers, ancbufsize, flags)
+        remain = res[0]
+        chunks = []
+        for buffer in buffers:
+            if not remain:
+                break
+            chunk = memoryview(buffer).cast('B')[:remain]
+            chunks.append(chunk)
+            remain -= len(chunk)
+        self.writer.recv(self.sock.fileno(), b''.join(chunks))
+        return res
+
+
+class RecordingSelector(selectors.BaseSelector):
+    """ Selector wrapper recording the results of select in a trace.
+
+    The listening sockets must be wrapped with the wrap method before
+    being registered, and the sockets they accept are then recorded too:
+
+        sel = RecordingSelector('server.trace')
+        s = sel.wrap(socket.socket())
+    """
+
+    def __init__(self, trace, selector: Optional[selectors.BaseSelector] = None):
+        """
+        :param trace: path or binary file object for the trace
+        :param selector: the real selector (a DefaultSelector by default)
+        """
+        self.writer = TraceWriter(trace)
+        self.selector = (selectors.DefaultSelector() if selector is None
+                         else selector)
+        self.start = time.monotonic()
+
+    def wrap(self, sock: socket.socket) -> RecordingSocket:
+        """ Wraps a listening socket to record its connections """
+        self.writer.listen(sock.fileno())
+        return RecordingSocket(sock, self.writer)
+
+    def register(self, fileobj, events, data=None):
+        return self.selector.register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+        return self.selector.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        return self.selector.modify(fileobj, events, data)
+
+    def select(self, timeout=None):
+        ready = self.selector.select(timeout)
+        self.writer.select(time.monotonic() - self.start,
+                           [(key.fd, mask) for key, mask in ready])
+        return ready
+
+    def get_map(self):
+        return self.selector.get_map()
+
+    def close(self):
+        self.selector.close()
+        self.writer.close()
+
+
+class Replay:
+    """ Rebuilds the mock objects equivalent to a trace file.
+
+    The listening sockets of the trace are available as ListenSocket
+    objects in listen_sockets (indexed by their recorded fd): at once for
+    the ones recorded before the first select call, and when the selector
+    reaches their record for the others. The events are replayed by
+    selector. The trace is memory mapped and read sequentially as the
+    selector consumes events, and the received data are fed to the mock
+    sockets as memoryview slices of the mapping, so a trace is never loaded
+    in memory.
+
+    The select events are At events using the recorded timestamps.
+
+    A Replay is a context manager closing it on exit. The mapping is only
+    unmapped once the slices fed to the mock sockets are released.
+    """
+
+    def __init__(self, path, socket_factory: Callable = FastSocket,
+                 clock: Optional[VirtualClock] = None):
+        """
+        :param path: path of the trace file
+        :param socket_factory: class or callable building a socket from
+         the iterable of its received byte strings
+        :param clock: the clock to be used by the selector
+        """
+        with open(path, 'rb') as fd:
+            self._map = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = memoryview(self._map)
+        if self.data[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError('{} is not a trace file'.format(path))
+        self.pos = len(MAGIC)
+        self.socket_factory = socket_factory
+        self.listen_sockets = {}    # type: Dict[int, ListenSocket]
+        self._feeds = {}
+        self._sockets = {}
+        while self.data[self.pos:self.pos + 1] == b'L':
+            self.pos = self._listen(self.pos)
+        self.selector = MockSelector(self._events(), clock=clock)
+
+    def close(self):
+        """ Releases the mapping of the trace file """
+        self.data.release()
+        try:
+            self._map.close()
+        except BufferError:
+            pass    # unmapped when the last slice is released
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    @property
+    def listen_socket(self) -> ListenSocket:
+        """ The listening socket of a trace using only one """
+        sock, = self.listen_sockets.values()
+        return sock
+
+    def _socket(self, fd: int):
+        sock = self.listen_sockets.get(fd)
+        return self._sockets[fd] if sock is None else sock
+
+    def _listen(self, pos: int) -> int:
+        """ Processes a L record, returns the position of the next one """
+        fd, = _FD.unpack_from(self.data, pos + 1)
+        feed = _Feed()
+        self._feeds[fd] = feed
+        self.listen_sockets[fd] = ListenSocket(feed)
+        return pos + 1 + _FD.size
+
+    def _events(self):
+        data = self.data
+        end = len(data)
+        pos = self.pos
+        while pos < end:
+            kind = data[pos]
+            if kind != ord('S'):
+                raise ValueError('Unexpected record at {}'.format(pos))
+            timestamp, n = _SELECT.unpack_from(data, pos + 1)
+            pos += 1 + _SELECT.size
+            events = []
+            for _ in range(n):
+                fd, mask = _EVENT.unpack_from(data, pos)
+                pos += _EVENT.size
+                events.append((self._socket(fd), mask))
+            # process what the server received while handling the events
+            while pos < end and data[pos] != ord('S'):
+                kind = data[pos]
+                if kind == ord('A'):
+                    listen_fd, fd = _PAIR.unpack_from(data, pos + 1)
+                    pos += 1 + _PAIR.size
+                    feed = _Feed()
+                    sock = self.socket_factory(feed)
+                    self._feeds[fd] = feed
+                    self._sockets[fd] = sock
+                    self._feeds[listen_fd].queue.append(sock)
+                elif kind == ord('R'):
+                    fd, size = _PAIR.unpack_from(data, pos + 1)
+                    pos += 1 + _PAIR.size
+                    feed = self._feeds[fd]
+                    feed.queue.append(data[pos:pos + size])
+                    pos += size
+                    if size == 0:
+                        feed.done = True
+                elif kind == ord('L'):
+                    pos = self._listen(pos)
+                else:
+                    raise ValueError('Unexpected record at {}'.format(pos))
+            yield At(timestamp, tuple(events))
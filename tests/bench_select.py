@@ -0,0 +1,89 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+""" Measures the overhead of MockSelector.select.
+
+The compiled schedule of MockSelector is compared with the legacy
+implementation that parsed every event at each select call. Run it with:
+
+    python -m tests.bench_select [nb_events]
+"""
+
+import collections.abc
+import sys
+import timeit
+from selectors import EVENT_READ, EVENT_WRITE
+
+from mockselector import MockSelector, FastSocket
+
+
+class LegacySelector(MockSelector):
+    """ MockSelector using the select implementation of version 0.1 """
+
+    def __init__(self, event_list):
+        super().__init__()
+        self.iter_event = iter(event_list)
+
+    def select(self, _timeout=...):
+        try:
+            ev = next(self.iter_event)
+        except StopIteration as e:
+            raise MockSelector.EndException(self) from e
+        if not isinstance(ev, collections.abc.Iterable):
+            ev = (ev,)
+        try:
+            if isinstance(ev[1], int):
+                ev = (ev,)
+        except (KeyError, IndexError):
+            pass
+        kevs = []
+        for e in ev:
+            if isinstance(e, tuple):
+                sock, event = e
+            else:
+                sock, event = e, EVENT_READ
+            k = self.get_map()[sock]
+            kevs.append((k, event))
+        return kevs
+
+
+def script(socks, n):
+    """ Builds a script of n events mixing the 3 event forms """
+    events = []
+    for i in range(n):
+        c = socks[i % len(socks)]
+        kind = i % 3
+        if kind == 0:
+            events.append(c)
+        elif kind == 1:
+            events.append((c, EVENT_WRITE))
+        else:
+            events.append((c, socks[(i + 1) % len(socks)]))
+    return events
+
+
+def run(cls, socks, events):
+    """ Returns the time needed to consume all the events """
+    sel = cls(events)
+    for c in socks:
+        sel.register(c, EVENT_READ | EVENT_WRITE)
+    select = sel.select
+    n = len(events)
+
+    def loop():
+        for _ in range(n):
+            select()
+    return timeit.timeit(loop, number=1)
+
+
+def main(n=200000):
+    socks = [FastSocket() for _ in range(100)]
+    events = script(socks, n)
+    for name, cls in (('legacy', LegacySelector),
+                      ('compiled', MockSelector)):
+        # the construction (and thus the compilation) is not measured
+        best = min(run(cls, socks, events) for _ in range(3))
+        print('{:10} {:8.0f} ns per select'.format(name, best / n * 1e9))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,13 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+""" Test doubles shared by the test modules """
+
+
+class FakeTimer:
+    """ Timer advancing by one millisecond per call """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += 0.001
+        return self.now
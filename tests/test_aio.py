@@ -0,0 +1,121 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+import asyncio
+import unittest
+from mockselector import MockSocket, MockSelector, ListenSocket, FastSocket, \
+    At
+from mockselector.aio import MockEventLoop, run
+from mockselector.policies import MaxBatch
+
+
+class EchoProtocol(asyncio.Protocol):
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.transport.write(data)
+
+
+class AioTestCase(unittest.TestCase):
+    def test_protocol_server(self):
+        c1 = MockSocket([b'foo', b'bar'])
+        c2 = FastSocket([b'baz'])
+        s = ListenSocket([c1, None, c2])
+        s.bind(('localhost', 8888))
+        sel = MockSelector([s, c1, s, (c1, c2), c2, c1])
+        loop = MockEventLoop(sel)
+        with sel:
+            loop.run_until_complete(loop.create_server(EchoProtocol, sock=s))
+            loop.run_forever()
+        loop.close()
+        self.assertEqual([((b'foo',),), ((b'bar',),)], c1.send.call_args_list)
+        c1.close.assert_called_once_with()
+        self.assertEqual(b'baz', c2.sent)
+        self.assertEqual(1, c2.close_count)
+        self.assertEqual(2, s.current)
+
+    def test_streams_server(self):
+        received = []
+
+        async def handle(reader, writer):
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                received.append(line)
+                writer.write(line.upper())
+                await writer.drain()
+            writer.close()
+
+        async def main():
+            server = await asyncio.start_server(handle, sock=s)
+            try:
+                await asyncio.get_event_loop().create_future()  # forever
+            finally:
+                server.close()
+
+        c = FastSocket([b'foo\nba', b'r\n'])
+        s = ListenSocket([c])
+        s.bind(('localhost', 8888))
+        self.assertIsNone(run(main(), MockSelector([s, c, c, c])))
+        self.assertEqual([b'foo\n', b'bar\n'], received)
+        self.assertEqual(b'FOO\nBAR\n', c.sent)
+        self.assertEqual(1, c.close_count)
+        self.assertEqual(3, s.state)
+
+    def test_sock_recv(self):
+        async def main():
+            loop = asyncio.get_event_loop()
+            return await loop.sock_recv(c, 16)
+
+        c = FastSocket([b'foo'])
+        c.setblocking(False)
+        self.assertEqual(b'foo', run(main()))
+
+    def test_virtual_time(self):
+        class Keepalive(EchoProtocol):
+            def connection_made(self, transport):
+                super().connection_made(transport)
+                self.handle = loop.call_later(30, transport.close)
+
+            def data_received(self, data):
+                self.handle.cancel()
+                self.handle = loop.call_later(30, self.transport.close)
+                super().data_received(data)
+
+        c = FastSocket([b'foo', b'bar'])
+        s = ListenSocket([c])
+        s.bind(('localhost', 8888))
+        sel = MockSelector([s, At(20, c), At(100, ())])
+        loop = MockEventLoop(sel)
+        with sel:
+            loop.run_until_complete(loop.create_server(Keepalive, sock=s))
+            loop.run_forever()
+        loop.close()
+        self.assertEqual(b'foo', c.sent)     # closed before bar
+        self.assertEqual(1, c.close_count)
+        self.assertEqual(100, sel.clock())
+
+    def test_automatic(self):
+        clients = [FastSocket([b'foo', b'bar']) for _ in range(100)]
+        s = ListenSocket(clients)
+        s.bind(('localhost', 8888))
+        loop = MockEventLoop(MockSelector(policy=MaxBatch()))
+        with loop._selector:
+            loop.run_until_complete(loop.create_server(EchoProtocol, sock=s))
+            loop.run_forever()
+        loop.close()
+        for c in clients:
+            self.assertEqual(b'foobar', c.sent)
+            self.assertEqual(1, c.close_count)
+
+    def test_skip_polls(self):
+        c = MockSocket()
+        sel = MockSelector([c], skip_polls=True)
+        sel.register(c, 1)
+        self.assertEqual([], sel.select(0))
+        self.assertEqual(1, len(sel.select(1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
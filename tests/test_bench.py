@@ -0,0 +1,87 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+import errno
+import io
+import json
+import os.path
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from selectors import EVENT_READ
+from mockselector import bench
+
+
+class BenchTestCase(unittest.TestCase):
+    def test_workload(self):
+        s, sel, socks, events = bench.workload(3, 4, 2, 2)
+        with sel:
+            bench.echo_server(s, sel)
+        self.assertEqual(3 * 4, events)
+        for c in socks:
+            self.assertEqual(b'xxxxxxxx', c.sent)
+            self.assertEqual(1, c.close_count)
+
+    def test_bench(self):
+        res = bench.bench(bench.echo_server, [2, 5], [8], [1, 4], 3, 1)
+        self.assertEqual('mockselector.bench.echo_server', res['server'])
+        self.assertEqual(4, len(res['results']))
+        r = res['results'][-1]
+        self.assertEqual((5, 8, 4, 25, 120),
+                         (r['clients'], r['size'], r['batch'], r['events'],
+                          r['bytes']))
+        self.assertGreater(r['events_per_sec'], 0)
+        self.assertGreater(r['overhead_ns_per_event'], 0)
+
+    def test_storm(self):
+        def server(s, sel):
+            s.bind(('0.0.0.0', 8888))
+            s.listen(500)
+            s.setblocking(False)
+            sel.register(s, EVENT_READ)
+            while True:
+                for key, event in sel.select():
+                    if key.fileobj is s:
+                        try:
+                            while True:     # accept until EAGAIN or EMFILE
+                                sel.register(s.accept()[0], EVENT_READ)
+                        except BlockingIOError:
+                            pass
+                        except OSError as e:
+                            if e.errno != errno.EMFILE:
+                                raise
+                    elif not key.fileobj.recv(1024):
+                        sel.unregister(key.fileobj)
+                        key.fileobj.close()
+
+        res = bench.storm(server, 2000, burst=600, limit=50)
+        self.assertEqual((1700, 300, 500), (res['accepted'], res['dropped'],
+                                            res['peak']))
+        self.assertGreater(res['errors'], 0)
+        self.assertGreater(res['accepts_per_sec'], 0)
+
+    def test_compare(self):
+        old = {'results': [{'clients': 1, 'size': 2, 'batch': 3,
+                            'events_per_sec': 100.0}]}
+        new = {'results': [{'clients': 1, 'size': 2, 'batch': 3,
+                            'events_per_sec': 150.0},
+                           {'clients': 2, 'size': 2, 'batch': 3,
+                            'events_per_sec': 150.0}]}
+        self.assertEqual(['clients=1 size=2 batch=3: +50.0% events/s'],
+                         bench.compare(new, old))
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, 'bench.json')
+            with redirect_stdout(io.StringIO()) as fd:
+                bench.main(['--clients', '2', '--sizes', '8', '--batches',
+                            '1', '--repeat', '1', '--server',
+                            'mockselector.bench:echo_server', '-o', out])
+                bench.main(['--clients', '2', '--sizes', '8', '--batches',
+                            '1', '--repeat', '1', '--compare', out])
+            with open(out) as f:
+                self.assertEqual(1, len(json.load(f)['results']))
+        self.assertIn('clients=2 size=8 batch=1:', fd.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+import errno
+import socket
+import unittest
+from selectors import EVENT_READ, EVENT_WRITE
+from mockselector import FdAllocator, MockDatagramSocket, MockSelector
+from mockselector.policies import MaxBatch
+
+PEER = ('10.0.0.1', 5353)
+
+
+def udp_echo(sock, sel, batch=1):
+    """ UDP echo server, receiving up to batch datagrams per event """
+    sock.bind(('0.0.0.0', 9999))
+    sel.register(sock, EVENT_READ)
+    while True:
+        for key, _ in sel.select():
+            try:
+                for data, address in key.fileobj.recvmmsg(batch, 512):
+                    key.fileobj.sendto(data, address)
+            except BlockingIOError:
+                pass
+
+
+class DatagramTestCase(unittest.TestCase):
+    def test_boundaries(self):
+        sock = MockDatagramSocket([b'foo', (b'bar', PEER), bytearray(b'x'),
+                                   lambda: b'baz'])
+        self.assertEqual((b'foo', ('127.0.0.1', 40000)), sock.recvfrom(16))
+        self.assertEqual((b'ba', PEER), sock.recvfrom(2))   # truncated
+        buffer = bytearray(4)
+        self.assertEqual((1, ('127.0.0.1', 40000)),
+                         sock.recvfrom_into(buffer))
+        self.assertEqual(b'x', buffer[:1])
+        self.assertEqual((b'ba', [], socket.MSG_TRUNC, ('127.0.0.1', 40000)),
+                         sock.recvmsg(2))
+        self.assertEqual((2, 4), (sock.truncated, sock.recv_count))
+        with self.assertRaises(BlockingIOError) as cm:
+            sock.recv(16)
+        self.assertEqual(errno.EAGAIN, cm.exception.errno)
+
+    def test_batches(self):
+        sock = MockDatagramSocket([b'a', b'b', b'c', None, b'd'])
+        self.assertEqual(EVENT_READ | EVENT_WRITE, sock.ready_events())
+        self.assertEqual([b'a', b'b'], [d for d, _ in sock.recvmmsg(2, 16)])
+        self.assertEqual([b'c'], [d for d, _ in sock.recvmmsg(8, 16)])
+        self.assertEqual([b'd'], [d for d, _ in sock.recvmmsg(8, 16)])
+        self.assertRaises(BlockingIOError, sock.recvmmsg, 8, 16)
+        self.assertEqual(2, sock.sendmmsg([(b'x', PEER), (b'yz', PEER)]))
+        sock.connect(PEER)
+        self.assertEqual(3, sock.send(b'abc'))
+        self.assertEqual(3, sock.sendto(b'def', 0, PEER))
+        self.assertEqual((4, 9), (sock.send_count, sock.sent_bytes))
+        self.assertEqual((b'abc', PEER), sock.sent[2])
+        with self.assertRaises(OSError) as cm:
+            sock.sendto(bytes(70000), PEER)
+        self.assertEqual(errno.EMSGSIZE, cm.exception.errno)
+
+    def test_scripted(self):
+        sock = MockDatagramSocket([b'ping', (b'pong', PEER)])
+        sel = MockSelector([sock, sock, sock])
+        with sel:
+            udp_echo(sock, sel)
+        self.assertEqual([(b'ping', ('127.0.0.1', 40000)), (b'pong', PEER)],
+                         sock.sent)
+        self.assertEqual(('0.0.0.0', 9999), sock.getsockname())
+
+    def test_automatic(self):
+        fds = FdAllocator()
+        sock = MockDatagramSocket((b'%d' % i for i in range(10000)),
+                                  fds=fds, record=False)
+        sel = MockSelector(policy=MaxBatch(), fds=fds)
+        with sel:
+            udp_echo(sock, sel, batch=64)
+        self.assertIsNone(sock.sent)
+        self.assertEqual((10000, 10000), (sock.recv_count, sock.send_count))
+        sock.close()
+        self.assertEqual(-1, sock.fileno())
+        self.assertEqual(0, fds.in_use)
+
+
+if __name__ == '__main__':
+    unittest.main()
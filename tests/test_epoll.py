@@ -0,0 +1,170 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+import unittest
+from mockselector import At, Burst, FastSocket, FdAllocator, ListenSocket, \
+    MockSocket, SendWindow, VirtualClock
+from mockselector.epoll import EPOLLET, EPOLLIN, EPOLLONESHOT, EPOLLOUT, \
+    EPOLLRDHUP, MockEpoll
+from mockselector.faults import FaultInjector
+from mockselector.metrics import Metrics
+
+
+def reader(ep, sock, size, drain=False):
+    """ Reads size bytes per event, until EAGAIN if drain is true """
+    data = []
+    with ep:
+        while True:
+            for fd, _ in ep.poll():
+                while True:
+                    try:
+                        chunk = sock.recv(size)
+                    except BlockingIOError:
+                        break
+                    data.append(chunk)
+                    if not chunk:
+                        return data
+                    if not drain:
+                        break
+    return data
+
+
+class EpollTestCase(unittest.TestCase):
+    def test_level_triggered(self):
+        sock = FastSocket([b'x' * 100])
+        ep = MockEpoll()
+        ep.register(sock, EPOLLIN)
+        data = reader(ep, sock, 10)
+        self.assertEqual(b'x' * 100, b''.join(data))
+        self.assertEqual(b'', data[-1])
+
+    def test_edge_triggered(self):
+        sock = FastSocket([b'x' * 100])
+        ep = MockEpoll()
+        ep.register(sock.fileno(), EPOLLIN | EPOLLET)
+        data = reader(ep, sock, 10)
+        self.assertEqual([b'x' * 10], data)     # the tail was never signaled
+        sock = FastSocket([b'x' * 100, None, b'y' * 5])
+        ep = MockEpoll()
+        ep.register(sock, EPOLLIN | EPOLLET)
+        data = reader(ep, sock, 10, drain=True)
+        self.assertEqual(b'x' * 100 + b'y' * 5, b''.join(data))
+
+    def test_edge_write(self):
+        clock = VirtualClock()
+        sock = FastSocket(window=SendWindow(10, rate=100, clock=clock))
+        ep = MockEpoll(clock=clock)
+        ep.register(sock, EPOLLOUT | EPOLLET)
+        self.assertEqual([(sock.fileno(), EPOLLOUT)], ep.poll())
+        self.assertEqual([], ep.poll(0))         # no new edge
+        self.assertEqual(10, sock.send(b'z' * 20))
+        self.assertEqual([(sock.fileno(), EPOLLOUT)], ep.poll(1))
+        self.assertAlmostEqual(0.01, clock.now)
+
+    def test_oneshot_rdhup(self):
+        sock = MockSocket([b'foo'])
+        ep = MockEpoll()
+        ep.register(sock, EPOLLIN | EPOLLONESHOT | EPOLLRDHUP)
+        self.assertEqual([(sock.fileno(), EPOLLIN)], ep.poll())
+        self.assertEqual([], ep.poll(0.5))
+        self.assertEqual(0.5, ep.clock.now)
+        sock.recv(16)
+        ep.modify(sock, EPOLLIN | EPOLLRDHUP)
+        self.assertEqual([(sock.fileno(), EPOLLIN | EPOLLRDHUP)], ep.poll())
+
+    def test_edge_eof(self):
+        sock = FastSocket([b'foo'])
+        ep = MockEpoll()
+        ep.register(sock, EPOLLIN | EPOLLET | EPOLLRDHUP)
+        self.assertEqual([(sock.fileno(), EPOLLIN)], ep.poll())
+        self.assertEqual(b'foo', sock.recv(16))
+        self.assertEqual([(sock.fileno(), EPOLLIN | EPOLLRDHUP)], ep.poll())
+        self.assertEqual(b'', sock.recv(16))
+        self.assertEqual([], ep.poll(0))            # EOF reported once
+
+    def test_instrumented_rdhup(self):
+        sock = MockSocket([b'foo'])
+        Metrics().record(sock)
+        FaultInjector().state(sock)
+        ep = MockEpoll()
+        ep.register(sock, EPOLLIN | EPOLLRDHUP)
+        self.assertEqual([(sock.fileno(), EPOLLIN)], ep.poll())
+        sock.recv(16)
+        self.assertEqual([(sock.fileno(), EPOLLIN | EPOLLRDHUP)], ep.poll())
+
+    def test_maxevents(self):
+        socks = [FastSocket([b'a', b'b']) for _ in range(3)]
+        ep = MockEpoll()
+        for s in socks:
+            ep.register(s, EPOLLIN)
+        fds = [s.fileno() for s in socks]
+        first = [fd for fd, _ in ep.poll(maxevents=2)]
+        self.assertEqual(fds[:2], first)
+        self.assertEqual([fds[2], fds[0]],
+                         [fd for fd, _ in ep.poll(maxevents=2)])
+        self.assertRaises(ValueError, ep.poll, maxevents=0)
+
+    def test_listen(self):
+        c1, c2 = FastSocket([b'a']), FastSocket([b'b'])
+        s = ListenSocket([c1, c2])
+        s.bind(('localhost', 8888))
+        s.listen()
+        ep = MockEpoll()
+        ep.register(s, EPOLLIN | EPOLLET)
+        self.assertEqual([(s.fileno(), EPOLLIN)], ep.poll())
+        s.accept()
+        self.assertEqual([(s.fileno(), EPOLLIN)], ep.poll())   # new one
+        self.assertRaises(MockEpoll.EndException, ep.poll)
+
+    def test_scripted(self):
+        c1, c2, c3 = MockSocket(), MockSocket(), MockSocket()
+        ep = MockEpoll([(c1, (c2, EPOLLOUT), c3), At(5.0, c1), [], c2])
+        for s in (c1, c2):
+            ep.register(s, EPOLLIN | EPOLLOUT)
+        self.assertEqual([(c1.fileno(), EPOLLIN)], ep.poll(maxevents=1))
+        self.assertEqual([(c2.fileno(), EPOLLOUT)], ep.poll())  # c3 dropped
+        self.assertEqual([], ep.poll(1))
+        self.assertEqual(1.0, ep.clock.now)
+        self.assertEqual([(c1.fileno(), EPOLLIN)], ep.poll())
+        self.assertEqual(5.0, ep.clock.now)
+        self.assertEqual([], ep.poll(2))
+        self.assertEqual(7.0, ep.clock.now)
+        ep.unregister(c2)
+        self.assertEqual([], ep.poll())
+        with ep:
+            ep.poll()
+        self.assertTrue(ep.closed)
+
+    def test_burst(self):
+        fds = FdAllocator(10)
+        socks = [FastSocket(fds=fds) for _ in range(5)]
+        ep = MockEpoll([Burst(EPOLLIN | EPOLLOUT, maxevents=2),
+                        At(3.0, Burst(count=2, filter=lambda k: k.fd != 11))],
+                       fds=fds)
+        for s in socks[:4]:
+            ep.register(s, EPOLLIN)
+        ep.modify(socks[3], EPOLLOUT | EPOLLET)
+        self.assertEqual([(10, EPOLLIN), (11, EPOLLIN)], ep.poll())
+        ep.unregister(socks[1])
+        self.assertEqual([(12, EPOLLIN), (13, EPOLLOUT)], ep.poll())
+        self.assertEqual([(10, EPOLLIN), (12, EPOLLIN)], ep.poll())
+        self.assertEqual(3.0, ep.clock.now)
+        self.assertRaises(MockEpoll.EndException, ep.poll)
+
+    def test_errors(self):
+        fds = FdAllocator(100)
+        sock = FastSocket(fds=fds)
+        ep = MockEpoll(fds=fds)
+        self.assertEqual(100, sock.fileno())
+        self.assertEqual(101, ep.fileno())
+        ep.register(100)
+        self.assertRaises(FileExistsError, ep.register, sock)
+        self.assertRaises(FileNotFoundError, ep.modify, 102, EPOLLIN)
+        self.assertRaises(FileNotFoundError, ep.unregister, 102)
+        self.assertEqual([(100, EPOLLIN | EPOLLOUT)], ep.poll())   # EOF
+        ep.close()
+        self.assertRaises(ValueError, ep.poll)
+        self.assertEqual(101, fds.allocate())
+
+
+if __name__ == '__main__':
+    unittest.main()
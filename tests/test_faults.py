@@ -0,0 +1,153 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+import errno
+import unittest
+from selectors import EVENT_READ
+from mockselector import FastSocket, ListenSocket, MockSelector, MockSocket
+from mockselector.faults import FaultInjector
+from mockselector.metrics import Metrics
+from mockselector.policies import RoundRobin
+from fakes import FakeTimer
+
+
+def robust_server(s, sel):
+    """ Echo server handling the transient and fatal socket errors """
+    s.bind(('localhost', 8888))
+    s.listen()
+    sel.register(s, EVENT_READ)
+    while True:
+        for key, _ in sel.select():
+            c = key.fileobj
+            if c is s:
+                try:
+                    c, _ = s.accept()
+                except (BlockingIOError, InterruptedError,
+                        ConnectionAbortedError):
+                    continue
+                sel.register(c, EVENT_READ)
+                continue
+            try:
+                data = c.recv(1024)
+                if data:
+                    c.sendall(data)
+                    continue
+            except (BlockingIOError, InterruptedError):
+                continue
+            except (ConnectionResetError, BrokenPipeError):
+                pass
+            sel.unregister(c)
+            c.close()
+
+
+def run(injector, clients=50, messages=20):
+    socks = [FastSocket([b'%d' % i] * messages) for i in range(clients)]
+    sel = MockSelector(policy=RoundRobin(4))
+    injector.attach(sel)
+    with sel:
+        robust_server(ListenSocket(socks), sel)
+    return socks
+
+
+class FaultsTestCase(unittest.TestCase):
+    def test_no_faults(self):
+        injector = FaultInjector(0)
+        socks = run(injector)
+        self.assertEqual({}, injector.injected)
+        self.assertTrue(all(c.sent == b'%d' % i * 20
+                            for i, c in enumerate(socks)))
+
+    def test_deterministic(self):
+        injector = FaultInjector(42, rate=0.05, timer=FakeTimer())
+        socks = run(injector)
+        again = FaultInjector(42, rate=0.05)
+        self.assertEqual([c.sent for c in socks],
+                         [c.sent for c in run(again)])
+        self.assertEqual(injector.injected, again.injected)
+        self.assertIn('recv:ConnectionResetError', injector.injected)
+        self.assertIn('send:BlockingIOError', injector.injected)
+        self.assertIn('accept:InterruptedError', injector.injected)
+        stats = injector.stats()
+        for name, count in injector.injected.items():
+            self.assertEqual(count, stats[name]['count'])
+            self.assertGreater(stats[name]['seconds'], 0)
+        self.assertTrue(all(c.close_count == 1 for c in socks))
+
+    def test_reset(self):
+        c = MockSocket([b'foo', b'bar'])
+        sel = MockSelector([c, c, c])
+        sel.register(c, EVENT_READ)
+        injector = FaultInjector(recv={ConnectionResetError: 1.0})
+        injector.attach(sel)
+        sel.select()
+        with self.assertRaises(ConnectionResetError) as cm:
+            c.recv(16)
+        self.assertEqual(errno.ECONNRESET, cm.exception.errno)
+        self.assertEqual(b'', c.recv(16))
+        self.assertRaises(BrokenPipeError, c.send, b'x')
+        c.send.assert_called_once_with(b'x')
+        injector.detach()
+        self.assertEqual(b'foo', c.recv(16))
+        self.assertEqual(1, injector.injected['recv:ConnectionResetError'])
+
+    def test_abort(self):
+        c = FastSocket()
+        s = ListenSocket([c])
+        s.bind(('localhost', 8888))
+        s.listen()
+        s.setblocking(False)
+        injector = FaultInjector(accept={ConnectionAbortedError: 1.0})
+        injector.state(s)
+        self.assertEqual(EVENT_READ, s.ready_events())  # c is queued
+        self.assertRaises(ConnectionAbortedError, s.accept)
+        self.assertEqual(1, c.close_count)      # dropped
+        self.assertRaises(BlockingIOError, s.accept)    # empty backlog
+        s.setblocking(True)
+        self.assertIsInstance(s.accept()[0], MockSocket)
+        self.assertEqual({'accept:ConnectionAbortedError': 1},
+                         injector.injected)
+
+    def test_accept_order(self):
+        def accepts(injector):
+            c1, c2 = FastSocket(), FastSocket()
+            names = {c1: 'c1', c2: 'c2'}
+            s = ListenSocket([c1, None, c2])
+            s.bind(('localhost', 8888))
+            s.listen()
+            s.setblocking(False)
+            sel = MockSelector([s, s, s])
+            sel.register(s, EVENT_READ)
+            if injector is not None:
+                injector.attach(sel)
+            order = []
+            with sel:
+                while True:
+                    sel.select()
+                    try:
+                        order.append(names[s.accept()[0]])
+                    except BlockingIOError:
+                        order.append('EAGAIN')
+            return order
+
+        self.assertEqual(['c1', 'EAGAIN', 'c2'], accepts(None))
+        self.assertEqual(['c1', 'EAGAIN', 'c2'], accepts(FaultInjector(1)))
+
+    def test_spurious(self):
+        c1, c2 = FastSocket([b'foo']), FastSocket([b'bar'])
+        sel = MockSelector([c1] * 11)
+        sel.register(c1, EVENT_READ)
+        sel.register(c2, EVENT_READ)
+        metrics = Metrics().attach(sel)
+        FaultInjector(1, spurious=1.0).attach(sel)
+        for _ in range(10):     # never the socket already returned
+            ready = sel.select()
+            self.assertEqual([c1, c2], [key.fileobj for key, _ in ready])
+        spurious = ready[1][0].fileobj
+        self.assertRaises(BlockingIOError, spurious.recv, 16)
+        self.assertTrue(spurious.recv(16))      # only the next call blocks
+        self.assertEqual(20, metrics.totals()['read_events'])
+        sel.unregister(c2)
+        self.assertEqual(1, len(sel.select()))  # no other socket
+
+
+if __name__ == '__main__':
+    unittest.main()
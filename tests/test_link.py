@@ -0,0 +1,76 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+import unittest
+from selectors import EVENT_READ
+from mockselector import FastSocket, MockSocket, MockSelector, VirtualClock
+from mockselector.link import Link
+from mockselector.policies import MaxBatch
+
+
+class LinkTestCase(unittest.TestCase):
+    def test_fragments(self):
+        clock = VirtualClock()
+        c = FastSocket([b'x' * 250], link=Link(clock, mtu=100))
+        self.assertEqual(b'x' * 250, c.recv(1024))   # all arrived at once
+        self.assertEqual(b'', c.recv(1024))
+        c = FastSocket([b'x' * 250], link=Link(clock, bandwidth=1000, mtu=100))
+        sizes = []
+        while True:
+            try:
+                data = c.recv(1024)
+            except BlockingIOError:
+                clock.advance(0.1)
+                continue
+            if not data:
+                break
+            sizes.append(len(data))
+        self.assertEqual([100, 100, 50], sizes)
+        self.assertAlmostEqual(0.2, clock(), places=6)
+
+    def test_coalesce(self):
+        clock = VirtualClock()
+        c = MockSocket([b'a' * 10, b'b' * 10],
+                       link=Link(clock, bandwidth=100, mtu=4, burst=4))
+        self.assertEqual(b'a' * 4, c.recv(100))   # the burst
+        with self.assertRaises(BlockingIOError):
+            c.recv(100)
+        clock.advance(1)
+        self.assertEqual(b'a' * 6 + b'b' * 10, c.recv(100))
+
+    def test_latency(self):
+        clock = VirtualClock()
+        link = Link(clock, latency=0.05, jitter=0.01, seed=1)
+        c = FastSocket([b'foo', b'bar'], link=link)
+        self.assertEqual(0, c.ready_events() & EVENT_READ)
+        when = c.ready_at(EVENT_READ)
+        self.assertGreaterEqual(when, 0.05)
+        self.assertLess(when, 0.06)
+        clock.advance_to(when)
+        self.assertEqual(b'foo', c.recv(16))
+        self.assertGreaterEqual(c.ready_at(EVENT_READ), when)
+        self.assertIsNone(FastSocket().ready_at(EVENT_READ))
+
+    def test_selector(self):
+        clock = VirtualClock()
+        sel = MockSelector(policy=MaxBatch(), clock=clock)
+        c = FastSocket([b'x' * 3000, None, b'y' * 10],
+                       link=Link(clock, bandwidth=1e4, latency=0.1))
+        sel.register(c, EVENT_READ)
+        received = []
+        with sel:
+            while True:
+                for key, _ in sel.select():
+                    try:
+                        data = c.recv(65536)
+                    except BlockingIOError:
+                        continue
+                    received.append((clock(), len(data)))
+                    if not data:
+                        sel.unregister(c)
+        self.assertEqual(3010, sum(n for _, n in received))
+        self.assertEqual(1460, received[0][1])
+        self.assertAlmostEqual(0.1, received[0][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+import itertools
+import unittest
+import weakref
+from selectors import EVENT_READ
+from mockselector import MockSelector, MockSocket
+from mockselector.load import Load, constant, poisson, bursts
+
+
+def echo_loop(s, sel, clients=None):
+    """ A selector loop echoing the data and closing on end of stream """
+    sel.register(s, EVENT_READ)
+    s.bind(('localhost', 8888))
+    s.listen()
+    with sel:
+        while True:
+            for k, ev in sel.select():
+                sock = k.fileobj
+                if sock == s:
+                    c, _ = s.accept()
+                    sel.register(c, EVENT_READ)
+                    if clients is not None:
+                        clients.append(weakref.ref(c))
+                else:
+                    data = sock.recv(1024)
+                    if len(data) == 0:
+                        sel.unregister(sock)
+                        sock.close()
+                    else:
+                        sock.send(data)
+
+
+class LoadTestCase(unittest.TestCase):
+    def test_patterns(self):
+        self.assertEqual([2, 2], list(itertools.islice(constant(2), 2)))
+        self.assertEqual([1, 0, 0, 1, 0],
+                         list(itertools.islice(bursts(3, 1), 5)))
+        p = list(itertools.islice(poisson(10, 42), 1000))
+        self.assertEqual(p, list(itertools.islice(poisson(10, 42), 1000)))
+        self.assertAlmostEqual(0.1, sum(p) / len(p), delta=0.02)
+
+    def test_echo(self):
+        load = Load(3, payload=lambda i: [bytes([65 + i])] * (i + 1))
+        sent = []
+
+        def factory(recvs):
+            c = MockSocket(recvs)
+            sent.append(c)
+            return c
+
+        load.socket_factory = factory
+        echo_loop(load.listen_socket, load.selector)
+        self.assertEqual(3, load.opened)
+        self.assertEqual(3, load.closed)
+        self.assertEqual(3, load.max_active)
+        for i, c in enumerate(sent):
+            self.assertEqual([((bytes([65 + i]),),)] * (i + 1),
+                             c.send.call_args_list)
+            c.close.assert_called_once_with()
+
+    def test_flat_memory(self):
+        load = Load(1000, arrivals=constant(1.0),
+                    payload=lambda i: (b'foo', b'bar'), interval=0.3)
+        clients = []
+        echo_loop(load.listen_socket, load.selector, clients)
+        self.assertEqual(1000, load.closed)
+        self.assertEqual(0, load.active)
+        self.assertEqual(1, load.max_active)
+        self.assertAlmostEqual(1000.9, load.selector.clock())
+        self.assertEqual(1000, len(clients))
+        self.assertTrue(all(c() is None for c in clients))
+
+    def test_server_close(self):
+        load = Load(2, payload=lambda i: [b'foo', b'bar', b'baz'])
+        s, sel = load.listen_socket, load.selector
+        received = []
+        s.bind(('localhost', 8888))
+        s.listen()
+        sel.register(s, EVENT_READ)
+        with sel:
+            while True:
+                for k, _ in sel.select():
+                    if k.fileobj is s:
+                        c, _ = s.accept()
+                        sel.register(c, EVENT_READ)
+                    else:
+                        received.append(k.fileobj.recv(1024))
+                        sel.unregister(k.fileobj)
+                        k.fileobj.close()   # closes after the first recv
+        self.assertEqual([b'foo', b'foo'], received)
+        self.assertEqual(2, load.closed)
+        self.assertEqual(0, load.active)
+
+    def test_overlap(self):
+        load = Load(100, arrivals=poisson(10, 1),
+                    payload=lambda i: itertools.repeat(b'x', 5),
+                    interval=1.0)
+        echo_loop(load.listen_socket, load.selector)
+        self.assertEqual(100, load.closed)
+        self.assertGreater(load.max_active, 10)
+        self.assertLess(load.max_active, 100)
+
+    def test_finite_arrivals(self):
+        load = Load(10, arrivals=[0, 1])
+        echo_loop(load.listen_socket, load.selector)
+        self.assertEqual(2, load.opened)
+        self.assertEqual(2, load.closed)
+
+    def test_early_close(self):
+        load = Load(1, payload=lambda i: [b'foo', b'bar'])
+        s, sel = load.listen_socket, load.selector
+        sel.register(s, EVENT_READ)
+        s.bind(('localhost', 8888))
+        s.listen()
+        with sel:
+            while True:
+                for k, ev in sel.select():
+                    if k.fileobj == s:
+                        c, _ = s.accept()
+                        sel.register(c, EVENT_READ)
+                    else:
+                        k.fileobj.recv(1024)
+                        with self.assertRaises(BlockingIOError):
+                            k.fileobj.recv(1024)
+                        sel.unregister(k.fileobj)
+        self.assertIsInstance(sel, MockSelector)
+        self.assertEqual(1, load.closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
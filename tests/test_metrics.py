@@ -0,0 +1,112 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+import json
+import unittest
+from selectors import EVENT_READ, EVENT_WRITE
+from mockselector import FastSocket, ListenSocket, MockSelector, MockSocket
+from mockselector.bench import echo_server
+from mockselector.metrics import Histogram, Metrics
+from mockselector.policies import MaxBatch
+from mockselector.recording import Digest
+from fakes import FakeTimer
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_histogram(self):
+        h = Histogram([0.1, 1.0])
+        for v in (0.05, 0.1, 0.5, 2.0):
+            h.observe(v)
+        self.assertEqual([2, 1, 1], h.counts)
+        self.assertEqual(0.1, h.quantile(0.5))
+        self.assertEqual(float('inf'), h.quantile(1))
+        self.assertAlmostEqual(2.65, h.to_dict()['sum'])
+
+    def test_echo(self):
+        c1 = MockSocket([b'foo', b'bar'])
+        c2 = FastSocket([b'hello'])
+        s = ListenSocket([c1, c2])
+        sel = MockSelector([s, s, c1, (c1, c2), c2, (c1, EVENT_WRITE)])
+        metrics = Metrics(timer=FakeTimer()).attach(sel)
+        with sel:
+            echo_server(s, sel)
+        totals = metrics.totals()
+        self.assertEqual((6, 6, 2), (totals['selects'], totals['read_events'],
+                                     totals['accepts']))
+        self.assertEqual((11, 11), (totals['bytes_in'], totals['bytes_out']))
+        self.assertEqual(1, totals['write_events'])
+        rec1, rec2 = [r for r in metrics.connections
+                      if r['type'] != 'ListenSocket']
+        self.assertEqual((2, 6, 6), (rec1['read_events'], rec1['bytes_in'],
+                                     rec1['bytes_out']))
+        self.assertEqual((2, 5, 5), (rec2['read_events'], rec2['bytes_in'],
+                                     rec2['bytes_out']))
+        self.assertGreater(rec1['write_seconds'], 0)
+        self.assertAlmostEqual(totals['handler_seconds'],
+                               totals['read_seconds']
+                               + totals['write_seconds'])
+        self.assertEqual(6, metrics.batch_time.count)
+        self.assertEqual(6, metrics.select_time.count)
+        self.assertEqual(2, metrics.accept_time.count)
+        c1.send.assert_called_with(b'bar')   # the mock still records
+
+    def test_sendmsg(self):
+        c1 = MockSocket([b'foo'])
+        c2 = MockSocket([b'bar'], record=Digest)
+        c3 = FastSocket([b'baz'])
+        sel = MockSelector([(c1, c2, c3)])
+        for c in (c1, c2, c3):
+            sel.register(c, EVENT_READ)
+        metrics = Metrics().attach(sel)
+        for key, _ in sel.select():
+            key.fileobj.sendmsg([key.fileobj.recv(16), b'!!'])
+        metrics.detach()
+        self.assertEqual([5, 5, 5], [rec['bytes_out']
+                                     for rec in metrics.connections])
+        c1.sendmsg.assert_called_once_with([b'foo', b'!!'])
+
+    def test_attribution(self):
+        timer = FakeTimer()
+        c1, c2 = FastSocket([b'a']), FastSocket([b'b'])
+        sel = MockSelector([(c1, c2)])
+        sel.register(c1, EVENT_READ)
+        sel.register(c2, EVENT_READ)
+        metrics = Metrics(timer=timer).attach(sel)
+        sel.select()
+        c1.recv(16)
+        timer.now += 0.010      # c1 handler
+        c2.recv(16)
+        timer.now += 0.020      # c2 handler
+        metrics.detach()
+        rec1, rec2 = metrics.connections
+        self.assertAlmostEqual(0.012, rec1['handler_seconds'])
+        self.assertAlmostEqual(0.021, rec2['handler_seconds'])
+        self.assertEqual(sel.before_select, [])
+        c1.recv(16)             # no longer attributed
+        self.assertAlmostEqual(0.012, rec1['handler_seconds'])
+
+    def test_export(self):
+        c = FastSocket([b'foo'])
+        sel = MockSelector(policy=MaxBatch())
+        sel.register(c, EVENT_READ)
+        metrics = Metrics().attach(sel)
+        with sel:
+            while True:
+                sel.select()
+                if not c.recv(16):
+                    sel.unregister(c)
+        data = json.loads(metrics.to_json())
+        self.assertEqual(3, data['totals']['bytes_in'])
+        self.assertEqual(c.fileno(), data['connections'][0]['fd'])
+        self.assertEqual(2, data['histograms']['batch_seconds']['count'])
+        text = metrics.to_prometheus(per_connection=True)
+        self.assertIn('mockselector_selects_total 2\n', text)
+        self.assertIn('mockselector_bytes_total{direction="in"} 3\n', text)
+        self.assertIn('mockselector_batch_seconds_bucket{le="+Inf"} 2\n',
+                      text)
+        self.assertIn('mockselector_connection_bytes_total{conn="0",fd="',
+                      text)
+        self.assertIn('# TYPE mockselector_event_seconds histogram', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+import unittest
+from selectors import EVENT_READ, EVENT_WRITE
+from mockselector import MockSocket, MockSelector, ListenSocket, FastSocket, \
+    SendWindow, VirtualClock
+from mockselector.policies import MaxBatch, RoundRobin, RandomPolicy
+
+
+def serve(s, sel, order=None):
+    """ Echo loop recording the order of the served sockets """
+    sel.register(s, EVENT_READ)
+    s.bind(('localhost', 8888))
+    s.listen()
+    with sel:
+        while True:
+            for k, ev in sel.select():
+                sock = k.fileobj
+                if sock == s:
+                    c, _ = s.accept()
+                    sel.register(c, EVENT_READ)
+                else:
+                    data = sock.recv(1024)
+                    if order is not None:
+                        order.append((sock, data))
+                    if len(data) == 0:
+                        sel.unregister(sock)
+                        sock.close()
+                    else:
+                        sock.send(data)
+
+
+class AutoTestCase(unittest.TestCase):
+    def test_readiness(self):
+        c = FastSocket([b'foo', None, b'bar'])
+        self.assertEqual(EVENT_READ | EVENT_WRITE, c.ready_events())
+        self.assertEqual(b'foo', c.recv(16))
+        self.assertEqual(EVENT_WRITE, c.ready_events())
+        self.assertEqual(EVENT_READ | EVENT_WRITE, c.ready_events())
+        self.assertEqual(b'bar', c.recv(16))
+        self.assertEqual(EVENT_READ | EVENT_WRITE, c.ready_events())  # EOF
+        self.assertEqual(b'', c.recv(16))
+        m = MockSocket([lambda: b''])
+        self.assertEqual(EVENT_READ | EVENT_WRITE, m.ready_events())
+        self.assertEqual(b'', m.recv(16))
+
+    def test_listen_readiness(self):
+        c1, c2 = FastSocket(), FastSocket()
+        s = ListenSocket([c1, None, c2])
+        self.assertEqual(0, s.ready_events())
+        s.bind(('localhost', 80))
+        s.listen()
+        self.assertEqual(EVENT_READ, s.ready_events())
+        self.assertIs(c1, s.accept()[0])
+        self.assertEqual(0, s.ready_events())
+        self.assertEqual(EVENT_READ, s.ready_events())
+        self.assertIs(c2, s.accept()[0])
+        self.assertEqual(0, s.ready_events())
+
+    def test_max_batch(self):
+        c1 = FastSocket([b'foo', b'bar'])
+        c2 = FastSocket([b'baz'])
+        s = ListenSocket([c1, c2])
+        order = []
+        serve(s, MockSelector(policy=MaxBatch()), order)
+        self.assertEqual([(c1, b'foo'), (c1, b'bar'), (c2, b'baz'),
+                          (c1, b''), (c2, b'')], order)
+        self.assertEqual(b'foobar', c1.sent)
+        self.assertEqual(1, c2.close_count)
+
+    def test_max_events(self):
+        c = [FastSocket() for _ in range(5)]
+        sel = MockSelector(policy=MaxBatch(2))
+        for sock in c:
+            sel.register(sock, EVENT_READ)
+        self.assertEqual([c[0], c[1]],
+                         [k.fileobj for k, _ in sel.select()])
+
+    def test_round_robin(self):
+        c = [FastSocket([b'x'] * 3) for _ in range(3)]
+        sel = MockSelector(policy=RoundRobin())
+        for sock in reversed(c):
+            sel.register(sock, EVENT_READ)
+        served = []
+        for _ in range(6):
+            (k, ev), = sel.select()
+            served.append(k.fileobj)
+            k.fileobj.recv(1)
+        self.assertEqual(c + c, served)
+        sel = MockSelector(policy=RoundRobin(2))
+        for sock in c:
+            sel.register(sock, EVENT_READ)
+        self.assertEqual(c[:2], [k.fileobj for k, _ in sel.select()])
+        self.assertEqual([c[2], c[0]], [k.fileobj for k, _ in sel.select()])
+
+    def test_random(self):
+        def run(seed):
+            c1 = FastSocket([b'a', b'b', b'c'])
+            c2 = FastSocket([b'd', b'e', b'f'])
+            order = []
+            serve(ListenSocket([c1, c2]),
+                  MockSelector(policy=RandomPolicy(seed, 2)), order)
+            return [(1 if sock is c1 else 2, data) for sock, data in order]
+
+        self.assertEqual(run(1), run(1))
+        self.assertEqual(8, len(run(2)))
+        self.assertGreater(len({tuple(run(seed)) for seed in range(10)}), 1)
+
+    def test_timeout(self):
+        c = FastSocket([None])
+        sel = MockSelector(policy=MaxBatch())
+        sel.register(c, EVENT_READ)
+        self.assertEqual([], sel.select(2.5))
+        self.assertEqual(2.5, sel.clock())
+        self.assertEqual(1, len(sel.select()))     # the EOF
+        sel.unregister(c)
+        with self.assertRaises(MockSelector.EndException):
+            sel.select()
+
+    def test_write(self):
+        c = MockSocket()
+        sel = MockSelector(policy=MaxBatch())
+        sel.register(c, EVENT_WRITE)
+        self.assertEqual([(sel.get_map()[c], EVENT_WRITE)], sel.select())
+
+    def test_slow_consumer(self):
+        clock = VirtualClock()
+        c = FastSocket([b'x' * 10],
+                       window=SendWindow(100, rate=1000, clock=clock))
+        s = ListenSocket([c])
+        sel = MockSelector(policy=MaxBatch(), clock=clock)
+        sel.register(s, EVENT_READ)
+        s.bind(('localhost', 8888))
+        s.listen()
+        pending = {}
+        partial = 0
+        with sel:
+            while True:
+                for k, ev in sel.select():
+                    sock = k.fileobj
+                    if sock is s:
+                        sock, _ = s.accept()
+                        sel.register(sock, EVENT_READ)
+                        pending[sock] = b''
+                        continue
+                    if ev & EVENT_READ:
+                        data = sock.recv(1024)
+                        if data:
+                            pending[sock] += data * 100
+                        else:
+                            sel.modify(sock, EVENT_WRITE)
+                    if pending[sock]:
+                        try:
+                            n = sock.send(pending[sock])
+                        except BlockingIOError:
+                            n = 0
+                        partial += n < len(pending[sock])
+                        pending[sock] = pending[sock][n:]
+                    events = sel.get_key(sock).events
+                    if pending[sock]:
+                        sel.modify(sock, events | EVENT_WRITE)
+                    elif events == EVENT_WRITE:
+                        sel.unregister(sock)
+                        sock.close()
+                    else:
+                        sel.modify(sock, EVENT_READ)
+        self.assertEqual(1000, len(c.sent))
+        self.assertEqual(1, c.close_count)
+        self.assertGreater(partial, 1)
+        self.assertAlmostEqual(0.9, clock())
+
+
+if __name__ == '__main__':
+    unittest.main()
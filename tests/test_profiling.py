@@ -0,0 +1,118 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+import os.path
+import unittest
+from selectors import EVENT_READ
+from mockselector import FastSocket, ListenSocket, MockSelector, MockSocket
+from mockselector.policies import MaxBatch, RoundRobin
+from mockselector.profiling import Profiler
+from fakes import FakeTimer
+
+
+class Server:
+    """ Server registering its handlers as the key data """
+
+    def __init__(self, s, sel):
+        self.s = s
+        self.sel = sel
+        self.buffers = []
+
+    def run(self):
+        self.s.bind(('localhost', 8888))
+        self.s.listen()
+        self.sel.register(self.s, EVENT_READ, self.accept)
+        while True:
+            for key, _ in self.sel.select():
+                key.data(key.fileobj)
+
+    def accept(self, s):
+        c, _ = s.accept()
+        self.sel.register(c, EVENT_READ, self.read)
+
+    def read(self, c):
+        data = c.recv(1024)
+        if not data:
+            self.sel.unregister(c)
+            c.close()
+        else:
+            self.buffers.append(bytearray(data * 100))
+
+
+class ProfilingTestCase(unittest.TestCase):
+    def run_server(self, profiler, policy=None):
+        socks = [FastSocket([b'x' * 100] * 3) for _ in range(3)]
+        sel = MockSelector(policy=RoundRobin() if policy is None else policy)
+        with profiler.attach(sel), sel:
+            Server(ListenSocket(socks), sel).run()
+        return profiler
+
+    def test_cpu(self):
+        prof = self.run_server(Profiler(timer=FakeTimer()))
+        self.assertEqual({'Server.accept', 'Server.read'},
+                         set(prof.handlers))
+        read = prof.handlers['Server.read']
+        self.assertEqual(12, read.batches)
+        self.assertEqual(3, prof.handlers['Server.accept'].batches)
+        self.assertAlmostEqual(0.012, read.seconds)
+        self.assertIs(read, prof.slowest(1)[0])
+        names = {func[2] for func in read.stats().stats}
+        self.assertIn('read', names)
+        self.assertNotIn('accept', names)
+        report = prof.report(functions=2)
+        self.assertIn('Server.read', report)
+        self.assertIn('function calls', report)
+        self.assertIsNone(prof.selector)      # detached by the with block
+
+    def test_memory(self):
+        prof = self.run_server(Profiler(cpu=False, memory=True,
+                                        label=lambda key: 'all'))
+        self.assertEqual(['all'], list(prof.handlers))
+        handler = prof.handlers['all']
+        self.assertGreaterEqual(handler.allocated, 9 * 10000)
+        self.assertTrue(any('test_profiling.py:' in line
+                            for line in handler.lines))
+        self.assertIn('Most allocating handlers', prof.report())
+        self.assertRaises(ValueError, handler.stats)
+
+    def test_batches(self):
+        timer = FakeTimer()
+        c1, c2 = FastSocket([b'a']), MockSocket([b'b'])
+        sel = MockSelector([(c1, c2)])
+        sel.register(c1, EVENT_READ)
+        sel.register(c2, EVENT_READ, 'echo')
+        prof = Profiler(timer=timer).attach(sel)
+        sel.select()
+        timer.now += 0.010      # dispatch, charged to the first event
+        c1.recv(16)
+        timer.now += 0.010      # c1 handler
+        c2.recv(16)
+        timer.now += 0.020      # c2 handler
+        c2.send(b'b')
+        timer.now += 0.005
+        prof.detach()
+        self.assertEqual({'FastSocket', 'echo'}, set(prof.handlers))
+        self.assertAlmostEqual(0.021, prof.handlers['FastSocket'].seconds)
+        self.assertAlmostEqual(0.026, prof.handlers['echo'].seconds)
+        self.assertEqual([], sel.after_select)
+        self.assertEqual([1, 1], [h['batches']
+                                  for h in prof.to_dict()['handlers']])
+        c2.send.assert_called_once_with(b'b')
+
+    def test_max_batch(self):
+        def functions(handler):
+            return {(os.path.basename(func[0]), func[2])
+                    for func in prof.handlers[handler].stats().stats}
+
+        prof = self.run_server(Profiler(), MaxBatch())
+        read = functions('Server.read')
+        self.assertIn(('test_profiling.py', 'read'), read)
+        self.assertIn(('selector.py', 'recv'), read)
+        self.assertNotIn(('selector.py', 'accept'), read)
+        accept = functions('Server.accept')
+        self.assertIn(('selector.py', 'accept'), accept)
+        self.assertNotIn(('selector.py', 'recv'), accept)
+        self.assertNotIn(('test_profiling.py', 'read'), accept)
+
+
+if __name__ == '__main__':
+    unittest.main()
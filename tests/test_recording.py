@@ -0,0 +1,107 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+import hashlib
+import io
+import os.path
+import tempfile
+import unittest
+from mockselector import FastSocket, MockSocket, SendWindow
+from mockselector.recording import Capture, Digest, Recorder, Ring, Sink
+
+
+class RecordingTestCase(unittest.TestCase):
+    def test_full(self):
+        c = MockSocket()
+        self.assertIsNone(c.recorder)
+        self.assertEqual(3, c.send(b'foo'))
+        c.send.assert_called_once_with(b'foo')
+
+    def test_ring(self):
+        c = MockSocket(record=Ring(2))
+        for data in (b'a', b'bc', b'def'):
+            self.assertEqual(len(data), c.send(data))
+        c.sendall(bytearray(b'ghij'))
+        self.assertEqual([b'def', b'ghij'], list(c.recorder.calls))
+        self.assertEqual((4, 10), (c.recorder.count, c.recorder.nbytes))
+
+    def test_digest(self):
+        c = MockSocket(record=Digest)
+        chunk = b'x' * 1024
+        for _ in range(1024):
+            c.send(chunk)
+        self.assertEqual(1024 * 1024, c.recorder.nbytes)
+        self.assertEqual(hashlib.sha256(chunk * 1024).hexdigest(),
+                         c.recorder.hexdigest())
+        c = MockSocket(record=Digest('md5'))
+        c.sendall(memoryview(b'foo'))
+        self.assertEqual(hashlib.md5(b'foo').digest(), c.recorder.digest())
+
+    def test_sink(self):
+        out = io.BytesIO()
+        c = MockSocket(record=Sink(out))
+        c.send(b'foo')
+        c.sendall(b'bar')
+        c.close()
+        self.assertEqual(b'foobar', out.getvalue())
+        self.assertFalse(out.closed)
+        c.close.assert_called_once_with()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'out')
+            c = MockSocket(record=Sink(path))
+            c.send(b'foo')
+            c.close()
+            with open(path, 'rb') as fd:
+                self.assertEqual(b'foo', fd.read())
+
+    def test_capture(self):
+        c = MockSocket(record=Capture)
+        c.send(b'HTTP/1.1 200 OK\r\n')
+        c.sendall(memoryview(b'Content-Length: 5\r\n\r\n'))
+        self.assertEqual(6, c.sendmsg([b'hel', bytearray(b'lo\n')]))
+        out = c.recorder
+        self.assertEqual((3, 44), (out.count, out.nbytes))
+        self.assertTrue(out.startswith(b'HTTP/1.1 200'))
+        self.assertEqual(b'5', out.search(rb'Length: (\d+)').group(1))
+        self.assertEqual(b'hello\n', out.call(-1))
+        self.assertEqual(b'Content-Length: 5\r\n\r\n', out.call(1))
+        self.assertEqual(1, out.call_index(20))
+        self.assertEqual(hashlib.sha256(out.getvalue()).hexdigest(),
+                         out.hexdigest())
+        self.assertIsNone(out.compare(out.getvalue()))
+        self.assertEqual(9, out.compare(b'HTTP/1.1 404'))
+        self.assertEqual(44, out.compare(out.getvalue() + b'more'))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'expected')
+            with open(path, 'wb') as fd:
+                fd.write(out.getvalue()[:-2] + b'!\n')
+            self.assertEqual(42, out.compare(path, chunk_size=4))
+            with open(path, 'rb') as fd:
+                self.assertEqual(42, out.compare(fd))
+
+    def test_capture_window(self):
+        c = MockSocket(record=Capture, window=SendWindow(4))
+        self.assertEqual(4, c.sendmsg([b'abc', b'def']))
+        self.assertEqual(b'abcd', c.recorder.getvalue())
+        f = FastSocket()
+        f.sendmsg([b'foo', b'bar'])
+        self.assertEqual((b'foobar', 1), (f.sent, f.send_count))
+        c = MockSocket()
+        self.assertEqual(6, c.sendmsg([b'foo', b'bar']))
+        c.sendmsg.assert_called_once_with([b'foo', b'bar'])
+
+    def test_policy(self):
+        MockSocket.record_policy = Digest
+        try:
+            c1, c2 = MockSocket(), MockSocket(record=Ring(1))
+        finally:
+            MockSocket.record_policy = None
+        self.assertIsInstance(c1.recorder, Digest)
+        self.assertIsInstance(c2.recorder, Ring)
+        self.assertIsNone(MockSocket().recorder)
+        c = MockSocket(record=Recorder)
+        c.send(b'foo')
+        self.assertEqual((1, 3), (c.recorder.count, c.recorder.nbytes))
+
+
+if __name__ == '__main__':
+    unittest.main()
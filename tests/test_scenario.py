@@ -0,0 +1,137 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+import json
+import os
+import pickle
+import tempfile
+import unittest
+from selectors import EVENT_READ, EVENT_WRITE
+from unittest.mock import patch
+from mockselector import At, FastSocket, MockSocket
+from mockselector import scenario
+from mockselector.bench import echo_server
+# noinspection PyUnresolvedReferences
+import miniserv
+
+MINISERV = {
+    'clients': {
+        'c1': ['foo', 'quit'],
+        'c2': ['foo', 'bar', 'baz', 'fee'],
+    },
+    'events': ['s', 'c1', 's', 'c2', 'c2', ['c1', 'c2'], 'c1', 'c2', 'c2'],
+}
+
+
+class ScenarioTestCase(unittest.TestCase):
+    def test_miniserv(self):
+        sc = scenario.loads(json.dumps(MINISERV))
+        serv = miniserv.MiniServer(8888)
+        with patch('socket.socket') as socket, \
+                patch('miniserv.DefaultSelector') as selector:
+            socket.return_value = sc.listen_socket
+            selector.return_value = sc.selector
+            with sc.selector:
+                serv.run()
+        self.assertEqual([((b'foo',),), ((b'quit',),)],
+                         sc['c1'].send.call_args_list)
+        self.assertEqual(4, sc['c2'].send.call_count)
+
+    def test_compile(self):
+        compiled = scenario.compile_scenario({
+            'socket': 'fast',
+            'listen': 'srv',
+            'clients': {
+                'a': {'socket': 'mock',
+                      'recv': [{'hex': '00ff'}, None,
+                               {'repeat': 'ab', 'count': 3}]},
+                'b': [{'base64': 'Zm9v'}],
+            },
+            'accept': [['b', 'a'], None],
+            'events': ['srv', 'a:rw', ['a', 'b:w'], [],
+                       {'at': 5, 'events': 'b'},
+                       {'burst': {'events': 'w', 'maxevents': 2}}],
+        })
+        self.assertEqual([('a', 'mock', [b'\x00\xff', None, b'ababab']),
+                          ('b', 'fast', [b'foo'])], compiled['clients'])
+        self.assertEqual([[1, 0], None], compiled['accept'])
+        sc = scenario.build(compiled)
+        a, b, s = sc['a'], sc['b'], sc['srv']
+        self.assertIsInstance(a, MockSocket)
+        self.assertIsInstance(b, FastSocket)
+        events = list(sc.selector.iter_event)
+        self.assertEqual(((s, s.fileno(), EVENT_READ),), events[0])
+        self.assertEqual((a, a.fileno(), EVENT_READ | EVENT_WRITE),
+                         events[1][0])
+        self.assertEqual([], list(events[3]))
+        self.assertIsInstance(events[4], At)
+        self.assertEqual(5.0, events[4].when)
+        self.assertEqual((EVENT_WRITE, None, 2),
+                         (events[5].events, events[5].count,
+                          events[5].maxevents))
+
+    def test_errors(self):
+        for data in ({'clients': {'a': ['x']}, 'events': ['b']},
+                     {'clients': {'a': ['x']}, 'events': ['a:x']},
+                     {'clients': {'a': [1]}},
+                     {'clients': {'a': {'socket': 'udp'}}},
+                     {'clients': {'s': []}},
+                     {'accept': ['z']},
+                     {'policy': 'Nope'},
+                     {'events': [1]},
+                     {'events': [['s', ['s']]]},
+                     {'events': [{'at': 1, 'events': [None]}]},
+                     {'events': [{'burst': 5}]},
+                     {'events': [{'burst': {'events': ['r']}}]}):
+            self.assertRaises(ValueError, scenario.compile_scenario, data)
+        with self.assertRaisesRegex(ValueError, r'^events\[1\]: invalid'):
+            scenario.compile_scenario({'events': ['s', ['s', 2]]})
+        for data, where in (({'clients': ['c1']}, 'clients'),
+                            ({'clients': {'c1': 'foo'}}, 'c1'),
+                            ({'policy': {'args': [2]}}, 'policy'),
+                            ({'policy': {'name': 'MaxBatch', 'args': 2}},
+                             'policy'),
+                            ({'policy': 2}, 'policy'),
+                            ({'policy': 'Nope'}, 'policy')):
+            with self.assertRaisesRegex(ValueError, '^{}: '.format(where)):
+                scenario.compile_scenario(data)
+
+    def test_cache(self):
+        data = {'clients': {'c%d' % i: ['x' * 10] for i in range(5)},
+                'policy': {'name': 'RoundRobin', 'args': [2]}}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'echo.json')
+            with open(path, 'w') as fd:
+                json.dump(data, fd)
+            sc = scenario.load(path)
+            cache = os.listdir(os.path.join(tmp, '__pycache__'))
+            self.assertEqual(1, len(cache))
+            self.assertTrue(cache[0].startswith('echo.'))
+            with patch('mockselector.scenario.compile_scenario') as compile:
+                sc2 = scenario.load(path)
+            compile.assert_not_called()
+            with sc2.selector:
+                echo_server(sc2.listen_socket, sc2.selector)
+            for c in sc2.clients.values():
+                c.send.assert_called_once_with(b'x' * 10)
+            self.assertIsNot(sc['c0'], sc2['c0'])
+            scenario.load(path, cache_dir=os.path.join(tmp, 'other'))
+            self.assertEqual(cache, os.listdir(os.path.join(tmp, 'other')))
+            with patch('mockselector.scenario.compile_scenario',
+                       wraps=scenario.compile_scenario) as compile:
+                scenario.load(path, cache_dir=False)
+            compile.assert_called_once_with(data)
+
+    def test_cache_error(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'echo.json')
+            with open(path, 'w') as fd:
+                json.dump({'clients': {'c1': ['x']}}, fd)
+            with patch('mockselector.scenario.pickle.dump',
+                       side_effect=pickle.PicklingError):
+                with self.assertRaises(pickle.PicklingError):
+                    scenario.load(path)
+            self.assertEqual([], os.listdir(os.path.join(tmp, '__pycache__')))
+
+
+if __name__ == '__main__':
+    unittest.main()
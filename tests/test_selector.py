@@ -1,7 +1,8 @@
 #  Copyright (c) 2020 SBA - MIT License
 
 import unittest
-from mockselector import MockSocket, MockSelector, ListenSocket
+from mockselector import MockSocket, MockSelector, ListenSocket, FastSocket, \
+    VirtualClock, At, Burst, FdAllocator
 from selectors import EVENT_READ, EVENT_WRITE
 
 
@@ -111,6 +112,184 @@ class SelectorTestCase(unittest.TestCase):
         self.assertEqual(2, c.send.call_count)
         self.assertEqual([((b'foo',),), ((b'bar',),)], c.send.call_args_list)
 
+    def test_lazy_event_list(self):
+        c1 = MockSocket()
+        c2 = MockSocket()
+
+        def events():
+            yield c1
+            yield (c for c in (c1, c2))
+            yield c2, EVENT_WRITE
+
+        sel = MockSelector(events())
+        sel.register(c1, EVENT_READ)
+        sel.register(c2, EVENT_READ | EVENT_WRITE)
+        m = sel.get_map()
+        self.assertEqual([(m[c1], EVENT_READ)], sel.select())
+        self.assertEqual([(m[c1], EVENT_READ), (m[c2], EVENT_READ)],
+                         sel.select())
+        self.assertEqual([(m[c2], EVENT_WRITE)], sel.select())
+        with self.assertRaises(MockSelector.EndException):
+            sel.select()
+
+    def test_compiled_resolution(self):
+        c1 = MockSocket()
+        c2 = MockSocket()
+        sel = MockSelector([c1, c1, [c2.fileno()], ()])
+        with self.assertRaises(KeyError):
+            sel.select()
+        sel.register(c1, EVENT_READ)
+        sel.register(c2, EVENT_READ)
+        self.assertEqual([(sel.get_map()[c1], EVENT_READ)], sel.select())
+        self.assertEqual([(sel.get_map()[c2], EVENT_READ)], sel.select())
+        self.assertEqual([], sel.select())
+
+    def test_clock_timeout(self):
+        c = MockSocket()
+        sel = MockSelector([(), c, ()])
+        sel.register(c, EVENT_READ)
+        self.assertEqual([], sel.select(1.5))
+        self.assertEqual(1.5, sel.clock())
+        self.assertEqual(1, len(sel.select(1.5)))
+        self.assertEqual(1.5, sel.clock())
+        self.assertEqual([], sel.select())
+        self.assertEqual(1.5, sel.clock())
+
+    def test_clock_at(self):
+        c = MockSocket()
+        clock = VirtualClock(10)
+        sel = MockSelector([At(12, c), At(20, (c, EVENT_WRITE)), At(5, c)],
+                           clock=clock)
+        sel.register(c, EVENT_READ | EVENT_WRITE)
+        self.assertEqual([], sel.select(1))
+        self.assertEqual(11, clock())
+        self.assertEqual([(sel.get_map()[c], EVENT_READ)], sel.select(1))
+        self.assertEqual(12, clock())
+        self.assertEqual([(sel.get_map()[c], EVENT_WRITE)], sel.select())
+        self.assertEqual(20, clock())
+        self.assertEqual(1, len(sel.select(0)))   # a past event is due
+        self.assertEqual(20, clock())
+
+    def test_clock_patch(self):
+        import time
+        from unittest.mock import patch
+
+        def reaper(sel, idle):
+            """ closes sockets with no activity for idle seconds """
+            last = {}
+            while True:
+                for k, ev in sel.select(1.0):
+                    k.fileobj.recv(1024)
+                    last[k.fileobj] = time.monotonic()
+                for sock, t in list(last.items()):
+                    if time.monotonic() - t > idle:
+                        sel.unregister(sock)
+                        sock.close()
+                        del last[sock]
+
+        c1 = MockSocket([b'foo', b'bar'])
+        c2 = MockSocket([b'foo'])
+        sel = MockSelector([(c1, c2), At(3, c1), At(100, ())])
+        sel.register(c1, EVENT_READ)
+        sel.register(c2, EVENT_READ)
+        with patch('time.monotonic', sel.clock), sel:
+            reaper(sel, 10)
+        self.assertEqual(100, sel.clock())
+        c1.close.assert_called_once_with()
+        c2.close.assert_called_once_with()
+        self.assertEqual(0, len(sel.get_map()))
+
+    def test_fd_table(self):
+        fds = FdAllocator(0)
+        c = [FastSocket(fds=fds) for _ in range(5)]
+        sel = MockSelector(fds=fds)
+        for sock in c[::-1]:
+            sel.register(sock, EVENT_READ, sock.fileno())
+        m = sel.get_map()
+        self.assertEqual(5, len(m))
+        self.assertEqual([0, 1, 2, 3, 4], list(m))
+        self.assertEqual(2, m[c[2]].data)
+        self.assertEqual(2, m[2].data)
+        sel.modify(c[2], EVENT_READ, 'foo')
+        self.assertEqual('foo', m[c[2]].data)
+        sel.modify(c[2], EVENT_READ | EVENT_WRITE)
+        self.assertEqual(EVENT_READ | EVENT_WRITE, m[c[2]].events)
+        c[3].close()
+        sel.unregister(c[3])
+        self.assertNotIn(3, m)
+        with self.assertRaises(ValueError):
+            sel.unregister(c[3])        # closed and unknown
+        sel.unregister(c[4])
+        with self.assertRaises(KeyError):
+            sel.unregister(c[4])
+        with self.assertRaises(KeyError):
+            m[100]
+        self.assertEqual(3, len(m))
+        sel.close()
+        self.assertIsNone(sel.get_map())
+
+    def test_recycled_fd(self):
+        fds = FdAllocator()
+        c1 = FastSocket(fds=fds)
+        sel = MockSelector([c1], fds=fds)
+        c1.close()
+        c2 = FastSocket(fds=fds)
+        self.assertEqual(10, c2.fileno())
+        sel.register(c2, EVENT_READ)
+        with self.assertRaises(ValueError):
+            sel.select()        # c1 is closed and not registered
+
+    def test_burst(self):
+        fds = FdAllocator()
+        s = ListenSocket(fds=fds)
+        socks = [FastSocket(fds=fds) for _ in range(10)]
+        sel = MockSelector([Burst(), At(5, Burst(maxevents=4, count=6)),
+                            Burst(EVENT_WRITE, filter=lambda k: k.data),
+                            s], fds=fds)
+        sel.register(s, EVENT_READ)
+        for i, c in enumerate(socks):
+            sel.register(c, EVENT_READ | EVENT_WRITE, i % 2)
+        ready = sel.select()
+        self.assertEqual([s] + socks, [k.fileobj for k, _ in ready])
+        self.assertEqual(EVENT_READ, ready[-1][1])
+        self.assertEqual([s] + socks[:3],
+                         [k.fileobj for k, _ in sel.select(10)])
+        self.assertEqual(5, sel.clock.now)
+        sel.unregister(socks[3])
+        self.assertEqual(socks[4:6], [k.fileobj for k, _ in sel.select()])
+        ready = sel.select()
+        self.assertEqual([socks[1]] + socks[5::2],     # socks[3] unregistered
+                         [k.fileobj for k, _ in ready])
+        self.assertEqual({EVENT_WRITE}, {ev for _, ev in ready})
+        self.assertEqual([s], [k.fileobj for k, _ in sel.select()])
+
+    def test_fast_socket(self):
+        c1 = FastSocket([b'foo', b'quit'])
+        c2 = FastSocket([b'foo', b'bar'])
+        s = ListenSocket((c1, c2))
+        sel = MockSelector([s, c1, s, c2, (c1, c2), c1, c2])
+        with sel:
+            sel.register(s, EVENT_READ)
+            s.bind(('localhost', 8888))
+            s.listen(5)
+            while True:
+                for k, ev in sel.select():
+                    sock = k.fileobj
+                    if sock == s:
+                        c, _ = sock.accept()
+                        sel.register(c, EVENT_READ)
+                    else:
+                        data = sock.recv(1024)
+                        if len(data) == 0:
+                            sock.close()
+                            sel.unregister(sock)
+                        else:
+                            sock.send(data)
+        self.assertEqual(b'fooquit', c1.sent)
+        self.assertEqual(b'foobar', c2.sent)
+        self.assertEqual(1, c1.close_count)
+        self.assertEqual(1, len(sel.get_map()))
+
     def test_with_patch(self):
         import socket
         import selectors
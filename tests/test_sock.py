@@ -1,7 +1,13 @@
 #  Copyright (c) 2020 SBA - MIT License
 
+import errno
+import threading
 import unittest
-from mockselector import MockSocket, ListenSocket
+from mockselector import MockSocket, ListenSocket, FastSocket, FdAllocator, \
+    MockSelector, SendWindow, VirtualClock
+from mockselector.policies import MaxBatch
+from mockselector.recording import Ring
+from selectors import EVENT_READ, EVENT_WRITE
 
 
 class TestListen(unittest.TestCase):
@@ -24,6 +30,83 @@ class TestListen(unittest.TestCase):
         c, _ = sock.accept()
         self.assertTrue(c is c2)
 
+    def test_burst(self):
+        socks = [FastSocket() for _ in range(5)]
+        sock = ListenSocket([socks, None, socks[:1]])
+        sock.bind(('localhost', 80))
+        sock.listen(3)
+        sock.setblocking(False)
+        self.assertEqual(EVENT_READ, sock.ready_events())
+        self.assertEqual(socks[:3], [sock.accept()[0] for _ in range(3)])
+        self.assertEqual(2, sock.dropped)
+        self.assertEqual(3, sock.peak)
+        self.assertRaises(BlockingIOError, sock.accept)
+        self.assertIs(socks[0], sock.accept()[0])
+        self.assertRaises(BlockingIOError, sock.accept)
+
+    def test_emfile(self):
+        fds = FdAllocator(limit=12)
+        sock = ListenSocket([[lambda: FastSocket(fds=fds)] * 3], fds=fds)
+        sock.bind(('localhost', 80))
+        sock.listen()
+        c, _ = sock.accept()
+        with self.assertRaises(OSError) as cm:
+            sock.accept()
+        self.assertEqual(errno.EMFILE, cm.exception.errno)
+        self.assertEqual((1, 2), (sock.errors, len(sock.queue)))
+        c.close()
+        sock.accept()
+        self.assertEqual(1, len(sock.queue))
+
+    def test_unscheduled_backlog(self):
+        socks = [FastSocket() for _ in range(5)]
+        sock = ListenSocket(socks)
+        sock.bind(('localhost', 80))
+        sock.listen(2)
+        for c in socks:     # however slow the server, nothing is dropped
+            sock.ready_events()
+            self.assertIs(c, sock.accept()[0])
+        self.assertEqual((0, 1), (sock.dropped, sock.peak))
+
+    def test_scheduled_arrivals(self):
+        clock = VirtualClock()
+        socks = [FastSocket() for _ in range(8)]
+        sock = ListenSocket(socks[:2] + [None] + socks[2:], clock=clock,
+                            interval=1.0)
+        sock.bind(('localhost', 80))
+        clock.advance(10)
+        sock.listen(3)          # the arrivals start at listen
+        self.assertEqual(EVENT_READ, sock.ready_events())
+        self.assertEqual(11.0, sock.ready_at(EVENT_READ))
+        self.assertIs(socks[0], sock.accept()[0])
+        clock.advance(5)        # socks[1] to socks[4] and a gap
+        self.assertEqual(EVENT_READ, sock.ready_events())
+        self.assertEqual((3, 1), (sock.peak, sock.dropped))
+        self.assertEqual(socks[1:4], [sock.accept()[0] for _ in range(3)])
+        self.assertIs(socks[5], sock.accept()[0])   # blocking: waits
+        self.assertEqual(16.0, clock.now)
+        sock.setblocking(False)
+        self.assertRaises(BlockingIOError, sock.accept)
+        self.assertRaises(ValueError, ListenSocket, clock=clock)
+
+    def test_slow_accept_loop(self):
+        clock = VirtualClock()
+        socks = [FastSocket() for _ in range(20)]
+        sock = ListenSocket(socks, clock=clock, interval=0.1)
+        sel = MockSelector(policy=MaxBatch(), clock=clock)
+        sock.bind(('localhost', 80))
+        sock.listen(2)
+        sel.register(sock, EVENT_READ)
+        accepted = []
+        with sel:
+            while True:
+                for _ in sel.select():
+                    accepted.append(sock.accept()[0])
+                    clock.advance(0.3)      # slower than the arrivals
+        self.assertEqual(20, len(accepted) + sock.dropped)
+        self.assertGreater(sock.dropped, 0)
+        self.assertEqual(2, sock.peak)
+
     def test_no_bind(self):
         s = ListenSocket()
         with self.assertRaises(OSError):
@@ -82,6 +165,247 @@ class TestMock(unittest.TestCase):
         self.assertEqual(b'bb', s.recv(256))
         self.assertEqual(b'ccc', s.recv(256))
 
+    def test_no_data_yet(self):
+        s = MockSocket([b'foo', None, b'bar'])
+        self.assertEqual(b'foo', s.recv(256))
+        with self.assertRaises(BlockingIOError):
+            s.recv(256)
+        self.assertEqual(b'bar', s.recv(256))
+        self.assertEqual(b'', s.recv(256))
+
+    def test_remain(self):
+        s = MockSocket([b'abcdef'])
+        self.assertEqual(b'', s.remain)
+        s.recv(2)
+        self.assertEqual(b'cdef', s.remain)
+
+    def test_recv_into(self):
+        s = MockSocket([b'abcdef', b'gh'])
+        buf = bytearray(4)
+        self.assertEqual(4, s.recv_into(buf))
+        self.assertEqual(b'abcd', buf)
+        self.assertEqual(1, s.recv_into(buf, 1))
+        self.assertEqual(b'ebcd', buf)
+        self.assertEqual(1, s.recv_into(buf))
+        self.assertEqual(b'fbcd', buf)
+        self.assertEqual(2, s.recv_into(memoryview(buf)[2:]))
+        self.assertEqual(b'fbgh', buf)
+        self.assertEqual(0, s.recv_into(buf))
+        with self.assertRaises(ValueError):
+            s.recv_into(buf, 5)
+
+    def test_recvmsg(self):
+        s = MockSocket([b'abcdef'])
+        self.assertEqual((b'abcd', [], 0, None), s.recvmsg(4))
+        self.assertEqual((b'ef', [], 0, None), s.recvmsg(4))
+
+    def test_recvmsg_into(self):
+        s = MockSocket([b'abcdef'])
+        b1, b2 = bytearray(2), bytearray(3)
+        self.assertEqual((5, [], 0, None), s.recvmsg_into([b1, b2]))
+        self.assertEqual((b'ab', b'cde'), (b1, b2))
+        self.assertEqual((1, [], 0, None), s.recvmsg_into([b1, b2]))
+        self.assertEqual(b'fb', b1)
+
+    def test_bytes_like(self):
+        s = MockSocket([bytearray(b'abc'), memoryview(b'def')])
+        self.assertEqual(b'ab', s.recv(2))
+        self.assertEqual(b'c', s.recv(2))
+        self.assertEqual(b'def', s.recv(4))
+
+    def test_whole_string_not_copied(self):
+        data = b'x' * 4096
+        s = MockSocket([data])
+        self.assertIs(data, s.recv(8192))
+
+    def test_view_slice(self):
+        s = MockSocket([memoryview(b'abcdef')[2:], memoryview(b'ghij')[:2]])
+        self.assertEqual(b'cdef', s.recv(1024))
+        self.assertEqual(b'gh', s.recv(1024))
+
+
+class TestFast(unittest.TestCase):
+    def test_shut(self):
+        s = FastSocket()
+        self.assertEqual(b'', s.recv(1024))
+
+    def test_small_read(self):
+        # noinspection SpellCheckingInspection
+        s = FastSocket([b'aa', lambda: b'abcdef', b'gh'])
+        self.assertEqual(b'aa', s.recv(3))
+        self.assertEqual(b'abc', s.recv(3))
+        self.assertEqual(b'def', s.recv(3))
+        self.assertEqual(b'gh', s.recv(3))
+        self.assertEqual(b'', s.recv(3))
+
+    def test_recv_into(self):
+        s = FastSocket([b'abcdef'])
+        buf = bytearray(4)
+        self.assertEqual(4, s.recv_into(buf))
+        self.assertEqual(b'abcd', buf)
+        self.assertEqual((b'ef', [], 0, None), s.recvmsg(4))
+
+    def test_send(self):
+        s = FastSocket()
+        self.assertEqual(3, s.send(b'foo'))
+        s.sendall(b'bar')
+        self.assertEqual(b'foobar', s.sent)
+        self.assertEqual(2, s.send_count)
+
+    def test_counters(self):
+        s = FastSocket()
+        s.setblocking(False)
+        s.shutdown(2)
+        s.close()
+        self.assertFalse(s.blocking)
+        self.assertEqual(1, s.setblocking_count)
+        self.assertEqual(1, s.shutdown_count)
+        self.assertEqual(1, s.close_count)
+
+    def test_slots(self):
+        s = FastSocket()
+        with self.assertRaises(AttributeError):
+            s.foo = 1
+
+    def test_fileno(self):
+        self.assertNotEqual(FastSocket().fileno(), MockSocket().fileno())
+
+    def test_listen(self):
+        c1 = FastSocket()
+        sock = ListenSocket([c1])
+        sock.bind(('localhost', 80))
+        sock.listen(5)
+        c, _ = sock.accept()
+        self.assertTrue(c is c1)
+
+
+class TestFd(unittest.TestCase):
+    def test_reuse(self):
+        fds = FdAllocator(3)
+        self.assertEqual([3, 4, 5], [fds.allocate() for _ in range(3)])
+        fds.release(5)
+        fds.release(3)
+        self.assertEqual(1, fds.in_use)
+        self.assertEqual([3, 5, 6], [fds.allocate() for _ in range(3)])
+
+    def test_limit(self):
+        fds = FdAllocator(3, limit=5)
+        fds.allocate()
+        fds.allocate()
+        with self.assertRaises(OSError) as cm:
+            fds.allocate()
+        self.assertEqual(errno.EMFILE, cm.exception.errno)
+        fds.release(3)
+        self.assertEqual(3, fds.allocate())
+
+    def test_sockets(self):
+        fds = FdAllocator()
+        c1 = MockSocket(fds=fds)
+        c2 = FastSocket(fds=fds)
+        s = ListenSocket([c2], fds=fds)
+        self.assertEqual([10, 11, 12], [c1.fileno(), c2.fileno(), s.fileno()])
+        self.assertIs(c2, fds.get(11))
+        for sock in (c1, c2, s):
+            sock.close()
+            sock.close()
+            self.assertEqual(-1, sock.fileno())
+        c1.close.assert_called_with()
+        self.assertEqual(2, c2.close_count)
+        self.assertEqual(0, fds.in_use)
+        self.assertIsNone(fds.get(11))
+        self.assertEqual(10, FastSocket(fds=fds).fileno())
+
+    def test_accept_default(self):
+        fds = FdAllocator(100)
+        s = ListenSocket(fds=fds)
+        s.bind(('localhost', 80))
+        s.listen()
+        c, _ = s.accept()
+        self.assertEqual(101, c.fileno())
+
+    def test_reuse_cycles(self):
+        # open and close cycles reuse the same numbers, whatever their count
+        fds = FdAllocator()
+        used = set()
+        for _ in range(1000):
+            socks = [FastSocket(fds=fds) for _ in range(10)]
+            used.update(c.fileno() for c in socks)
+            for c in socks:
+                c.close()
+        self.assertEqual(set(range(10, 20)), used)
+        self.assertEqual(20, fds._next)
+        self.assertEqual(0, len(fds._objects))
+
+    def test_threads(self):
+        fds = FdAllocator()
+        got = []
+
+        def work():
+            mine = [fds.allocate() for _ in range(1000)]
+            got.extend(mine)
+            for fd in mine[::2]:
+                fds.release(fd)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(2000, fds.in_use)
+        self.assertEqual(4000, len(got))
+
+
+class TestWindow(unittest.TestCase):
+    def test_partial_send(self):
+        c = FastSocket(window=SendWindow(8))
+        self.assertEqual(5, c.send(b'hello'))
+        self.assertEqual(3, c.send(b'world'))
+        self.assertEqual(0, c.send(b''))
+        with self.assertRaises(BlockingIOError):
+            c.send(b'!')
+        self.assertEqual(b'hellowor', c.sent)
+        self.assertEqual(0, c.ready_events() & EVENT_WRITE)
+        c.window.drain(2)
+        self.assertEqual(EVENT_WRITE, c.ready_events() & EVENT_WRITE)
+        self.assertEqual(2, c.send(b'ld!'))
+        self.assertEqual(10, c.window.accepted)
+
+    def test_mock(self):
+        c = MockSocket(window=SendWindow(4))
+        self.assertEqual(4, c.send(b'foobar'))
+        c.send.assert_called_once_with(b'foobar')
+        with self.assertRaises(BlockingIOError):
+            c.sendall(b'baz')
+        self.assertEqual(EVENT_READ, c.ready_events())   # EOF
+        c = MockSocket(window=SendWindow(4), record=Ring(4))
+        self.assertEqual(4, c.send(b'foobar'))
+        self.assertEqual([b'foob'], list(c.recorder.calls))
+
+    def test_rate(self):
+        clock = VirtualClock()
+        w = SendWindow(100, rate=50, clock=clock)
+        self.assertEqual(100, w.send(b'x' * 150))
+        self.assertEqual(0, w.available())
+        self.assertEqual(0.02, w.ready_at())
+        clock.advance(0.5)
+        self.assertEqual(25, w.available())
+        self.assertEqual(1.0, w.ready_at(50))
+        clock.advance(10)
+        self.assertEqual(100, w.available())
+        with self.assertRaises(ValueError):
+            SendWindow(10, rate=1)
+
+    def test_sendall(self):
+        clock = VirtualClock()
+        c = FastSocket(window=SendWindow(100, rate=100, clock=clock))
+        c.sendall(b'x' * 350)
+        self.assertEqual(350, len(c.sent))
+        self.assertAlmostEqual(2.5, clock())
+        c = FastSocket(window=SendWindow(4))
+        with self.assertRaises(BlockingIOError):
+            c.sendall(b'foobar')
+        self.assertEqual(b'foob', c.sent)
+
 
 if __name__ == '__main__':
     unittest.main()
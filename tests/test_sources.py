@@ -0,0 +1,86 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+import hashlib
+import io
+import itertools
+import os
+import os.path
+import tempfile
+import unittest
+from mockselector import FastSocket, MockSocket
+from mockselector.sources import file_source, mmap_source
+
+
+def drain(sock, size=4096):
+    """ Reads a socket up to its end of stream, returning a hash and sizes """
+    h = hashlib.sha256()
+    sizes = set()
+    buffer = bytearray(size)
+    while True:
+        n = sock.recv_into(buffer)
+        if n == 0:
+            return h.hexdigest(), sizes
+        sizes.add(n)
+        h.update(memoryview(buffer)[:n])
+
+
+class SourcesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'body')
+        self.data = os.urandom(100000)
+        with open(self.path, 'wb') as fd:
+            fd.write(self.data)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_file(self):
+        chunks = list(file_source(self.path, 30000))
+        self.assertEqual([30000, 30000, 30000, 10000], [len(c) for c in chunks])
+        self.assertEqual(self.data, b''.join(chunks))
+        self.assertEqual(self.data[10:60010],
+                         b''.join(file_source(self.path, 30000, 10, 60000)))
+        c = FastSocket(file_source(self.path))
+        self.assertEqual((hashlib.sha256(self.data).hexdigest(), {4096, 1696}),
+                         drain(c))
+
+    def test_file_object(self):
+        fd = io.BytesIO(self.data)
+        c = MockSocket(file_source(fd, 1000, length=2500))
+        self.assertEqual(self.data[:1000], c.recv(4096))
+        self.assertEqual(self.data[1000:1100], c.recv(100))
+        self.assertEqual(b'', b''.join(file_source(io.BytesIO())))
+
+    def test_mmap(self):
+        c = FastSocket(mmap_source(self.path))
+        self.assertEqual(hashlib.sha256(self.data).hexdigest(), drain(c)[0])
+        views = list(mmap_source(self.path, 50, 1000, 300))
+        self.assertEqual([300, 300, 300, 100], [len(v) for v in views])
+        self.assertEqual(self.data[50:1050], b''.join(views))
+        self.assertEqual([b'oob'], [bytes(v) for v in
+                                    mmap_source(bytearray(b'foobar'), 1, 3)])
+        empty = os.path.join(self.tmp.name, 'empty')
+        open(empty, 'wb').close()
+        self.assertEqual([], list(mmap_source(empty)))
+
+    def test_mmap_in_memory(self):
+        views = list(mmap_source(io.BytesIO(self.data), 10, 1000, 600))
+        self.assertEqual(self.data[10:1010], b''.join(views))
+        self.assertEqual([600, 400], [len(v) for v in views])
+        self.assertEqual([], list(mmap_source(io.BytesIO())))
+
+    def test_chain(self):
+        def gen():
+            for i in range(3):
+                yield bytes([i]) * 10
+
+        c = FastSocket(itertools.chain([b'POST / HTTP/1.1\r\n\r\n'],
+                                       gen(), file_source(self.path)))
+        self.assertEqual(b'POST / HTTP/1.1\r\n\r\n', c.recv(4096))
+        self.assertEqual(b'\x00' * 10, c.recv(4096))
+        self.assertEqual(b'\x01' * 5, c.recv(5))
+
+
+if __name__ == '__main__':
+    unittest.main()
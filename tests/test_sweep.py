@@ -0,0 +1,138 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+import io
+import json
+import os.path
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from selectors import EVENT_READ
+from mockselector import FastSocket, ListenSocket, MockSelector
+from mockselector import sweep
+from mockselector.policies import RandomPolicy
+
+
+def line_server(s, sel):
+    """ Line echo server with a bug: one buffer shared by all clients """
+    s.bind(('localhost', 8888))
+    s.listen()
+    sel.register(s, EVENT_READ)
+    buffer = b''
+    while True:
+        for key, _ in sel.select():
+            if key.fileobj is s:
+                c, _ = s.accept()
+                sel.register(c, EVENT_READ)
+                continue
+            c = key.fileobj
+            data = c.recv(1024)
+            if not data:
+                sel.unregister(c)
+                c.close()
+                continue
+            buffer += data
+            if buffer.endswith(b'\n'):
+                c.send(buffer)
+                buffer = b''
+
+
+def scenario(seed, clients=2, messages=1):
+    """ Each client sends its lines in two fragments """
+    socks = [FastSocket([part for _ in range(messages)
+                         for part in (b'id', str(i).encode() + b'\n')])
+             for i in range(clients)]
+    sel = MockSelector(policy=RandomPolicy(seed, 2))
+    with sel:
+        line_server(ListenSocket(socks), sel)
+    for i, c in enumerate(socks):
+        assert c.sent == (b'id' + str(i).encode() + b'\n') * messages, \
+            'client {} received {!r}'.format(i, bytes(c.sent))
+
+
+def passing(seed, size=1):
+    if size < 0:
+        raise ValueError
+
+
+def two_bugs(seed, clients=1):
+    if clients >= 3:
+        raise AssertionError('too many clients')
+    if clients == 0:
+        raise ZeroDivisionError('empty run')
+
+
+class SweepTestCase(unittest.TestCase):
+    def test_run_scenario(self):
+        res = sweep.run_scenario(scenario, 0, {'clients': 1, 'messages': 3})
+        self.assertTrue(res['passed'])
+        self.assertIsNone(res['error'])
+        self.assertGreater(res['seconds'], 0)
+        res = sweep.run_scenario(passing, 1, {'size': -1})
+        self.assertEqual('ValueError: ', res['error'])
+
+    def test_shrink(self):
+        seed = next(seed for seed in range(100)
+                    if not sweep.run_scenario(scenario, seed,
+                                              {'clients': 5, 'messages': 4})
+                    ['passed'])
+        res = sweep.shrink(scenario, seed, {'clients': 5, 'messages': 4})
+        self.assertFalse(res['passed'])
+        self.assertIn('AssertionError', res['error'])
+        self.assertLessEqual(res['params']['clients'], 5)
+        self.assertGreaterEqual(res['params']['clients'], 2)
+        self.assertLess(sum(res['params'].values()), 9)
+        self.assertFalse(sweep.run_scenario(scenario, seed,
+                                            res['params'])['passed'])
+
+    def test_shrink_same_failure(self):
+        res = sweep.shrink(two_bugs, 1, {'clients': 8})
+        self.assertEqual({'clients': 3}, res['params'])
+        self.assertEqual('AssertionError: too many clients', res['error'])
+        res = sweep.shrink(two_bugs, 1, {'clients': 0})
+        self.assertEqual({'clients': 0}, res['params'])
+        self.assertEqual('ZeroDivisionError: empty run', res['error'])
+
+    def test_shrink_same_message(self):
+        def failing(seed, size=1):
+            if size >= 2:
+                raise AssertionError('size {}'.format(min(size, 5)))
+        res = sweep.shrink(failing, 1, {'size': 9})
+        self.assertEqual({'size': 2}, res['params'])
+        res = sweep.shrink(failing, 1, {'size': 9}, same_message=True)
+        self.assertEqual({'size': 5}, res['params'])
+        self.assertEqual('AssertionError: size 5', res['error'])
+
+    def test_serial(self):
+        res = sweep.sweep(scenario, range(20), {'clients': 3}, workers=0,
+                          max_shrinks=2)
+        self.assertEqual(20, res['seeds'])
+        self.assertEqual(20, res['passed'] + res['failed'])
+        self.assertGreater(res['failed'], 0)
+        self.assertEqual(2, len(res['shrunk']))
+        self.assertEqual(list(range(20)), [r['seed'] for r in res['results']])
+
+    def test_pool(self):
+        res = sweep.sweep(scenario, range(40), {'clients': 3}, workers=2,
+                          max_shrinks=1)
+        serial = sweep.sweep(scenario, range(40), {'clients': 3}, workers=0,
+                             max_shrinks=1)
+        self.assertEqual([r['passed'] for r in serial['results']],
+                         [r['passed'] for r in res['results']])
+        self.assertEqual(serial['shrunk'][0]['params'],
+                         res['shrunk'][0]['params'])
+        self.assertEqual('tests.test_sweep.scenario', res['scenario'])
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, 'sweep.json')
+            with redirect_stdout(io.StringIO()) as fd:
+                sweep.main(['tests.test_sweep:passing', '--seeds', '5',
+                            '-j', '0', '-p', 'size=2', '-o', out])
+            with open(out) as f:
+                res = json.load(f)
+        self.assertEqual({'size': 2}, res['params'])
+        self.assertIn('5 seeds: 5 passed, 0 failed', fd.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
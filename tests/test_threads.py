@@ -0,0 +1,153 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from selectors import EVENT_READ
+from mockselector import FastSocket, ListenSocket, MockSelector, MockSocket
+from mockselector.bench import echo_server, workload
+from mockselector.policies import MaxBatch
+from mockselector.threads import CountingLock, SerialExecutor, run_threads, \
+    scaling
+
+
+def pool_server(s, sel, executor, expected):
+    """ Selector thread handing the readable sockets to an executor """
+    s.bind(('localhost', 8888))
+    s.listen()
+    sel.register(s, EVENT_READ)
+    closed = []
+
+    def handle(c):
+        data = c.recv(1024)
+        if data:
+            c.send(data.upper())
+            sel.register(c, EVENT_READ)
+        else:
+            c.close()
+            closed.append(c)
+
+    while len(closed) < expected:
+        for key, _ in sel.select(0.01):
+            if key.fileobj is s:
+                c, _ = s.accept()
+                sel.register(c, EVENT_READ)
+            else:
+                sel.unregister(key.fileobj)
+                executor.submit(handle, key.fileobj)
+    return closed
+
+
+class ThreadsTestCase(unittest.TestCase):
+    def test_counting_lock(self):
+        lock = CountingLock()
+        with lock:
+            with lock:
+                pass
+        self.assertEqual((2, 0), (lock.acquisitions, lock.contended))
+        lock.acquire()
+        t = threading.Thread(target=lambda: lock.acquire() and lock.release())
+        t.start()
+        t.join(0.05)
+        lock.release()
+        t.join()
+        self.assertEqual(1, lock.contended)
+        self.assertGreater(lock.stats()['wait_time'], 0)
+        plain = CountingLock(threading.Lock())
+        plain.acquire()
+        self.assertFalse(plain.acquire(False))
+        self.assertEqual(1, plain.acquisitions)
+
+    def test_serial_executor(self):
+        def run():
+            socks = [FastSocket([b'foo', b'bar']) for _ in range(3)]
+            sel = MockSelector(policy=MaxBatch())
+            executor = SerialExecutor(sel)
+            order = []
+            executor.submit(order.append, 'first')
+            pool_server(ListenSocket(socks), sel, executor, 3)
+            return socks, sel, order
+
+        socks, sel, order = run()
+        self.assertEqual(['first'], order)
+        for c in socks:
+            self.assertEqual(b'FOOBAR', c.sent)
+            self.assertEqual(1, c.close_count)
+        self.assertEqual([c.sent for c in socks], [c.sent for c in run()[0]])
+
+    def test_executor_future(self):
+        executor = SerialExecutor()
+        future = executor.submit(divmod, 7, 2)
+        failing = executor.submit(divmod, 7, 0)
+        cancelled = executor.submit(divmod, 1, 1)
+        cancelled.cancel()
+        executor.shutdown()
+        self.assertEqual((3, 1), future.result())
+        self.assertIsInstance(failing.exception(), ZeroDivisionError)
+        self.assertTrue(cancelled.cancelled())
+        with self.assertRaises(RuntimeError):
+            executor.submit(divmod, 1, 1)
+
+    def test_thread_pool(self):
+        socks = [FastSocket([b'foo', None, b'bar']) for _ in range(20)]
+        sel = MockSelector(policy=MaxBatch())
+        with ThreadPoolExecutor(4) as executor:
+            closed = pool_server(ListenSocket(socks), sel, executor, 20)
+        self.assertEqual(set(socks), set(closed))
+        for c in socks:
+            self.assertEqual(b'FOOBAR', c.sent)
+
+    def test_concurrent_accept_recv(self):
+        s = ListenSocket([FastSocket() for _ in range(1000)])
+        s.bind(('localhost', 80))
+        s.listen()
+        s.setblocking(False)
+        c = MockSocket([b'x' * 10000])
+        accepted = []
+        received = []
+
+        def work():
+            while True:
+                try:
+                    accepted.append(s.accept()[0])
+                except BlockingIOError:
+                    break
+            while True:
+                data = c.recv(7)
+                if not data:
+                    break
+                received.append(len(data))
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(1000, len(set(accepted)))
+        self.assertEqual(10000, sum(received))
+
+    def test_run_threads(self):
+        workloads = [workload(3, 8, 2, 2) for _ in range(3)]
+        self.assertGreater(run_threads(echo_server,
+                                       (w[:2] for w in workloads)), 0)
+        for w in workloads:
+            for c in w[2]:
+                self.assertEqual(b'x' * 16, c.sent)
+
+        def bad_server(_s, _sel):
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            run_threads(bad_server, [(ListenSocket(), MockSelector())])
+
+    def test_scaling(self):
+        res = scaling(echo_server, [1, 2], clients=5, messages=2)
+        self.assertEqual([1, 2], [r['threads'] for r in res['results']])
+        r = res['results'][1]
+        self.assertEqual(2 * 5 * 4, r['events'])
+        self.assertGreater(r['lock_acquisitions'], r['events'] / 2)
+        self.assertGreater(r['speedup'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
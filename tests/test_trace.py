@@ -0,0 +1,202 @@
+#  Copyright (c) 2020 SBA - MIT License
+
+import os.path
+import selectors
+import socket
+import tempfile
+import threading
+import unittest
+from selectors import EVENT_READ
+from mockselector import MockSocket
+from mockselector.trace import RecordingSelector, RecordingSocket, Replay, \
+    TraceWriter
+
+
+def echo(s, sel, count=None):
+    """ Echo server loop, ending after count connections are closed """
+    s.listen()
+    sel.register(s, EVENT_READ)
+    closed = 0
+    while closed != count:
+        for key, event in sel.select():
+            if key.fileobj == s:
+                c, _ = s.accept()
+                sel.register(c, EVENT_READ)
+            else:
+                c = key.fileobj
+                data = c.recv(4)
+                if len(data) == 0:
+                    sel.unregister(c)
+                    c.close()
+                    closed += 1
+                else:
+                    c.send(data)
+
+
+class TraceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'test.trace')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_record_replay(self):
+        sel = RecordingSelector(self.path)
+        s = sel.wrap(socket.socket())
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+
+        def client(msg):
+            with socket.create_connection(('127.0.0.1', port)) as c:
+                c.sendall(msg)
+                c.shutdown(socket.SHUT_WR)
+                while c.recv(1024):
+                    pass
+
+        threads = [threading.Thread(target=client, args=(msg,))
+                   for msg in (b'hello world', b'foo')]
+        s.listen()
+        for t in threads:
+            t.start()
+        echo(s, sel, 2)
+        for t in threads:
+            t.join()
+        s.close()
+        sel.close()
+
+        replay = Replay(self.path)
+        self.assertEqual([replay.listen_socket],
+                         list(replay.listen_sockets.values()))
+        sockets = []
+
+        def factory(recvs):
+            sockets.append(MockSocket(recvs))
+            return sockets[-1]
+
+        replay.socket_factory = factory
+        replay.listen_socket.bind(('127.0.0.1', port))
+        with replay.selector:
+            echo(replay.listen_socket, replay.selector)
+        sent = sorted(b''.join(args[0] for args, _ in c.send.call_args_list)
+                      for c in sockets)
+        self.assertEqual([b'foo', b'hello world'], sent)
+        for c in sockets:
+            c.close.assert_called_once_with()
+        self.assertGreater(replay.selector.clock(), 0)
+
+    def test_writer(self):
+        w = TraceWriter(self.path)
+        w.listen(3)
+        w.select(0.5, [(3, EVENT_READ)])
+        w.accept(3, 7)
+        w.select(1.0, [(7, EVENT_READ)])
+        w.recv(7, b'foo')
+        w.select(1.5, [(7, EVENT_READ)])
+        w.recv(7, b'')
+        w.close()
+        replay = Replay(self.path)
+        s = replay.listen_sockets[3]
+        sel = replay.selector
+        sel.register(s, EVENT_READ)
+        s.bind(('localhost', 80))
+        s.listen()
+        self.assertEqual([(sel.get_map()[s], EVENT_READ)], sel.select())
+        c, _ = s.accept()
+        self.assertEqual(0.5, sel.clock())
+        sel.register(c, EVENT_READ)
+        self.assertEqual(1, len(sel.select()))
+        self.assertEqual(b'foo', c.recv(1024))
+        with self.assertRaises(BlockingIOError):
+            c.recv(1024)
+        self.assertEqual(1, len(sel.select()))
+        self.assertEqual(b'', c.recv(1024))
+        self.assertEqual(1.5, sel.clock())
+        with self.assertRaises(sel.EndException):
+            sel.select()
+
+    def test_late_listen(self):
+        w = TraceWriter(self.path)
+        w.select(0.5, [])
+        w.listen(3)
+        w.select(1.0, [(3, EVENT_READ)])
+        w.accept(3, 7)
+        w.select(1.5, [(7, EVENT_READ)])
+        w.recv(7, b'foo')
+        w.close()
+        with Replay(self.path) as replay:
+            sel = replay.selector
+            self.assertEqual({}, replay.listen_sockets)
+            self.assertEqual([], sel.select())
+            s = replay.listen_sockets[3]
+            s.bind(('localhost', 80))
+            s.listen()
+            sel.register(s, EVENT_READ)
+            self.assertEqual([(sel.get_map()[s], EVENT_READ)], sel.select())
+            c, _ = s.accept()
+            sel.register(c, EVENT_READ)
+            self.assertEqual(1, len(sel.select()))
+            self.assertEqual(b'foo', c.recv(1024))
+            del c
+        self.assertTrue(replay._map.closed)
+        with self.assertRaises(ValueError):
+            replay.data[0]
+
+    def test_recvmsg(self):
+        a, b = socket.socketpair()
+        w = TraceWriter(self.path)
+        try:
+            w.listen(3)
+            w.select(0.5, [(3, EVENT_READ)])
+            w.accept(3, a.fileno())
+            w.select(1.0, [(a.fileno(), EVENT_READ)])
+            c = RecordingSocket(a, w)
+            b.sendall(b'hello world')
+            b.close()
+            self.assertEqual(b'hello', c.recvmsg(5)[0])
+            buffers = [bytearray(2), bytearray(10)]
+            self.assertEqual(6, c.recvmsg_into(buffers)[0])
+            self.assertEqual([b' w', b'orld'], [buffers[0], buffers[1][:4]])
+            self.assertEqual(0, c.recvmsg_into([bytearray(2)])[0])
+            fd = a.fileno()
+        finally:
+            a.close()
+            w.close()
+        with Replay(self.path) as replay:
+            s = replay.listen_sockets[3]
+            s.bind(('localhost', 80))
+            s.listen()
+            sel = replay.selector
+            sel.register(s, EVENT_READ)
+            sel.select()
+            c, _ = s.accept()
+            sel.register(c, EVENT_READ)
+            sel.select()
+            self.assertIs(c, replay._sockets[fd])
+            self.assertEqual([b'hello', b' world', b''],
+                             [c.recv(1024) for _ in range(3)])
+
+    def test_bad_file(self):
+        with open(self.path, 'wb') as fd:
+            fd.write(b'not a trace')
+        with self.assertRaises(ValueError):
+            Replay(self.path)
+
+    def test_recording_selector(self):
+        inner = selectors.DefaultSelector()
+        sel = RecordingSelector(self.path, inner)
+        a, b = socket.socketpair()
+        try:
+            key = sel.register(a, EVENT_READ, 'data')
+            self.assertIs(key, sel.get_key(a))
+            sel.modify(a, EVENT_READ, 'other')
+            self.assertEqual([], sel.select(0))
+            sel.unregister(a)
+        finally:
+            a.close()
+            b.close()
+            sel.close()
+
+
+if __name__ == '__main__':
+    unittest.main()